@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from parse_profile import max_rss_mb, format_mb
+
+# Benchmarks of the parser at four levels, all offline:
+# - pages: main() over a dump (a synthetic one from synthetic_dump.py by default, or any real dump or sample with --dump) and the two
+#   readers of iter_pages alone
+# - lines: string_cleaner, sill_splitter and clean_sin_ant over the lines of the same dump
+# - io: writing the compressed output and reading it back with load_compressed_json
+# - startup: cold start of the page parser, a new interpreter imports iterparse and parses the first italian page of the dump
+#   (measured inside the interpreter and for the whole process, in starts/s)
+# Each level runs in a fresh process, so its peak memory is measured on its own. The throughputs can be saved as a baseline
+# and the following runs compared against it: a throughput lower (or a peak memory higher) than the baseline by more than
+# the tolerance is a regression and the script exits with an error.
+
+LEVELS = ["pages", "lines", "io", "startup"]
+STARTUP_CODE = """
+import time
+start = time.perf_counter()
+import sys, json
+from iterparse import WiktionaryPageParser
+title, text = json.load(sys.stdin)
+assert WiktionaryPageParser().parse_page(title, text) != None
+print(time.perf_counter() - start)
+"""
+
+
+def best_time(func, repeat):
+    """Runs func repeat times, returns the best time in seconds and the result of the last run"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best == None else min(best, elapsed)
+    return best, result
+
+def metric(seconds, items, unit):
+    return {"seconds": round(seconds, 6), "items": items, "unit": unit, "per_s": round(items / seconds, 1) if seconds else 0}
+
+def read_lines(dump_path, max_lines):
+    """Returns (title, line) pairs of the non empty lines of the main namespace pages of the dump, up to max_lines"""
+    from iterparse import iter_pages
+    lines = []
+    for title, text in iter_pages(dump_path):
+        if ":" in title or text == None:
+            continue
+        lines.extend((title, line) for line in text.splitlines() if line != "")
+        if len(lines) >= max_lines:
+            break
+    return lines[:max_lines]
+
+def bench_pages(dump_path, repeat):
+    """main() over the whole dump, in pages/s and lines/s"""
+    from iterparse import main, iter_pages
+    n_pages = 0
+    n_lines = 0
+    for _, text in iter_pages(dump_path):
+        n_pages += 1
+        n_lines += text.count("\n") + 1 if text != None else 0
+    seconds, parsed_dict = best_time(lambda: main(dump_path), repeat)
+    results = {
+        "main (pages)": metric(seconds, n_pages, "pages"),
+        "main (lines)": metric(seconds, n_lines, "lines"),
+        "main (lemmas)": metric(seconds, len(parsed_dict), "lemmas"),
+    }
+    for reader in ["etree", "bytes"]: # the readers alone, over the pages of the whole dump (the bytes one skips the other namespaces)
+        seconds, _ = best_time(lambda: sum(1 for _ in iter_pages(dump_path, reader)), repeat)
+        results[f"read pages ({reader})"] = metric(seconds, n_pages, "pages")
+    return results
+
+def bench_lines(dump_path, repeat, max_lines):
+    """The line helpers, in lines/s"""
+    from iterparse import WiktionaryPageParser, sill_splitter, clean_sin_ant
+    parser = WiktionaryPageParser()
+    lines = read_lines(dump_path, max_lines)
+    sill_lines = [line[1:] for _, line in lines if line[0] == ";"] # the syllabation lines, without the ";"
+    sin_ant_lines = [parser.string_cleaner(line, title) for title, line in lines if line[0] == "*"] # clean_sin_ant gets the cleaned lines
+
+    def run_string_cleaner():
+        for title, line in lines:
+            parser.string_cleaner(line, title)
+
+    def run_sill_splitter():
+        for line in sill_lines:
+            sill_splitter(line)
+
+    def run_clean_sin_ant():
+        for line in sin_ant_lines:
+            clean_sin_ant(line)
+
+    results = {}
+    for name, func, n_lines in [("string_cleaner", run_string_cleaner, len(lines)), ("sill_splitter", run_sill_splitter, len(sill_lines)),
+                                ("clean_sin_ant", run_clean_sin_ant, len(sin_ant_lines))]:
+        seconds, _ = best_time(func, repeat)
+        results[name] = metric(seconds, n_lines, "lines")
+    return results
+
+def bench_io(dump_path, repeat):
+    """Writing the compressed json output and loading it back, in lemmas/s"""
+    from iterparse import main
+    from dictionary_io import open_writer
+    from decompress_and_save import load_compressed_json
+    parsed_dict = main(dump_path)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = os.path.join(tmp_dir, "it-dictionary.gz")
+
+        def write_output():
+            with open_writer(out_path, "json") as writer:
+                for lemma, entry in parsed_dict.items():
+                    writer.write(lemma, entry)
+
+        write_seconds, _ = best_time(write_output, repeat)
+        load_seconds, _ = best_time(lambda: load_compressed_json(out_path), repeat)
+    return {
+        "gzip output writing": metric(write_seconds, len(parsed_dict), "lemmas"),
+        "load_compressed_json": metric(load_seconds, len(parsed_dict), "lemmas"),
+    }
+
+def bench_startup(dump_path, repeat):
+    """Cold start to the first parsed page, in starts/s"""
+    from iterparse import iter_pages, WiktionaryPageParser
+    parser = WiktionaryPageParser()
+    page = next((title, text) for title, text in iter_pages(dump_path) if parser.parse_page(title, text) != None)
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    inner_times = []
+
+    def start_parser():
+        result = subprocess.run([sys.executable, "-c", STARTUP_CODE], input=json.dumps(page), capture_output=True, text=True, check=True, cwd=repo_dir)
+        inner_times.append(float(result.stdout))
+
+    process_seconds, _ = best_time(start_parser, repeat)
+    return {
+        "startup (first page)": metric(min(inner_times), 1, "starts"), # import of the parser and first page
+        "startup (process)": metric(process_seconds, 1, "starts"), # including the interpreter start and exit
+    }
+
+def run_level(level, dump_path, repeat, max_lines):
+    """Runs the benchmarks of a level (in a fresh process), returns their metrics with the peak memory of the process"""
+    os.environ["TQDM_DISABLE"] = "1" # no progress bars in the timings
+    if level == "pages":
+        results = bench_pages(dump_path, repeat)
+    elif level == "lines":
+        results = bench_lines(dump_path, repeat, max_lines)
+    elif level == "startup":
+        results = bench_startup(dump_path, repeat)
+    else:
+        results = bench_io(dump_path, repeat)
+    peak_rss = max_rss_mb()
+    for result in results.values():
+        result["peak_rss_mb"] = peak_rss
+    return results
+
+def run_isolated(level, dump_path, repeat, max_lines):
+    """Runs a level in a new interpreter, so the peak memory of a level doesn't include the previous ones"""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_level, level, dump_path, repeat, max_lines).result()
+
+def compare(results, baseline, tolerance):
+    """Returns the list of the regressions with respect to the baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or not baseline[name]["per_s"]:
+            continue
+        base = baseline[name]
+        if result["per_s"] < base["per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: {result['per_s']:.1f} {result['unit']}/s, baseline {base['per_s']:.1f} {base['unit']}/s ({result['per_s'] / base['per_s'] - 1:+.1%})")
+        if result["peak_rss_mb"] != None and base["peak_rss_mb"] != None and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory {result['peak_rss_mb']:.1f} MB, baseline {base['peak_rss_mb']:.1f} MB")
+    return regressions
+
+def print_results(results, baseline=None):
+    print(f"{'benchmark':<24}{'throughput':>22}{'best time':>12}{'peak mem':>12}{'vs baseline':>14}")
+    for name, result in results.items():
+        change = ""
+        if baseline != None and name in baseline and baseline[name]["per_s"]:
+            change = f"{result['per_s'] / baseline[name]['per_s'] - 1:+.1%}"
+        throughput = f"{result['per_s']:,.0f} {result['unit']}/s"
+        print(f"{name:<24}{throughput:>22}{result['seconds']:>11.3f}s{format_mb(result['peak_rss_mb']):>12}{change:>14}")
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Benchmarks of the parser. Without --dump a synthetic dump is generated.")
+    arg_parser.add_argument("--dump", help="dump to benchmark (plain or compressed), i.e. a sample of the real dump")
+    arg_parser.add_argument("--pages", type=int, default=10000, help="size of the synthetic dump (default: 10000)")
+    arg_parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic dump (default: 0)")
+    arg_parser.add_argument("--levels", nargs="+", default=LEVELS, choices=LEVELS, help="levels to run (default: all)")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs of each benchmark, the best one is kept (default: 3)")
+    arg_parser.add_argument("--max-lines", type=int, default=200000, help="lines used by the line level (default: 200000)")
+    arg_parser.add_argument("--baseline", help="compare the results with this baseline and exit with an error on regressions")
+    arg_parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown (and memory increase) with respect to the baseline (default: 0.15)")
+    arg_parser.add_argument("--save-baseline", help="save the results as a baseline")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dump_path = args.dump
+        if dump_path == None:
+            from synthetic_dump import write_dump
+            dump_path = os.path.join(tmp_dir, f"synthetic-{args.pages}.xml")
+            print(f"Generating a synthetic dump with {args.pages} pages...")
+            write_dump(dump_path, args.pages, args.seed)
+        results = {}
+        for level in args.levels:
+            print(f"Running the {level} benchmarks...")
+            results.update(run_isolated(level, dump_path, args.repeat, args.max_lines))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["dump"] != (args.dump or f"synthetic:{args.pages}:{args.seed}"):
+            print(f"Warning: the baseline was measured on {baseline['dump']}")
+        baseline = baseline["results"]
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"dump": args.dump or f"synthetic:{args.pages}:{args.seed}", "python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"Baseline saved at {args.save_baseline}.")
+
+    if baseline != None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit("Regressions with respect to the baseline:\n" + "\n".join(regressions))
+        print("No regressions with respect to the baseline.")
+
+# from command line: python benchmark.py [--pages 100000 | --dump sample.xml.bz2] [--save-baseline baseline.json] [--baseline baseline.json]
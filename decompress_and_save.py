@@ -1,14 +1,48 @@
 import gzip
 import json
-import sys
+import argparse
+from dictionary_io import iter_dictionary, JsonWriter, JsonLinesWriter, load_lemma_list
 
 def load_compressed_json(filename):
+    """Loads the whole compressed dictionary in memory"""
     with gzip.GzipFile(filename, 'rb') as f:
         json_bytes = f.read()
     json_str = json_bytes.decode('utf-8')  # Convert bytes to string
     return json.loads(json_str)
 
-parsed_dict = load_compressed_json(sys.argv[1])
+def keep_lemma(lemma, entry, pos_prefixes=None, with_etim=False, lemma_list=None):
+    """Applies the filters to a single lemma"""
+    if lemma_list != None and lemma not in lemma_list:
+        return False
+    if with_etim and entry["meta"]["etim"] == "":
+        return False
+    if pos_prefixes and not any(pos.startswith(prefix) for pos in entry["meanings"] for prefix in pos_prefixes):
+        return False
+    return True
 
-with open(sys.argv[2], "w") as f:
-    json.dump(parsed_dict, f)
\ No newline at end of file
+def convert(compressed_path, out_path, output_format="json", pos_prefixes=None, with_etim=False, lemma_list=None):
+    """Streams the compressed dictionary into a plain json (identical to json.dump of the whole dictionary when no filter is used) or JSON Lines file,
+    one lemma at a time. Returns the number of lemmas written"""
+    writer_class = JsonWriter if output_format == "json" else JsonLinesWriter
+    with writer_class(out_path, compress=False) as writer:
+        for lemma, entry in iter_dictionary(compressed_path):
+            if keep_lemma(lemma, entry, pos_prefixes, with_etim, lemma_list):
+                writer.write(lemma, entry)
+    return writer.n_lemmas
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Decompresses the dictionary into a json (or JSON Lines) file, optionally keeping only a subset of the lemmas.")
+    arg_parser.add_argument("compressed_dictionary", help="output of iterparse.py (in any of its formats)")
+    arg_parser.add_argument("json_out_path", help="path of the decompressed output")
+    arg_parser.add_argument("--format", default="json", choices=["json", "jsonl"], help="json: a single json object (default), jsonl: JSON Lines")
+    arg_parser.add_argument("--pos", action="append", help="keep only the lemmas with a meaning whose PoS key starts with this prefix (i.e. sost, verb form), can be repeated")
+    arg_parser.add_argument("--with-etim", action="store_true", help="keep only the lemmas with an etymology")
+    arg_parser.add_argument("--lemmas", help="keep only the lemmas in this list, one per line (i.e. vdb_lemmas.txt)")
+    args = arg_parser.parse_args()
+
+    lemma_list = load_lemma_list(args.lemmas) if args.lemmas else None
+    n_lemmas = convert(args.compressed_dictionary, args.json_out_path, args.format, args.pos, args.with_etim, lemma_list)
+    print(f"{n_lemmas} lemmas saved at {args.json_out_path}.")
+
+# from command line: python decompress_and_save.py compressed_dictionary json_out_path [--format jsonl] [--pos sost] [--with-etim] [--lemmas vdb_lemmas.txt]
@@ -0,0 +1,285 @@
+import gzip
+import json
+import os
+import sys
+import glob
+import zlib
+from lemma_record import LemmaRecord, as_entry
+
+# Writers and readers for the parsed dictionary. Four formats are available:
+# - "json": a single compressed json object {lemma: entry, ...}, identical to json.dumps(parsed_dict)
+# - "jsonl": compressed JSON Lines, one {"lemma": ..., "meta": ..., "meanings": ...} object per line
+# - "shards": N compressed JSON Lines files, each lemma goes to the shard given by the crc32 of the lemma
+# - "parquet": flat Parquet tables of lemmas, senses, examples, domain tags and synonyms/antonyms (see parquet_export.py), write only
+# All the writers write each lemma as soon as it's parsed, so the dictionary never needs to be held in memory.
+# Each output is written to a .tmp file next to it, that replaces the previous output only when the writer is closed without errors.
+# The writers accept both lemma dictionaries and the compact LemmaRecord of lemma_record.py, the readers return either of them.
+
+FORMATS = ["json", "jsonl", "shards", "parquet"]
+
+
+def shard_paths(out_path, n_shards):
+    """Paths of the shards of an output (i.e. it-dictionary.gz ---> it-dictionary-00000-of-00008.jsonl.gz, ...)"""
+    stem = os.path.splitext(out_path)[0]
+    return [f"{stem}-{i:05d}-of-{n_shards:05d}.jsonl.gz" for i in range(n_shards)]
+
+def find_shards(out_path):
+    """Finds the shards written for an output path, sorted by shard number"""
+    stem = os.path.splitext(out_path)[0]
+    return sorted(glob.glob(glob.escape(stem) + "-[0-9]*-of-[0-9]*.jsonl.gz"))
+
+def shard_of(lemma, n_shards):
+    """Stable hash partitioning of the lemmas (the builtin hash of str is randomized between runs)"""
+    return zlib.crc32(lemma.encode("utf-8")) % n_shards
+
+def is_jsonl(path):
+    """JSON Lines outputs are recognized by the extension"""
+    return path.endswith(".jsonl.gz") or path.endswith(".jsonl")
+
+
+class AtomicOutput:
+    """Binary output (gzip compressed by default) written to a temporary file next to out_path: commit replaces out_path with it, discard deletes it.
+    A run that crashes or is interrupted leaves the previous output as it was"""
+
+    def __init__(self, out_path, compress=True):
+        self.out_path = out_path
+        self.tmp_path = out_path + ".tmp"
+        self.raw = open(self.tmp_path, "wb")
+        self.f = gzip.GzipFile(out_path, "wb", fileobj=self.raw) if compress else self.raw # the gzip header keeps the name of the output
+
+    def write(self, data):
+        self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+        self.raw.close()
+
+    def commit(self):
+        self.close()
+        os.replace(self.tmp_path, self.out_path)
+
+    def discard(self):
+        self.close()
+        os.remove(self.tmp_path)
+
+
+class JsonWriter:
+    """Streams a single json object. The output is byte-identical to json.dumps of the whole dictionary"""
+
+    def __init__(self, out_path, compress=True):
+        self.f = AtomicOutput(out_path, compress)
+        self.f.write(b"{")
+        self.n_lemmas = 0
+
+    def write(self, lemma, entry):
+        separator = ", " if self.n_lemmas else ""
+        self.f.write(f"{separator}{json.dumps(lemma)}: {json.dumps(as_entry(entry))}".encode('utf-8'))
+        self.n_lemmas += 1
+
+    def close(self):
+        self.f.write(b"}")
+        self.f.commit()
+
+    def discard(self):
+        self.f.discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type == None:
+            self.close()
+        else: # the output is replaced only by a complete dictionary
+            self.discard()
+
+
+class JsonLinesWriter:
+    """Streams compressed JSON Lines. The stream is flushed every flush_every lemmas, so the lemmas already written can be read (from the .tmp file) while the parser is still running"""
+
+    def __init__(self, out_path, flush_every=1000, compress=True):
+        self.f = AtomicOutput(out_path, compress)
+        self.flush_every = flush_every
+        self.n_lemmas = 0
+
+    def write(self, lemma, entry):
+        self.f.write((json.dumps({"lemma": lemma, **as_entry(entry)}) + "\n").encode('utf-8'))
+        self.n_lemmas += 1
+        if self.n_lemmas % self.flush_every == 0:
+            self.f.flush()
+
+    def close(self):
+        self.f.commit()
+
+    def discard(self):
+        self.f.discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type == None:
+            self.close()
+        else:
+            self.discard()
+
+
+class ShardedWriter:
+    """Streams the lemmas into n_shards compressed JSON Lines files partitioned by the hash of the lemma"""
+
+    def __init__(self, out_path, n_shards, flush_every=1000):
+        self.out_path = out_path
+        self.shards = [JsonLinesWriter(path, flush_every) for path in shard_paths(out_path, n_shards)]
+        self.n_lemmas = 0
+
+    def write(self, lemma, entry):
+        self.shards[shard_of(lemma, len(self.shards))].write(lemma, entry)
+        self.n_lemmas += 1
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        paths = set(shard_paths(self.out_path, len(self.shards)))
+        for old_shard in find_shards(self.out_path): # shards of a previous run with a different number of shards, removed once the new ones are in place
+            if old_shard not in paths:
+                os.remove(old_shard)
+
+    def discard(self):
+        for shard in self.shards:
+            shard.discard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type == None:
+            self.close()
+        else:
+            self.discard()
+
+
+def open_writer(out_path, output_format="json", n_shards=8):
+    """Returns the writer for the given output format"""
+    if output_format == "json":
+        return JsonWriter(out_path)
+    if output_format == "jsonl":
+        return JsonLinesWriter(out_path)
+    if output_format == "shards":
+        return ShardedWriter(out_path, n_shards)
+    if output_format == "parquet":
+        from parquet_export import ParquetWriter # pyarrow is only needed for this format
+        return ParquetWriter(out_path)
+    raise ValueError(f"Unknown output format {output_format}, choose one of {FORMATS}")
+
+def open_input(path):
+    """Opens a (possibly gzip compressed) file in text mode"""
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, encoding="utf-8")
+
+def iter_json_object(path, chunk_size=1 << 20):
+    """Yields the (key, value) pairs of a (possibly compressed) file containing a single json object, reading it in chunks.
+    Only one value at a time is decoded, so the memory doesn't depend on the size of the file"""
+    decoder = json.JSONDecoder()
+    with open_input(path) as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def read_more():
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if chunk == "":
+                eof = True
+            buffer = buffer[pos:] + chunk # the consumed part of the buffer is dropped only when a new chunk is read
+            pos = 0
+
+        def skip_white_spaces():
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in " \t\n\r":
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                read_more()
+
+        def expect(token):
+            nonlocal pos
+            skip_white_spaces()
+            if buffer[pos:pos + 1] != token:
+                raise ValueError(f"Expected {token!r} in {path}")
+            pos += 1
+
+        def decode_value():
+            nonlocal pos
+            skip_white_spaces()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    if eof or (end < len(buffer) and buffer[end] not in "0123456789.eE+-"): # a number at the end of the buffer could continue in the next chunk
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                read_more() # the value continues in the next chunk
+
+        expect("{")
+        skip_white_spaces()
+        if buffer[pos:pos + 1] == "}":
+            return
+        while True:
+            key = decode_value()
+            expect(":")
+            yield key, decode_value()
+            skip_white_spaces()
+            if buffer[pos:pos + 1] == ",":
+                pos += 1
+            else:
+                expect("}")
+                return
+
+def iter_jsonl(path):
+    """Yields the (lemma, entry) pairs of a JSON Lines file"""
+    with open_input(path) as f:
+        for line in f:
+            entry = json.loads(line)
+            yield entry.pop("lemma"), entry
+
+def iter_dictionary(path, compact=False):
+    """Yields the (lemma, entry) pairs of a parser output in any of the formats (for the shards pass the path given to the parser).
+    With compact=True the entries are LemmaRecord objects"""
+    if not os.path.exists(path):
+        shards = find_shards(path)
+        if not shards:
+            raise FileNotFoundError(path)
+        pairs = (pair for shard in shards for pair in iter_jsonl(shard))
+    elif is_jsonl(path):
+        pairs = iter_jsonl(path)
+    else:
+        pairs = iter_json_object(path)
+    if not compact:
+        yield from pairs
+        return
+    for lemma, entry in pairs:
+        yield lemma, LemmaRecord.from_entry(entry)
+
+def load_lemma_list(path):
+    """Loads a list of lemmas, one per line (i.e. vdb_lemmas.txt)"""
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def merge_to_json(path, out_path):
+    """Final merge step: converts a JSON Lines output (or its shards) into the single compressed json dictionary. Returns the number of lemmas"""
+    with JsonWriter(out_path) as writer:
+        for lemma, entry in iter_dictionary(path):
+            writer.write(lemma, entry)
+    return writer.n_lemmas
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "merge":
+        sys.exit("usage: python dictionary_io.py merge jsonl_or_sharded_output json_out_path")
+    n_lemmas = merge_to_json(sys.argv[2], sys.argv[3])
+    print(f"{n_lemmas} lemmas merged into {sys.argv[3]}.")
+
+# from command line: python dictionary_io.py merge it-dictionary.jsonl.gz it-dictionary.gz
@@ -0,0 +1,171 @@
+import json
+import mmap
+import struct
+import sys
+import zlib
+from dictionary_io import iter_dictionary
+
+# Random access store for the parsed dictionary. The whole store is a single file:
+#
+#   header | records | keys | index
+#
+# - header: magic, number of lemmas, offset of the keys and offset of the index
+# - records: one zlib compressed json entry per lemma (in the order of the parser output)
+# - keys: the utf-8 encoded lemmas, sorted
+# - index: for each sorted lemma the offset and length of its key and of its record
+#
+# The file is memory mapped and nothing is decoded when the store is opened: lookups are a binary search over the
+# index and only the requested records are decompressed.
+
+MAGIC = b"ITWIKDS1"
+HEADER = struct.Struct("<8sQQQ") # magic, n_lemmas, keys_offset, index_offset
+INDEX_ENTRY = struct.Struct("<QQII") # key_offset, record_offset, key_len, record_len
+
+# preset dictionary for the record compression: most entries are short, so without it zlib can't find much to compress.
+# The most frequent fragments go last, closer to the data
+ZDICT = "".join([
+    "dal latino derivazione di persona singolare plurale dell'indicativo presente del congiuntivo participio passato di ",
+    "[ESEMPIO: ", "(senso figurato) ", "##", "\\n",
+    '"m pl"', '"f pl"', '"f sing"', '"m sing"', '"m inv"',
+    '"verb form_', '"agg form_', '"sost form_', '"verb_', '"agg_', '"avv_', '"sost_', '"unk": ',
+    '{"meta": {"ipa": [], "sill": [], "etim": "", "sin": [], "ant": []}, "meanings": {',
+    '{"morpho": "", "glossa": "',
+]).encode("utf-8")
+
+
+def compress_entry(entry):
+    """Compresses the json of an entry with the preset dictionary"""
+    compressor = zlib.compressobj(9, zdict=ZDICT)
+    return compressor.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8")) + compressor.flush()
+
+def decompress_entry(record):
+    """Decodes a record written by compress_entry"""
+    decompressor = zlib.decompressobj(zdict=ZDICT)
+    return json.loads((decompressor.decompress(record) + decompressor.flush()).decode("utf-8"))
+
+def build_store(dictionary_path, store_path):
+    """Builds the store from a parser output (in any of the formats of dictionary_io). Returns the number of lemmas"""
+    index = []
+    with open(store_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0, 0)) # placeholder, written again at the end
+        for lemma, entry in iter_dictionary(dictionary_path):
+            record = compress_entry(entry)
+            index.append((lemma.encode("utf-8"), f.tell(), len(record)))
+            f.write(record)
+
+        index.sort() # keys are sorted by their utf-8 bytes, so every prefix is a contiguous range
+        keys_offset = f.tell()
+        key_offsets = []
+        for key, _, _ in index:
+            key_offsets.append(f.tell())
+            f.write(key)
+        index_offset = f.tell()
+        for key_offset, (key, record_offset, record_len) in zip(key_offsets, index):
+            f.write(INDEX_ENTRY.pack(key_offset, record_offset, len(key), record_len))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, len(index), keys_offset, index_offset))
+    return len(index)
+
+
+class DictionaryStore:
+    """Read only access to a store built with build_store. Opening it only maps the file, entries are decoded on request"""
+
+    def __init__(self, store_path):
+        self.f = open(store_path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_lemmas, self.keys_offset, self.index_offset = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{store_path} is not a dictionary store")
+
+    def _index_entry(self, i):
+        return INDEX_ENTRY.unpack_from(self.mm, self.index_offset + i * INDEX_ENTRY.size)
+
+    def _key(self, i):
+        key_offset, _, key_len, _ = self._index_entry(i)
+        return self.mm[key_offset:key_offset + key_len]
+
+    def _record(self, i):
+        _, record_offset, _, record_len = self._index_entry(i)
+        return decompress_entry(self.mm[record_offset:record_offset + record_len])
+
+    def _bisect(self, key):
+        """Position of the first key >= key"""
+        lo, hi = 0, self.n_lemmas
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, lemma):
+        key = lemma.encode("utf-8")
+        i = self._bisect(key)
+        if i < self.n_lemmas and self._key(i) == key:
+            return i
+        return -1
+
+    def __len__(self):
+        return self.n_lemmas
+
+    def __contains__(self, lemma):
+        return self._find(lemma) != -1
+
+    def __getitem__(self, lemma):
+        i = self._find(lemma)
+        if i == -1:
+            raise KeyError(lemma)
+        return self._record(i)
+
+    def get(self, lemma, default=None):
+        """Returns the entry of a lemma (decoding only that record) or default"""
+        i = self._find(lemma)
+        if i == -1:
+            return default
+        return self._record(i)
+
+    def _prefix_range(self, prefix):
+        key = prefix.encode("utf-8")
+        i = self._bisect(key)
+        while i < self.n_lemmas and self._key(i).startswith(key):
+            yield i
+            i += 1
+
+    def keys(self, prefix=""):
+        """Yields the lemmas starting with prefix (all of them by default) in utf-8 byte order, without decoding the entries"""
+        for i in self._prefix_range(prefix):
+            yield self._key(i).decode("utf-8")
+
+    def items(self, prefix=""):
+        """Yields the (lemma, entry) pairs of the lemmas starting with prefix"""
+        for i in self._prefix_range(prefix):
+            yield self._key(i).decode("utf-8"), self._record(i)
+
+    def __iter__(self):
+        return self.keys()
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        n_lemmas = build_store(sys.argv[2], sys.argv[3])
+        print(f"Store with {n_lemmas} lemmas saved at {sys.argv[3]}.")
+    elif len(sys.argv) >= 4 and sys.argv[1] == "get":
+        with DictionaryStore(sys.argv[2]) as store:
+            for lemma in sys.argv[3:]:
+                print(json.dumps({lemma: store.get(lemma)}, ensure_ascii=False))
+    else:
+        sys.exit("usage: python dictionary_store.py build parser_output store_path\n       python dictionary_store.py get store_path lemma [lemma ...]")
+
+# from command line: python dictionary_store.py build it-dictionary.gz it-dictionary.store
@@ -0,0 +1,274 @@
+import bz2
+import gzip
+import io
+import lzma
+import mmap
+import os
+import re
+from collections import deque
+from xml.etree.ElementTree import fromstring
+from concurrent.futures import ThreadPoolExecutor
+
+# Opening of the (possibly compressed) xml dumps. Wikimedia ships the dumps compressed, they are read as a stream so
+# they never need to be decompressed to disk.
+#
+# The multistream dumps (pages-articles-multistream.xml.bz2) are a concatenation of independent bz2 streams of 100
+# pages each: ParallelBz2Reader splits the file at the stream headers and decompresses the streams in a pool of threads
+# (bz2 releases the GIL) while the parser consumes them in order. Together with their index (offset:page_id:title lines)
+# read_multistream_index and iter_selected_pages decompress only the streams that contain a given set of pages.
+#
+# scan_pages is a faster alternative to the ElementTree iterparse of iterparse.iter_pages: it doesn't build the elements of the
+# pages (contributor, comment, sha1...), it only finds the <title>, <ns> and <text> spans in the bytes of each page (memory mapped
+# for a plain xml dump, read in chunks from the decompressed stream otherwise) and decodes and unescapes only those spans.
+# The pages of the other namespaces (Template:, Wikizionario:...) are skipped before decoding anything.
+
+BZ2_STREAM_START = re.compile(rb"BZh[1-9]1AY&SY") # stream header followed by the magic of its first block
+SCAN_CHUNK_SIZE = 1 << 20
+MAX_STREAM_SIZE = 16 << 20 # a bigger stream means the file is not a multistream dump
+PAGE_CHUNK_SIZE = 4 << 20
+ENTITY_PATTERN = re.compile(r"&(#[0-9]+|#x[0-9a-fA-F]+|lt|gt|amp|quot|apos);")
+ENTITIES = {"lt": "<", "gt": ">", "amp": "&", "quot": '"', "apos": "'"}
+
+
+def bz2_streams(f):
+    """Yields the (offset, bytes) of the streams of a multistream bz2 file. If a stream is longer than MAX_STREAM_SIZE the split stops and (offset, None) is yielded"""
+    offset = f.tell() # offset of buffer[0] in the file
+    buffer = b""
+    pos = 0
+    eof = False
+    while True:
+        match = BZ2_STREAM_START.search(buffer, pos + 1)
+        if match != None:
+            yield offset + pos, buffer[pos:match.start()]
+            pos = match.start()
+            continue
+        if eof:
+            if pos < len(buffer):
+                yield offset + pos, buffer[pos:]
+            return
+        if len(buffer) - pos > MAX_STREAM_SIZE:
+            yield offset + pos, None
+            return
+        chunk = f.read(SCAN_CHUNK_SIZE)
+        eof = chunk == b""
+        offset += pos
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def decompress_stream(data, trailing_data=False):
+    """Decompresses a single bz2 stream, None if the data is not exactly one complete stream (or doesn't start with one, with trailing_data)"""
+    decompressor = bz2.BZ2Decompressor()
+    try:
+        out = decompressor.decompress(data)
+    except OSError:
+        return None
+    if not decompressor.eof or (decompressor.unused_data and not trailing_data):
+        return None
+    return out
+
+
+class ParallelBz2Reader(io.RawIOBase):
+    """Read only file object decompressing a multistream bz2 file with a pool of threads. The decompressed data comes out in order.
+    If the split at the stream headers goes wrong (the file is not a multistream dump, or a header pattern appears inside the compressed data)
+    the rest of the file is decompressed serially from the last good stream"""
+
+    def __init__(self, path, threads=None):
+        self.raw = open(path, "rb")
+        self.threads = threads or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.chunks = self._decompressed_chunks()
+        self.chunk = memoryview(b"")
+
+    def _decompressed_chunks(self):
+        pending = deque()
+        streams = bz2_streams(self.raw)
+        streams_left = True
+        while True:
+            while streams_left and len(pending) < 2 * self.threads: # keep the pool busy
+                stream = next(streams, None)
+                if stream == None:
+                    streams_left = False
+                elif stream[1] == None: # the serial decompression starts from here
+                    streams_left = False
+                    pending.append((stream[0], None))
+                else:
+                    pending.append((stream[0], self.executor.submit(decompress_stream, stream[1])))
+            if not pending:
+                return
+            offset, future = pending.popleft()
+            out = future.result() if future != None else None
+            if out == None:
+                break
+            yield out
+
+        streams.close()
+        for _, future in pending:
+            if future != None:
+                future.cancel()
+        self.raw.seek(offset)
+        with bz2.BZ2File(self.raw) as serial: # the BZ2File reads the remaining concatenated streams too
+            while True:
+                chunk = serial.read(SCAN_CHUNK_SIZE)
+                if chunk == b"":
+                    return
+                yield chunk
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self.chunk) == 0:
+            chunk = next(self.chunks, None)
+            if chunk == None:
+                return 0
+            self.chunk = memoryview(chunk)
+        n = min(len(b), len(self.chunk))
+        b[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.chunks.close()
+            self.executor.shutdown(cancel_futures=True)
+            self.raw.close()
+        super().close()
+
+
+def open_dump(path, threads=None):
+    """Opens an xml dump as a binary stream, decompressing .bz2, .gz and .xz files on the fly"""
+    if path.endswith(".bz2"):
+        return io.BufferedReader(ParallelBz2Reader(path, threads), buffer_size=SCAN_CHUNK_SIZE)
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_multistream_index(index_path, titles):
+    """Reads a multistream index (possibly bz2 compressed). Returns the offset of the stream of each of the given titles found in the index
+    and, for each of those streams, the offset where it ends (None for the last stream of the dump)"""
+    title_offsets = {}
+    stream_offsets = set()
+    with (bz2.open(index_path, "rt", encoding="utf-8") if index_path.endswith(".bz2") else open(index_path, encoding="utf-8")) as f:
+        for line in f:
+            offset, _, title = line.rstrip("\n").split(":", 2) # titles can contain ":"
+            offset = int(offset)
+            stream_offsets.add(offset)
+            if title in titles:
+                title_offsets[title] = offset
+    stream_offsets = sorted(stream_offsets)
+    next_offset = dict(zip(stream_offsets, stream_offsets[1:] + [None]))
+    stream_ends = {offset: next_offset[offset] for offset in set(title_offsets.values())}
+    return title_offsets, stream_ends
+
+def iter_selected_pages(dump_path, title_offsets, stream_ends, threads=None):
+    """Yields the (title, text) pairs of the pages in title_offsets (see read_multistream_index), in dump order.
+    Only the streams containing them are read and they are decompressed in a pool of threads"""
+    threads = threads or os.cpu_count() or 1
+    with open(dump_path, "rb") as f, ThreadPoolExecutor(threads) as executor:
+        pending = deque()
+        offsets = iter(sorted(stream_ends))
+        while True:
+            while len(pending) < 2 * threads: # keep the pool busy
+                offset = next(offsets, None)
+                if offset == None:
+                    break
+                f.seek(offset)
+                end = stream_ends[offset]
+                if end == None: # the last stream in the index, the end of the dump (</mediawiki>) follows in its own stream
+                    pending.append((offset, executor.submit(decompress_stream, f.read(), True)))
+                else:
+                    pending.append((offset, executor.submit(decompress_stream, f.read(end - offset))))
+            if not pending:
+                return
+            offset, future = pending.popleft()
+            out = future.result()
+            if out == None:
+                raise ValueError(f"The data at offset {offset} of {dump_path} is not a bz2 stream, is the index the one of this dump?")
+            pages = fromstring(b"<pages>" + out + b"</pages>") # the pages of a stream have no root element (and no namespace)
+            for page in pages.iter("page"):
+                title = page.findtext("title")
+                if title_offsets.get(title) == offset:
+                    text = page.find("revision/text")
+                    yield title, text.text if text != None else None
+
+
+def replace_entity(match):
+    name = match.group(1)
+    if name[0] != "#":
+        return ENTITIES[name]
+    return chr(int(name[2:], 16) if name[1] == "x" else int(name[1:]))
+
+def decode_span(buffer, start, end):
+    """The text of an xml element from its raw bytes, as ElementTree would read it: utf-8, line endings normalized to \\n and entities replaced"""
+    text = buffer[start:end]
+    if b"\r" in text: # expat normalizes the line endings of the raw text (not the &#13; ones)
+        text = text.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    text = text.decode("utf-8")
+    if "&" in text:
+        if "&#" in text:
+            return ENTITY_PATTERN.sub(replace_entity, text)
+        # only the named entities (&lt; &gt; &quot; &apos; in the dumps), &amp; last so that "&amp;lt;" becomes "&lt;"
+        text = text.replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"').replace("&apos;", "'").replace("&amp;", "&")
+    return text
+
+def element_span(buffer, tag, start, end):
+    """Finds the first <tag ...>...</tag> between start and end. Returns the span of its text ((x, x) if it's empty or self closing) or None if there is no such element"""
+    pos = start
+    while True:
+        pos = buffer.find(b"<" + tag, pos, end)
+        if pos == -1:
+            return None
+        pos += len(tag) + 1
+        if buffer[pos:pos + 1] in (b">", b" ", b"/", b"\t", b"\n", b"\r"): # not a longer tag name with the same prefix
+            break
+    tag_end = buffer.find(b">", pos, end)
+    if buffer[tag_end - 1:tag_end] == b"/": # <text ... />
+        return tag_end, tag_end
+    text_end = buffer.find(b"</" + tag + b">", tag_end, end)
+    return tag_end + 1, text_end
+
+def pages_in(buffer, start, end, main_namespace_only):
+    """Yields the (title, text) pairs of the complete pages between start and end, returns where the last one ends"""
+    while True:
+        page_start = buffer.find(b"<page>", start, end)
+        if page_start == -1:
+            return start
+        page_end = buffer.find(b"</page>", page_start, end)
+        if page_end == -1:
+            return page_start
+        start = page_end + 7
+        if main_namespace_only:
+            ns = element_span(buffer, b"ns", page_start, page_end)
+            if ns != None and buffer[ns[0]:ns[1]].strip() != b"0":
+                continue
+        title = element_span(buffer, b"title", page_start, page_end)
+        if title == None:
+            continue
+        revision = buffer.find(b"<revision>", page_start, page_end) # like ElementTree, the text of the first revision
+        text = element_span(buffer, b"text", revision, page_end) if revision != -1 else None
+        yield (decode_span(buffer, *title) if title[1] > title[0] else "None", # an empty <title> is None for ElementTree, that iter_pages makes a string
+               decode_span(buffer, *text) if text != None and text[1] > text[0] else None)
+
+def scan_pages(path, main_namespace_only=True):
+    """Yields the (title, text) pairs of the pages of a dump, the same of iterparse.iter_pages (without the pages outside the main namespace,
+    unless main_namespace_only is False). A plain xml dump is memory mapped, a compressed one is read in chunks"""
+    if not path.endswith((".bz2", ".gz", ".xz")):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield from pages_in(buffer, 0, len(buffer), main_namespace_only)
+        return
+
+    with open_dump(path) as dump:
+        buffer = b""
+        while True:
+            chunk = dump.read(PAGE_CHUNK_SIZE)
+            buffer += chunk
+            start = yield from pages_in(buffer, 0, len(buffer), main_namespace_only)
+            if chunk == b"":
+                return
+            buffer = buffer[start:] # the beginning of the next page
@@ -0,0 +1,65 @@
+import time
+import sqlite3
+import threading
+
+# On-disk cache of HTTP responses, used by onli-scraper.py. Each url keeps its last body with the ETag and Last-Modified validators,
+# so the next request can be a conditional one (If-None-Match / If-Modified-Since) and an unchanged page costs a 304 with no body.
+# The cache is a single sqlite file; when it grows over max_size bytes the least recently used responses are evicted.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+class ResponseCache:
+    """Thread safe on-disk cache of the responses keyed by url, with LRU eviction above max_size bytes"""
+
+    def __init__(self, path, max_size=256 << 20):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, url):
+        """Returns the cached (body, etag, last_modified) of an url, None if it's not in the cache"""
+        with self.lock:
+            row = self.db.execute("SELECT body, etag, last_modified FROM responses WHERE url = ?", (url,)).fetchone()
+            if row != None:
+                self.db.execute("UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), url))
+                self.db.commit()
+            return row
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Stores a response, evicting the least recently used ones if the cache is too big"""
+        size = len(body.encode("utf-8"))
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", (url, body, etag, last_modified, size, time.time()))
+            self.size += size - (old[0] if old != None else 0)
+            if self.size > self.max_size:
+                self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        target = self.max_size * 0.9 # some room, so that the next puts don't evict again
+        for url, size in self.db.execute("SELECT url, size FROM responses ORDER BY last_used").fetchall():
+            if self.size <= target:
+                break
+            self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.size -= size
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,276 @@
+import os
+import re
+import sys
+import mmap
+import array
+import struct
+import bisect
+from lemma_record import as_entry
+
+# Inverted indexes over the parsed dictionary, saved in a single file next to it (i.e. it-dictionary.index):
+#
+#   header | lemmas | terms | postings | directory
+#
+# - header: magic, number of lemmas, number of terms and the offsets of the sections
+# - lemmas: the lemmas sorted by their utf-8 bytes (the same order of dictionary_store.py, so the lemma ids are also the positions
+#   of the lemmas in a store), followed by the offsets of each one
+# - terms: the "field:term" keys, sorted
+# - postings: for each key the sorted array of the ids (uint32) of the lemmas having that term
+# - directory: for each key the offset and length of the key and of its postings
+#
+# The fields are:
+# - tag: the domain tags of the glosses (the {{Term|...}} templates, ##...## in the output), lowercased
+# - pos: the PoS keys of the meanings without the number, i.e. "sost_1" ---> "sost", "verb form_2" ---> "verb form"
+# - sin / ant: the terms listed as synonyms / antonyms (the comma separated words of the lines made by clean_sin_ant), lowercased
+#
+# The file is memory mapped: a lookup is a binary search over the directory and only the postings of the term are read (copied in an
+# array, so they stay valid after the index is closed).
+# intersect and union combine the postings, query combines the lookups of a list of "field:term" strings.
+
+MAGIC = b"ITWIKIX1"
+HEADER = struct.Struct("<8sQQQQQQ") # magic, n_lemmas, n_terms, lemmas_offset, terms_offset, postings_offset, directory_offset
+DIRECTORY_ENTRY = struct.Struct("<QQII") # key_offset, postings_offset, key_len, n_postings
+FIELDS = ["tag", "pos", "sin", "ant"]
+
+tag_pattern = re.compile("##(.*?)##")
+white_spaces_pattern = re.compile(r"\s+")
+
+
+def normalize_term(term):
+    """Lowercase, single spaces and no punctuation around"""
+    return white_spaces_pattern.sub(" ", term).strip(" .,;:!?'\"()*").lower()
+
+def pos_of_key(pos_key):
+    """"sost_1" ---> "sost" """
+    return normalize_term(pos_key.rsplit("_", 1)[0])
+
+def sin_ant_terms(line):
+    """The terms of a synonyms/antonyms line made by clean_sin_ant (the words after " ** " are the ones of a qualified line)"""
+    if " ** " in line:
+        line = line.split(" ** ", 1)[1]
+    return [term for term in (normalize_term(tag_pattern.sub("", word)) for word in line.split(",")) if term != ""]
+
+def entry_terms(entry):
+    """The (field, term) pairs of a lemma"""
+    entry = as_entry(entry)
+    terms = set()
+    for pos_key, meaning in entry["meanings"].items():
+        terms.add(("pos", pos_of_key(pos_key)))
+        if "##" in meaning["glossa"]:
+            terms.update(("tag", normalize_term(tag)) for tag in tag_pattern.findall(meaning["glossa"]))
+    for field in ["sin", "ant"]:
+        for line in entry["meta"][field]:
+            terms.update((field, term) for term in sin_ant_terms(line))
+    terms.discard(("tag", ""))
+    terms.discard(("pos", ""))
+    return terms
+
+def term_key(field, term):
+    return f"{field}:{term}".encode("utf-8")
+
+def postings_bytes(lemma_ids):
+    ids = array.array("I", lemma_ids)
+    if sys.byteorder == "big": # the file is little endian
+        ids.byteswap()
+    return ids.tobytes()
+
+
+class IndexBuilder:
+    """Collects the terms of the lemmas (in any order) and saves the index"""
+
+    def __init__(self):
+        self.lemmas = []
+        self.postings = {} # (field, term) ---> positions of the lemmas in self.lemmas
+
+    def add(self, lemma, entry):
+        position = len(self.lemmas)
+        self.lemmas.append(lemma)
+        for field_term in entry_terms(entry):
+            self.postings.setdefault(field_term, []).append(position)
+
+    def save(self, index_path):
+        """Writes the index file, returns the number of terms"""
+        keys = [lemma.encode("utf-8") for lemma in self.lemmas]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        lemma_ids = [0] * len(order) # position in self.lemmas ---> lemma id (position in the sorted lemmas)
+        for lemma_id, position in enumerate(order):
+            lemma_ids[position] = lemma_id
+        terms = sorted((term_key(field, term), positions) for (field, term), positions in self.postings.items())
+
+        with open(index_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, 0, 0, 0, 0, 0, 0)) # placeholder, written again at the end
+            lemmas_offset = f.tell()
+            lemma_offsets = array.array("Q", [0])
+            for position in order:
+                f.write(keys[position])
+                lemma_offsets.append(lemma_offsets[-1] + len(keys[position]))
+            if sys.byteorder == "big":
+                lemma_offsets.byteswap()
+            f.write(lemma_offsets.tobytes())
+
+            terms_offset = f.tell()
+            key_offsets = []
+            for key, _ in terms:
+                key_offsets.append(f.tell())
+                f.write(key)
+
+            postings_offset = f.tell()
+            directory = []
+            for (key, positions), key_offset in zip(terms, key_offsets):
+                directory.append(DIRECTORY_ENTRY.pack(key_offset, f.tell(), len(key), len(positions)))
+                f.write(postings_bytes(sorted(lemma_ids[position] for position in positions)))
+
+            directory_offset = f.tell()
+            f.write(b"".join(directory))
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, len(keys), len(terms), lemmas_offset, terms_offset, postings_offset, directory_offset))
+        return len(terms)
+
+
+def build_index(dictionary_path, index_path):
+    """Builds the index of a parser output (in any of the formats of dictionary_io). Returns the number of lemmas and of terms"""
+    from dictionary_io import iter_dictionary
+    builder = IndexBuilder()
+    for lemma, entry in iter_dictionary(dictionary_path):
+        builder.add(lemma, entry)
+    return len(builder.lemmas), builder.save(index_path)
+
+def index_path_of(out_path):
+    """The index is saved next to the dictionary (i.e. it-dictionary.gz ---> it-dictionary.index)"""
+    return os.path.splitext(out_path)[0] + ".index"
+
+
+def intersect(*postings):
+    """Sorted ids in all the postings. The smallest one is checked against the others: with a set if they have similar
+    sizes, with a binary search of each id if the other one is much longer"""
+    if not postings:
+        return []
+    postings = sorted(postings, key=len)
+    result = list(postings[0])
+    for other in postings[1:]:
+        if not result:
+            break
+        if len(other) < 16 * len(result):
+            result = sorted(set(result).intersection(other))
+            continue
+        kept = []
+        lo = 0
+        for lemma_id in result:
+            lo = bisect.bisect_left(other, lemma_id, lo)
+            if lo == len(other):
+                break
+            if other[lo] == lemma_id:
+                kept.append(lemma_id)
+        result = kept
+    return result
+
+def union(*postings):
+    """Sorted ids in any of the postings"""
+    return sorted(set().union(*postings))
+
+
+class InvertedIndex:
+    """Read only access to an index built with IndexBuilder. Opening it only maps the file"""
+
+    def __init__(self, index_path):
+        self.f = open(index_path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_lemmas, self.n_terms, self.lemmas_offset, self.terms_offset, self.postings_offset, self.directory_offset = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{index_path} is not an inverted index")
+        self.lemma_offsets_offset = self.terms_offset - (self.n_lemmas + 1) * 8
+
+    def _directory_entry(self, i):
+        return DIRECTORY_ENTRY.unpack_from(self.mm, self.directory_offset + i * DIRECTORY_ENTRY.size)
+
+    def _key(self, i):
+        key_offset, _, key_len, _ = self._directory_entry(i)
+        return self.mm[key_offset:key_offset + key_len]
+
+    def _bisect(self, key):
+        """Position of the first key >= key"""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _postings(self, i):
+        """The postings of the i-th key, copied in an array (a view of the map would keep it open, see close)"""
+        _, postings_offset, _, n_postings = self._directory_entry(i)
+        ids = array.array("I")
+        ids.frombytes(self.mm[postings_offset:postings_offset + 4 * n_postings])
+        if sys.byteorder == "big":
+            ids.byteswap()
+        return ids
+
+    def lookup(self, field, term):
+        """Sorted ids of the lemmas having the term in the field (the term is normalized), empty if there is none"""
+        if field not in FIELDS:
+            raise ValueError(f"Unknown field {field}, choose one of {FIELDS}")
+        term = pos_of_key(term) if field == "pos" and term[-1:].isdigit() else normalize_term(term)
+        key = term_key(field, term)
+        i = self._bisect(key)
+        if i < self.n_terms and self._key(i) == key:
+            return self._postings(i)
+        return []
+
+    def terms(self, field):
+        """Yields the (term, number of lemmas) of a field, sorted"""
+        prefix = term_key(field, "")
+        i = self._bisect(prefix)
+        while i < self.n_terms and self._key(i).startswith(prefix):
+            yield self._key(i)[len(prefix):].decode("utf-8"), self._directory_entry(i)[3]
+            i += 1
+
+    def lemma(self, lemma_id):
+        """The lemma with the given id"""
+        start, end = struct.unpack_from("<QQ", self.mm, self.lemma_offsets_offset + lemma_id * 8)
+        return self.mm[self.lemmas_offset + start:self.lemmas_offset + end].decode("utf-8")
+
+    def lemmas(self, lemma_ids):
+        return [self.lemma(lemma_id) for lemma_id in lemma_ids]
+
+    def query(self, all_of=(), any_of=()):
+        """Ids of the lemmas having all the "field:term" of all_of and (if given) at least one of any_of, i.e. query(["tag:medicina", "pos:sost"])"""
+        postings = [self.lookup(*field_term.split(":", 1)) for field_term in all_of]
+        if any_of:
+            postings.append(union(*(self.lookup(*field_term.split(":", 1)) for field_term in any_of)))
+        return intersect(*postings)
+
+    def __len__(self):
+        return self.n_lemmas
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "build":
+        n_lemmas, n_terms = build_index(sys.argv[2], sys.argv[3])
+        print(f"Index of {n_lemmas} lemmas and {n_terms} terms saved at {sys.argv[3]}.")
+    elif len(sys.argv) >= 4 and sys.argv[1] in ("all", "any"):
+        with InvertedIndex(sys.argv[2]) as index:
+            lemma_ids = index.query(all_of=sys.argv[3:]) if sys.argv[1] == "all" else index.query(any_of=sys.argv[3:])
+            for lemma in index.lemmas(lemma_ids):
+                print(lemma)
+    elif len(sys.argv) == 4 and sys.argv[1] == "terms":
+        with InvertedIndex(sys.argv[2]) as index:
+            for term, n_lemmas in index.terms(sys.argv[3]):
+                print(f"{term}\t{n_lemmas}")
+    else:
+        sys.exit("usage: python inverted_index.py build parser_output index_path\n       python inverted_index.py all|any index_path field:term [field:term ...]\n"
+                 "       python inverted_index.py terms index_path field")
+
+# from command line: python inverted_index.py build it-dictionary.gz it-dictionary.index
+# python inverted_index.py all it-dictionary.index tag:medicina pos:sost
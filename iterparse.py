@@ -1,82 +1,124 @@
-from xml.etree.ElementTree import iterparse
 import re
-from tqdm import tqdm
-import pandas as pd
-import json
-import sys
+import csv
+import os
 import gzip
+from functools import lru_cache
+from time import perf_counter, perf_counter_ns
+from parse_profile import ParseProfile, HELPERS, timed_helper, max_rss_mb, format_mb
+from dictionary_io import iter_dictionary, open_writer, AtomicOutput
+from lemma_record import LemmaRecord
+
+# Only the page parser is imported at load time: the modules needed to read a dump (ElementTree, tqdm, dump_reader), the worker pool
+# (multiprocessing), the page index (hashlib) and the command line (argparse, inverted_index) are imported where they are used,
+# so a short-lived job or a spawned worker parsing single pages starts in a few milliseconds (see benchmark.py --levels startup).
+
+
+LINE_CACHE_SIZE = 4096 # default size of the caches of the PoS and morphology lines (0 disables them)
+PAGE_READERS = ["etree", "bytes"] # readers of the xml dump, see iter_pages
+XML_CHUNK_SIZE = 64 * 1024 # bytes fed to the xml parser at a time
+
+LANG_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lang_list.tsv")
+
+class LazyPattern:
+    """A regex compiled on its first use. The methods of the compiled pattern are then kept on the instance, so pattern.search(line) costs the same of a compiled pattern"""
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+
+    def __getattr__(self, name): # only called for the attributes not set yet
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = getattr(re.compile(self.pattern, self.flags), name)
+        setattr(self, name, value)
+        return value
+
+# use the following dictionary as a PoS converter. The following key value pairs handles some tag errors made by users
+POS_CONVERTER_DICT = {
+                      "voce verb": "verb",
+                      "verbm form": "verb form",
+                      "adj": "agg",
+                      "adj form": "agg form"}
+
+AMBITO_DICT = {"{{Est}}": "(per estensione)",
+               "{{Lett}}": "(letteralmente)",
+               "{{Fig}}": "(senso figurato)"}
+
+# tags that usually follows the ones we are interested in. The order is taken from https://it.wiktionary.org/wiki/Wikizionario:Altri_titoli
+other_tags = frozenset(["{{-der-}}", "{{-rel-}}", "{{-var-}}", "{{-alter-}}", "{{-ipon-}}", "{{-iperon-}}", "{{-noconf-}}", "{{-prov-}}", "{{-trad-}}", "{{Trad1}}", "{{Trad2}}", "{{-ref-}}", "==Altri progetti==", "{{interprogetto}}"])
+
+punctuation = '!"$%&\')*+,-./:;<=>?@[\\]^_`{|}~ ' # all punct + white space excluding the "#" special character used for Term tags
+
+# the regex are compiled on their first use (see LazyPattern), so importing the parser costs almost nothing
+lang_pattern = LazyPattern("=={{-?(.+?)-?}}==")
+vedi_pattern = LazyPattern("{{[Vv]d\|(.*?)}}")
+pos_pattern = LazyPattern("{{-(.*?)-\|(?:\|?.*?)*}}")
+morpho_pattern = LazyPattern("{{[Pp][Nn].*?}}(?:\s{1,5})?''\s?((?:m|f|inv).*?)\s?''\s?(?: e ''((?:m|f|inv).*?)\s?'')?")
+# glossa_pattern = re.compile("\[\[(-?\w*?-?(?:\s?\w*?)*)\]\]|\[\[\w*?(?:#\w*)?\|(.*?)\]\]")
+special_redirect_pattern = LazyPattern("\[\[[^\[\]]+?\|(.+?)\]\]") # [[:w:.... ... | .... ....]] [[:s:.... ... | .... ....]]
+redirect_pattern = LazyPattern("\[\[(.*?)\]\]")
+word_redirect_pattern = LazyPattern("\[\[\w.*?\]\]")
+quote_marks_pattern = LazyPattern("'{2,3}")
+ipa_pattern = LazyPattern("{{IPA\|\/(.*?)\/}}")
+sill_pattern = LazyPattern("{{-sill-}}")
+etim_pattern = LazyPattern("{{-etim-}}")
+noetim_pattern = LazyPattern("{{Noetim\|it}}")
+nodef_pattern = LazyPattern("{{Nodef\|it}}")
+etimlink_pattern = LazyPattern("{{Etim-link\|(.*?)}}")
+pron_pattern = LazyPattern("{{-pron-}}")
+file_pattern = LazyPattern("\[\[File:.*?\]\]")
+ref_pattern = LazyPattern("<ref.*?>.*?<\/ref>|<ref.*?\/>")
+general_tag_pattern = LazyPattern("<.+?>(.+?)<\/.+?>")
+closing_tag_pattern = LazyPattern("<.+?/>")
+lang_pointer_pattern = LazyPattern("{{(\w+)}}")
+pn_pattern = LazyPattern("{{Pn}}|{{pn}}")
+ambito_pattern = LazyPattern("({{\w*?}})")
+template_pattern = LazyPattern("{{.*?}}")
+tag_term_pattern = LazyPattern("\{\{[Tt]erm\|([\w ]+)(?:\|it)?(?:[\|\w ])*\}\}")
+white_spaces_pattern = LazyPattern("\s{2,}")
+char_pattern = LazyPattern("[a-zA-Z]")
+template_utili_pattern = LazyPattern("<!-- altri template utili:") # line usually found at the end of a glossa referencing templates
+sin_ant_pattern = LazyPattern("{{-(sin)-}}|{{-(ant)-}}")
+section_pattern = LazyPattern("{{-(pron|sill|etim|sin|ant)-}}")
+parenthesis_pattern = LazyPattern("\(.*?\)")
+hash_pattern = LazyPattern("(##.*?##)")
+pn_template_pattern = LazyPattern("{{[Pp][Nn]") # the start of morpho_pattern
+example_pattern = LazyPattern("^''(.*?)(?:'')?\s*(?:\(.*?\))?\.?$") # extracts examples that, per guidelines, are always in italic (obv this is not always the case)
+
+
+
+def load_lang_dict(lang_list_path=LANG_LIST_PATH):
+    """Loads and converts to dictionary the most frequent iso 639-1 language codes, those are used by the wiktionary usually like {{la}} ---> Latino"""
+    with open(lang_list_path, encoding="utf-8", newline="") as f:
+        return {row["Language Code"]: row["Language Name (Italian)"] for row in csv.DictReader(f, delimiter="\t")}
+
+def get_namespace(root):
+    """Extracts the namespace from the root element of the dump"""
+    return root.tag.split("}")[0] + "}" if root.tag.startswith("{") else ""
+
+def prepend_ns(s, namespace):
+    """This prepend the namespace to each tag. It's useful to retrieve tags with the xml module."""
+    return namespace + s
 
+def peak_rss_mb():
+    """Returns the peak resident set size of the process in MB (None if it can't be measured, i.e. on Windows)."""
+    return max_rss_mb()
 
-
-def prepend_ns(s):
-    """This prepend the namespace to each tag. It's useful to retrieve tags with the xml module."""
-    return NAMESPACE + s 
+def new_entry():
+    """Returns an empty lemma dictionary"""
+    return {"meta": {"ipa": [], "sill": [], "etim": "", "sin": [], "ant": []}, "meanings": {}}
 
 def remove_list_tokens(line):
-    """Recursively removes special tokens (*, #, :) at the beginning of a line in a list."""
-    if line == "":
-        return line
-    if line[0] in ["*", "#", ":"]:
-        return remove_list_tokens(line[1:])
-    else:
-        return line
-    
+    """Removes special tokens (*, #, :) at the beginning of a line in a list."""
+    return line.lstrip("*#:")
+
 def remove_punct_at_start(line):
-    """Recursively removes punctuation at the beginning of a string often resulting from the text cleaning"""
-    if line == "":
-        return line
-    elif line[0] in punctuation:
-        return remove_punct_at_start(line[1:])
-    else:
-        return line
+    """Removes punctuation at the beginning of a string often resulting from the text cleaning (the "#" of the Term tags is kept)"""
+    return line.lstrip(punctuation)
 
 def remove_punct_at_end(line):
-    """Recursively removes punctuation at the end of a string often resulting from the text cleaning"""
-    reverse_line = line[::-1]
-    if line == "":
-        return line
-    elif reverse_line[0] in punctuation:
-        return remove_punct_at_start(reverse_line[1:])[::-1]
-    else:
-        return line
-
-def lang_check(line, lemma):
-    """Check for the italian language tag, usually something like =={{-it-}}==."""
-    line = line.replace(" ", "") # removing white spaces for conformity
-    match =  re.search(lang_pattern, line) 
-    if match != None: # if we found a lang tag
-        lang = match.group(1)
-        if lang == None:
-            lang = match.group(2)
-        if lang == "it":
-            parsed_dict[lemma] = {"meta": {"ipa": [], "sill": [], "etim": "", "sin": [], "ant": []}, "meanings": {}}
-            return lang, True
-        else:
-            return lang, False
-    else:
-        return 0, False
-    
-def pron_check(line):
-    """Checks for the pronouce tag {{pron}}"""
-    match = re.search(pron_pattern, line)
-    if match != None:
-        return True
-
-def get_ipa(line, lemma):
-    """Extracts IPA from a line"""
-    match = re.search(ipa_pattern, line) # ipa
-    if match != None:
-        ipa = match.group(1)
-        parsed_dict[lemma]["meta"]["ipa"].append(ipa)
-        return True
-    else:
-        return False
-    
-def sill_check(line):
-    """Checks for the {{sill}} tag"""
-    match = re.search(sill_pattern, line) # sill
-    if match != None:
-        return True
+    """Removes punctuation at the end of a string often resulting from the text cleaning (the "#" of the Term tags is kept)"""
+    return line.rstrip(punctuation)
 
 def sill_splitter(line):
     """Split the syllables """
@@ -85,7 +127,7 @@ def sill_splitter(line):
     current_sill = ""
     line = line.strip()
     line = line.replace("'", "")
-    line = re.sub(closing_tag_pattern, "", line)
+    line = closing_tag_pattern.sub("", line)
     for i in range(len(line)):
         char = line[i]
         if char == " ":
@@ -102,153 +144,18 @@ def sill_splitter(line):
             sill.append(current_sill)
         else:
             current_sill += char
-    
+
     sill = [x for x in sill if x != ""]
 
     return sill
-    
-def get_sill(line, lemma):
-    """Extracts the syllables from a line"""
-    if line[0] == ";": 
-        line = line[1:]
-        if line == " &lt;!-- inserire dopo le ; la sillabazione indicando l'accento e dividendo con un | come nell'esempio: sol | dà | to --&gt;": # common placeholder for wrong syllabation
-            return False
-        sill_split = sill_splitter(line) # it splits the sill string into ["ca", "sa"] for example, handles multi word lemmas too (usually separated with "-")
-        if sill_split == [""] or len(max(sill_split, key=len, default="")) > 7:
-            return False
-        parsed_dict[lemma]["meta"]["sill"] = sill_split
-        return True
-    else:
-        return False
-
-def unk_pos(lemma):
-    """Adds the "unk" (unknown) PoS tag to a lemma"""
-    pos = "unk" # default option due to inconsistencies in the italian wiktionary tag system
-    parsed_dict[lemma]["meanings"][pos] = {"morpho":"", "glossa":""}
-    return pos
-
-def check_pos(lemma, line, i_pos, current_pos):
-    """Checks for the PoS pattern and retrieves the available PoS"""
-    match = re.search(pos_pattern, line) # pos
-    if match != None:
-        pos = match.group(1)
-        if pos in ["sill", "noconf", "pron", "trad", "alter", "ant", "etim"]:
-            return current_pos
-        if pos in pos_converter_dict:
-            pos = pos_converter_dict[pos]
-        pos = re.sub(white_spaces_pattern, " ", pos)
-        pos = pos.strip() + f"_{i_pos}"
-        if pos != current_pos and pos != f"Varie lingue_{i_pos}":
-            current_pos = pos
-            parsed_dict[lemma]["meanings"][pos] = {"morpho":"", "glossa":""}
-            if "unk" in parsed_dict[lemma]["meanings"]:
-                del parsed_dict[lemma]["meanings"]["unk"] # if we find a PoS we delete the "unk" one
-        return pos
-    else:
-        return current_pos
-    
-def morpho_check(line, lemma, pos):
-    """Checks and extracts morphological metadata (i.e. "f sing" from a typical morpho line: {{Pn|w}} ''f sing'' )"""
-    match = re.search(morpho_pattern, line) # informazioni morfologiche
-    if match != None:
-        morpho = ""
-        for group in match.groups():
-            if group != None:
-                if morpho == "":
-                    morpho += group
-                else:
-                    morpho += " e "+group
-        morpho = remove_punct_at_start(morpho.strip())
-        morpho = re.sub(white_spaces_pattern, "", morpho)
-        parsed_dict[lemma]["meanings"][pos]["morpho"] = morpho
-        return True
-
-def etim_check(line):
-    """Checks for the {{etim}} tag"""
-    match = re.search(etim_pattern, line)
-    if match != None:
-        return True
-
-def noetim_check(line):
-    """Checks for the {{Noetim|it}} tag. Usually used when the etim is missing"""
-    match = re.search(noetim_pattern, line)
-    if match != None:
-        return True
-
-def sin_ant_check(line):
-    match = re.search(sin_ant_pattern, line)
-    tag = ""
-    if match != None:
-        for g in match.groups():
-            if g != None:
-                tag = g
-        return tag
-    else:
-        return False
-
-def nodef_check(line):
-    """Checks for the {{Nodef|it}} tag. Usually used when the glossa is missing"""
-    match = re.search(nodef_pattern, line)
-    if match != None:
-        return True
-
-def template_utili_check(line):
-    """Checks for the "template utili" line"""
-    match = re.search(template_utili_pattern, line)
-    if match != None:
-        return True
-    else:
-        return False
-    
-def other_tags_check(line):
-    """Tags that usually follows the one we are interested in. So if we find them we break. The order is taken from https://it.wiktionary.org/wiki/Wikizionario:Altri_titoli"""
-    other_tag = ["{{-der-}}", "{{-rel-}}", "{{-var-}}", "{{-alter-}}", "{{-ipon-}}", "{{-iperon-}}", "{{-noconf-}}", "{{-prov-}}", "{{-trad-}}", "{{Trad1}}", "{{Trad2}}", "{{-ref-}}", "==Altri progetti==", "{{interprogetto}}"]
-    line = line.strip()
-    for tag in other_tag:
-        if tag == line:
-            return True
-
-def string_cleaner(line, lemma):
-    """Cleans a string from the usual wikimedia tags"""
-    line = remove_list_tokens(line)
-    cleaned_line = re.sub("{{Pn}}|{{pn}}", lemma, line)
-    cleaned_line = re.sub(ref_pattern, "", cleaned_line)
-    cleaned_line = re.sub(file_pattern, "", cleaned_line)
-    cleaned_line = re.sub(vedi_pattern, lambda m: "vedi " + m.group(1).split("|")[1] if "|" in m.group(1) else "vedi " + m.group(1) , cleaned_line) # {{Vd|Afghanistan#Italiano|Afghanistan}} ---> vedi Afghanistan
-    cleaned_line = re.sub(etimlink_pattern, lambda m: f"vedi {m.group(1)}", cleaned_line)
-    cleaned_line = re.sub(lang_pointer_pattern, lambda m: lang_dict.get(m.group(1), m.group(0)), cleaned_line)
-    # cleaned_line = re.sub(special_redirect_pattern, r"\1", cleaned_line)
-    cleaned_line = re.sub(tag_term_pattern, r"##\1##", cleaned_line)
-    cleaned_line = re.sub("({{\w*?}})", lambda m: ambito_dict.get(m.group(0)), cleaned_line)
-    cleaned_line = re.sub("{{.*?}}", "", cleaned_line)
-    cleaned_line = re.sub(special_redirect_pattern, r"\1", cleaned_line)
-    cleaned_line = re.sub(redirect_pattern, r"\1", cleaned_line)
-    cleaned_line = re.sub("\[\[\w.*?\]\]", "", cleaned_line)
-    cleaned_line = re.sub(quote_marks_pattern, "", cleaned_line)
-    cleaned_line = re.sub(general_tag_pattern, r"\1", cleaned_line)
-    cleaned_line = re.sub(white_spaces_pattern, " ", cleaned_line)
-    cleaned_line = remove_punct_at_start(cleaned_line)
-    cleaned_line = cleaned_line.strip()
-    
-    return cleaned_line
-
-def get_etim(line, lemma):
-    """Extracts and parses the etim"""
-    cleaned_line = string_cleaner(line, lemma)
-    if cleaned_line == "":
-        return
-    if parsed_dict[lemma]["meta"]["etim"] == "":
-        parsed_dict[lemma]["meta"]["etim"] += cleaned_line
-    else:
-        parsed_dict[lemma]["meta"]["etim"] += "\n"+cleaned_line
 
 def clean_sin_ant(text):
     """Splits sin and ant"""
     inside_par = False
     clean_text = ""
     par_text = ""
-    hashs = re.findall(hash_pattern, text)
-    text = re.sub(hash_pattern, "", text)
+    hashs = hash_pattern.findall(text)
+    text = hash_pattern.sub("", text)
     for c in text:
         if c == "(":
             inside_par = True
@@ -268,294 +175,738 @@ def clean_sin_ant(text):
     else:
         return clean_text
 
-def get_sin_ant(line, lemma, sin_ant):
-    """Extracts and parses the synonym and antonym informations"""
-    cleaned_line = string_cleaner(line, lemma)
-    cleaned_line = remove_punct_at_end(cleaned_line)
-    cleaned_line = clean_sin_ant(cleaned_line)
-    if cleaned_line == "":
-        return
-    parsed_dict[lemma]["meta"][sin_ant].append(cleaned_line)
-    
-def glossa_check(line, lemma, pos):
-    """Extracts and parses the glossa"""
-    cleaned_line = string_cleaner(line, lemma)
-    if cleaned_line == "":
-        return
-    if parsed_dict[lemma]["meanings"][pos]["glossa"] == "":
-        parsed_dict[lemma]["meanings"][pos]["glossa"] += cleaned_line
-    else:
-        parsed_dict[lemma]["meanings"][pos]["glossa"] += "\n"+cleaned_line
-
-def example_check(line):
-    """Checks if the line is in italic and therefore an example"""
-    # match = re.search(example_pattern, line)
-    match = "''" in line
-    # if match != None:
-    #     return True
-    # else:
-    #     return False
-    return match
-
-def get_examples(line, lemma, pos):
-    """Extracts and parses usage examples from the glossa"""
-    # example = re.search(example_pattern, line).group(1)
-    example = line
-    cleaned_line = string_cleaner(example, lemma)
-    if cleaned_line == "":
-        return
-    
-    parsed_dict[lemma]["meanings"][pos]["glossa"] += f"[ESEMPIO: {cleaned_line}]"
-
 def clean_indent_and_spaces(line):
-    """Removes the first character if it is a special character (*, #, :) or a space and recursively calls itself"""
-    if len(line) > 0 and line[0] in ["*", "#", ":", " "]:
-        return clean_indent_and_spaces(line[1:])
-    else:
-        return line.strip()
+    """Removes the special characters (*, #, :) and the spaces at the beginning of a line, then strips it"""
+    return line.lstrip("*#: ").strip()
+
+
+class WiktionaryPageParser:
+    """Parses the wikitext of a single Wiktionary page into a lemma dictionary.
+    The parser only holds read-only lookup tables, everything related to a page lives inside parse_page, so a single instance can be reused for any number of pages.
+    With compact=True parse_page returns a LemmaRecord (see lemma_record.py) instead of the lemma dictionary."""
+
+    def __init__(self, lang_dict=None, pos_converter_dict=None, ambito_dict=None, compact=False, cache_size=LINE_CACHE_SIZE):
+        self.lang_dict = load_lang_dict() if lang_dict == None else lang_dict
+        self.pos_converter_dict = POS_CONVERTER_DICT if pos_converter_dict == None else pos_converter_dict
+        self.ambito_dict = AMBITO_DICT if ambito_dict == None else ambito_dict
+        self.compact = compact
+        self.cache_size = cache_size
+        self.init_caches()
+
+    def init_caches(self):
+        """Bounded LRU caches of the PoS and of the morphology of the lines. The PoS headers are a few dozen and the morphology lines
+        are the same in many lemmas (i.e. "{{Pn|w}} ''f sing''"). The other lines are almost all unique, so they are not cached"""
+        if self.cache_size > 0:
+            self.cached_line_pos = lru_cache(self.cache_size)(self.line_pos)
+            self.cached_line_morpho = lru_cache(self.cache_size)(self.line_morpho)
+        else:
+            self.cached_line_pos = self.line_pos
+            self.cached_line_morpho = self.line_morpho
+
+    def cache_stats(self):
+        """Hits, misses and size of each cache"""
+        if self.cache_size <= 0:
+            return {}
+        stats = {}
+        for name, cache in [("line_pos", self.cached_line_pos), ("line_morpho", self.cached_line_morpho)]:
+            info = cache.cache_info()
+            calls = info.hits + info.misses
+            stats[name] = {"hits": info.hits, "misses": info.misses, "hit_rate": round(info.hits / calls, 4) if calls else 0.0, "size": info.currsize, "maxsize": info.maxsize}
+        return stats
+
+    def __getstate__(self):
+        # the caches are bound to this instance and can't be pickled, a worker process builds its own
+        state = self.__dict__.copy()
+        for name in ["cached_line_pos", "cached_line_morpho"]:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.init_caches()
+
+    def lang_check(self, line):
+        """Check for the italian language tag, usually something like =={{-it-}}==."""
+        if "{" not in line: # the braces can be separated by spaces, i.e. == { {-it-} } ==
+            return 0, False
+        line = line.replace(" ", "") # removing white spaces for conformity
+        match =  lang_pattern.search(line)
+        if match != None: # if we found a lang tag
+            lang = match.group(1)
+            if lang == None:
+                lang = match.group(2)
+            if lang == "it":
+                return lang, True
+            else:
+                return lang, False
+        else:
+            return 0, False
+
+    def get_ipa(self, line, entry):
+        """Extracts IPA from a line"""
+        match = ipa_pattern.search(line) # ipa
+        if match != None:
+            ipa = match.group(1)
+            entry["meta"]["ipa"].append(ipa)
+            return True
+        else:
+            return False
+
+    def get_sill(self, line, entry):
+        """Extracts the syllables from a line"""
+        if line[0] == ";":
+            line = line[1:]
+            if line == " &lt;!-- inserire dopo le ; la sillabazione indicando l'accento e dividendo con un | come nell'esempio: sol | dà | to --&gt;": # common placeholder for wrong syllabation
+                return False
+            sill_split = sill_splitter(line) # it splits the sill string into ["ca", "sa"] for example, handles multi word lemmas too (usually separated with "-")
+            if sill_split == [""] or len(max(sill_split, key=len, default="")) > 7:
+                return False
+            entry["meta"]["sill"] = sill_split
+            return True
+        else:
+            return False
+
+    def unk_pos(self, entry):
+        """Adds the "unk" (unknown) PoS tag to a lemma"""
+        pos = "unk" # default option due to inconsistencies in the italian wiktionary tag system
+        entry["meanings"][pos] = {"morpho":"", "glossa":""}
+        return pos
+
+    def line_pos(self, line):
+        """The PoS of the PoS tag of a line (i.e. "sost" from {{-sost-|it}}), None if the line has no PoS tag or the tag is a section one"""
+        match = pos_pattern.search(line) # pos
+        if match == None:
+            return None
+        pos = match.group(1)
+        if pos in ["sill", "noconf", "pron", "trad", "alter", "ant", "etim"]:
+            return None
+        if pos in self.pos_converter_dict:
+            pos = self.pos_converter_dict[pos]
+        pos = white_spaces_pattern.sub(" ", pos)
+        return pos.strip()
+
+    def check_pos(self, entry, line, i_pos, current_pos):
+        """Checks for the PoS pattern and retrieves the available PoS"""
+        pos = self.cached_line_pos(line)
+        if pos == None:
+            return current_pos
+        pos = pos + f"_{i_pos}"
+        if pos != current_pos and pos != f"Varie lingue_{i_pos}":
+            current_pos = pos
+            entry["meanings"][pos] = {"morpho":"", "glossa":""}
+            if "unk" in entry["meanings"]:
+                del entry["meanings"]["unk"] # if we find a PoS we delete the "unk" one
+        return pos
+
+    def line_morpho(self, line):
+        """The morphological metadata of a line (i.e. "f sing" from a typical morpho line: {{Pn|w}} ''f sing'' ), None if there is none"""
+        match = morpho_pattern.search(line) # informazioni morfologiche
+        if match == None:
+            return None
+        morpho = ""
+        for group in match.groups():
+            if group != None:
+                if morpho == "":
+                    morpho += group
+                else:
+                    morpho += " e "+group
+        morpho = remove_punct_at_start(morpho.strip())
+        return white_spaces_pattern.sub("", morpho)
+
+    def morpho_check(self, line, entry, pos):
+        """Checks and extracts morphological metadata (i.e. "f sing" from a typical morpho line: {{Pn|w}} ''f sing'' )"""
+        if pn_template_pattern.search(line) == None: # only the lines with {{Pn...}} can match
+            return
+        if line[:2] == "{{": # the morphology lines, the same in many lemmas
+            morpho = self.cached_line_morpho(line)
+        else: # i.e. the examples with {{Pn}}, almost all unique
+            morpho = self.line_morpho(line)
+        if morpho != None:
+            entry["meanings"][pos]["morpho"] = morpho
+            return True
+
+    def section_tags(self, line):
+        """Finds in one search the section tags {{-pron-}}, {{-sill-}}, {{-etim-}}, {{-sin-}} and {{-ant-}} of a line, in order of appearance"""
+        if "{{-" not in line:
+            return []
+        return section_pattern.findall(line)
+
+    def noetim_check(self, line):
+        """Checks for the {{Noetim|it}} tag. Usually used when the etim is missing"""
+        match = noetim_pattern.search(line)
+        if match != None:
+            return True
+
+    def nodef_check(self, line):
+        """Checks for the {{Nodef|it}} tag. Usually used when the glossa is missing"""
+        match = nodef_pattern.search(line)
+        if match != None:
+            return True
+
+    def template_utili_check(self, line):
+        """Checks for the "template utili" line"""
+        return "<!-- altri template utili:" in line
+
+    def other_tags_check(self, line):
+        """Tags that usually follows the one we are interested in. So if we find them we break. The order is taken from https://it.wiktionary.org/wiki/Wikizionario:Altri_titoli"""
+        return line.strip() in other_tags
+
+    def string_cleaner(self, line, lemma):
+        """Cleans a string from the usual wikimedia tags. Each group of substitutions runs only if the string contains the characters it needs, most lines have no markup at all"""
+        line = remove_list_tokens(line)
+        if "\\" in lemma: # the lemma is a replacement template for re.sub, so escapes are kept as they were
+            cleaned_line = pn_pattern.sub(lemma, line)
+        else:
+            cleaned_line = line.replace("{{Pn}}", lemma).replace("{{pn}}", lemma)
+        if "<ref" in cleaned_line:
+            cleaned_line = ref_pattern.sub("", cleaned_line)
+        if "[[File:" in cleaned_line:
+            cleaned_line = file_pattern.sub("", cleaned_line)
+        if "{{" in cleaned_line: # all the following patterns start with "{{"
+            cleaned_line = vedi_pattern.sub(lambda m: "vedi " + m.group(1).split("|")[1] if "|" in m.group(1) else "vedi " + m.group(1) , cleaned_line) # {{Vd|Afghanistan#Italiano|Afghanistan}} ---> vedi Afghanistan
+            cleaned_line = etimlink_pattern.sub(lambda m: f"vedi {m.group(1)}", cleaned_line)
+            cleaned_line = lang_pointer_pattern.sub(lambda m: self.lang_dict.get(m.group(1), m.group(0)), cleaned_line)
+            # cleaned_line = special_redirect_pattern.sub(r"\1", cleaned_line)
+            cleaned_line = tag_term_pattern.sub(r"##\1##", cleaned_line)
+            cleaned_line = ambito_pattern.sub(lambda m: self.ambito_dict.get(m.group(0)), cleaned_line)
+            cleaned_line = template_pattern.sub("", cleaned_line)
+        if "[[" in cleaned_line:
+            cleaned_line = special_redirect_pattern.sub(r"\1", cleaned_line)
+            cleaned_line = redirect_pattern.sub(r"\1", cleaned_line)
+            cleaned_line = word_redirect_pattern.sub("", cleaned_line)
+        if "''" in cleaned_line:
+            cleaned_line = quote_marks_pattern.sub("", cleaned_line)
+        if "</" in cleaned_line:
+            cleaned_line = general_tag_pattern.sub(r"\1", cleaned_line)
+        cleaned_line = white_spaces_pattern.sub(" ", cleaned_line)
+        cleaned_line = remove_punct_at_start(cleaned_line)
+        cleaned_line = cleaned_line.strip()
+
+        return cleaned_line
+
+    def get_etim(self, line, lemma, entry):
+        """Extracts and parses the etim"""
+        cleaned_line = self.string_cleaner(line, lemma)
+        if cleaned_line == "":
+            return
+        if entry["meta"]["etim"] == "":
+            entry["meta"]["etim"] += cleaned_line
+        else:
+            entry["meta"]["etim"] += "\n"+cleaned_line
+
+    def get_sin_ant(self, line, lemma, entry, sin_ant):
+        """Extracts and parses the synonym and antonym informations"""
+        cleaned_line = self.string_cleaner(line, lemma)
+        cleaned_line = remove_punct_at_end(cleaned_line)
+        cleaned_line = clean_sin_ant(cleaned_line)
+        if cleaned_line == "":
+            return
+        entry["meta"][sin_ant].append(cleaned_line)
+
+    def glossa_check(self, line, lemma, entry, pos):
+        """Extracts and parses the glossa"""
+        cleaned_line = self.string_cleaner(line, lemma)
+        if cleaned_line == "":
+            return
+        if entry["meanings"][pos]["glossa"] == "":
+            entry["meanings"][pos]["glossa"] += cleaned_line
+        else:
+            entry["meanings"][pos]["glossa"] += "\n"+cleaned_line
+
+    def example_check(self, line):
+        """Checks if the line is in italic and therefore an example"""
+        # match = re.search(example_pattern, line)
+        match = "''" in line
+        # if match != None:
+        #     return True
+        # else:
+        #     return False
+        return match
+
+    def get_examples(self, line, lemma, entry, pos):
+        """Extracts and parses usage examples from the glossa"""
+        # example = re.search(example_pattern, line).group(1)
+        example = line
+        cleaned_line = self.string_cleaner(example, lemma)
+        if cleaned_line == "":
+            return
+
+        entry["meanings"][pos]["glossa"] += f"[ESEMPIO: {cleaned_line}]"
+
+    def parse_page(self, title, wikitext):
+        """Parses the wikitext of a single page. Returns the italian lemma dictionary or None if the page has no italian entry"""
+        lemma = title
+        glossa = wikitext
+        if ":" in lemma or lemma in ["Pagina principale", "Pagina principale/Categorie"]:
+            return None
+        if glossa == None:
+            return None
+
+        entry = None
+        current_pos = ""
+        lang_found = False
+        sill_flag = False
+        unk_pos_flag = False
+        elenco_flag = False
+        etim_flag = False
+        pron_flag = False
+        sin_ant_flag = False
+        i_pos = 0
+
+        try:
+            lines = glossa.splitlines()
+            for i in range(len(lines)): # iterating one line at a time (this modus operandi is due to the non closing nature of the wiktionary tamplate. Also, glosses are not introduced by templates)
+                line = lines[i]
+
+                if line == "":
+                    sin_ant_flag = False
+                    sill_flag = False
+                    etim_flag = False
+                    pron_flag = False
+                    continue
 
+                if line[0] == "<":
+                    if self.template_utili_check(line): # line usually found at the end of a glossa referencing templates
+                        break # we break it here since a lot of template tags could trigger the boolean flags
 
-def main(xml_dump_path):
-    """main function"""
+                if pron_flag:
+                    pron_flag = self.get_ipa(line, entry)
+                    if pron_flag:
+                        continue # there can be more than one IPA
 
-    context = iterparse(xml_dump_path, events=("start", "end")) # iterparse iterator object
+                if sill_flag:
+                    found = self.get_sill(line, entry)
+                    if found:
+                        sill_flag = False
+                        continue
+                    else:
+                        sill_flag = False
 
-    for event, elem in tqdm(context, desc="Parsing XML", unit=" elements"):
-        if event == "end":
-            if prepend_ns("page") == elem.tag: # if we find a page (usually there is a page for each lemma)
-                lemma = elem.find(prepend_ns("title")) # the title tag contains the lemma string
-                if lemma != None:
-                    lemma = str(lemma.text)
-                    if ":" in lemma or lemma in ["Pagina principale", "Pagina principale/Categorie"]:
+                if etim_flag:
+                    if self.noetim_check(line):
+                        etim_flag = False
                         continue
-                    revision = elem.find(prepend_ns("revision"))
-                    glossa = revision.find(prepend_ns("text")).text # this contains all the metadata for a specific lemma
-                    if glossa == None:
+                    if line[0] == "#" or line[0] == "*" or line[0] == ":":
+                        self.get_etim(line, lemma, entry)
                         continue
-                    current_pos = ""
-                    lang_found = False
-                    sill_flag = False
-                    unk_pos_flag = False
+                    else:
+                        self.get_etim(line, lemma, entry)
+                        etim_flag = False
+                        continue
+
+                if sin_ant_flag != False:
+                    if line[0] in ["*", "#"]:
+                        self.get_sin_ant(line, lemma, entry, sin_ant_flag)
+                        continue
+                    else:
+                        sin_ant_flag = False
+
+                if line.find("{{Vedi|") != -1:
+                    continue
+                if line[0] == "[": # images
+                    continue
+
+                if line[0] == "=":
+                    elenco_flag = False
+                    lang, lang_found = self.lang_check(line)
+                    if lang == 0: # if the line starts with "=" but do not contains lang information (rare)
+                        continue
+                    if lang != "it":
+                        if entry != None: # if lang is different form "it" and we already have the lemma
+                            break # it means we already got an italian tag and we are moving into a different language, so we break
+                        else:
+                            continue # else we keep on iterating hoping to find an italian tag
+                    if lang_found:
+                        entry = new_entry()
+                        continue
+
+                if not lang_found:
+                    continue
+
+                if not unk_pos_flag: # default pos unk
+                    current_pos = self.unk_pos(entry)
+                    unk_pos_flag = True
+
+                if line.strip()[:2] == "{{":
+                    if self.other_tags_check(line):
+                        break
+
+                if "{{-" in line: # PoS tags are always like {{-sost-|it}}
+                    pos = self.check_pos(entry, line, i_pos, current_pos)
+                else:
+                    pos = current_pos
+                if pos == "sill": # there are 4 cases where the sill tag is written like a PoS, this if statement handles this. (Due to bad annotation)
+                    sill_flag = True
+                    continue
+                elif pos == "pron": # only one case (also bad annotation)
+                    pron_flag = True
+                    continue
+                elif pos == "etim":
+                    etim_flag = True
+                    continue
+                if current_pos != pos:
                     elenco_flag = False
                     etim_flag = False
-                    pron_flag = False
-                    sin_ant_flag = False
-                    i_pos = 0
-
-                    try:
-                        lines = glossa.splitlines()
-                        for i in range(len(lines)): # iterating one line at a time (this modus operandi is due to the non closing nature of the wiktionary tamplate. Also, glosses are not introduced by templates)
-                            line = lines[i]
-
-                            if line == "":
-                                sin_ant_flag = False
-                                sill_flag = False
-                                etim_flag = False
-                                pron_flag = False
-                                continue
-
-                            if line[0] == "<":
-                                if template_utili_check(line): # line usually found at the end of a glossa referencing templates
-                                    break # we break it here since a lot of template tags could trigger the boolean flags 
-
-                            if pron_flag:
-                                pron_flag = get_ipa(line, lemma)
-                                if pron_flag:
-                                    continue # there can be more than one IPA
-
-                            if sill_flag:
-                                found = get_sill(line, lemma)
-                                if found:
-                                    sill_flag = False
-                                    continue
-                                else:
-                                    sill_flag = False
-                            
-                            if etim_flag:
-                                if noetim_check(line):
-                                    etim_flag = False
-                                    continue
-                                if line[0] == "#" or line[0] == "*" or line[0] == ":":
-                                    get_etim(line, lemma)
-                                    continue
-                                else:
-                                    get_etim(line, lemma)
-                                    etim_flag = False                              
-                                    continue 
-                            
-                            if sin_ant_flag != False:
-                                if line[0] in ["*", "#"]:
-                                    get_sin_ant(line, lemma, sin_ant_flag)
-                                    continue
-                                else:
-                                    sin_ant_flag = False
-
-                            if line.find("{{Vedi|") != -1:
-                                continue
-                            if line[0] == "[": # images
-                                continue
-
-                            if line[0] == "=":
-                                elenco_flag = False
-                                lang, lang_found = lang_check(line, lemma)
-                                if lang == 0: # if the line starts with "=" but do not contains lang information (rare)
-                                    continue
-                                if lang != "it":
-                                    if parsed_dict.get(lemma, None) != None: # if lang is different form "it" and we already have the lemma in the dict
-                                        break # it means we already got an italian tag and we are moving into a different language, so we break
-                                    else:
-                                        continue # else we keep on iterating hoping to find an italian tag
-                                if lang_found:
-                                    continue
-                            
-                            if not lang_found:
-                                continue
-                            
-                            if not unk_pos_flag: # default pos unk
-                                current_pos = unk_pos(lemma)
-                                unk_pos_flag = True
-                            
-                            if line.strip()[:2] == "{{":
-                                if other_tags_check(line):
-                                    break
-                            
-                            pos = check_pos(lemma, line, i_pos, current_pos)
-                            if pos == "sill": # there are 4 cases where the sill tag is written like a PoS, this if statement handles this. (Due to bad annotation)
-                                sill_flag = True
-                                continue
-                            elif pos == "pron": # only one case (also bad annotation)
-                                pron_flag = True
-                                continue
-                            elif pos == "etim":
-                                etim_flag = True
-                                continue
-                            if current_pos != pos:
-                                elenco_flag = False
-                                etim_flag = False
-                                i_pos +=1
-                                current_pos = pos
-                                continue
-
-                            pron_flag = pron_check(line)
-                            if pron_flag:
-                                elenco_flag = False
-                                continue
-                            
-                            sill_flag = sill_check(line)
-                            if sill_flag:
-                                elenco_flag = False
-                                continue
-                            
-                            if morpho_check(line, lemma, current_pos):
-                                elenco_flag = False
-                                continue
-
-                            etim_flag = etim_check(line)
-                            if etim_flag:
-                                elenco_flag = False
-                                continue
-
-                            sin_ant_flag = sin_ant_check(line)
-                            if sin_ant_flag != False:
-                                elenco_flag = False
-                                continue
-
-                            if line[0] == "#": # it introduces glosses or examples (usually...)
-                                if nodef_check(line):
-                                    continue
-                                if line == "":
-                                    continue
-                                n_indent = sum(1 for c in line[:4] if c in ["#", "*", ":"])
-                                line = clean_indent_and_spaces(line)
-                                if example_check(line) and n_indent > 1: # with this we assume that examples are always in italic
-                                    get_examples(line, lemma, current_pos)
-                                else: # and glossa are not in italic
-                                    glossa_check(line, lemma, current_pos)
-                            #     try:
-                            #         if line[1] in ["*", ":", "#"] and not elenco_flag: # from the guidelines one indentation indicates usage examples, although this is not always the case
-                            #             if example_check(line):
-                            #                 get_examples(line, lemma, current_pos)
-                            #             continue
-                            #     except IndexError:
-                            #         continue # if line[1:] is empty
-                            #     glossa_check(line, lemma, current_pos, elenco_flag)
-                            # else:
-                            #     elenco_flag = False
-                                                
-                    except Exception as e:
-                        print("ERROR at lemma", lemma)
-                        raise e
-
-    del context # deleting the context to free memory
+                    i_pos +=1
+                    current_pos = pos
+                    continue
+
+                section_tags = self.section_tags(line) # the checks below keep their order, so a line with more tags is handled like before
+                has_template = "{{" in line # plain lines (most of the glosses) can't match any of the following tags
+
+                pron_flag = "pron" in section_tags
+                if pron_flag:
+                    elenco_flag = False
+                    continue
+
+                sill_flag = "sill" in section_tags
+                if sill_flag:
+                    elenco_flag = False
+                    continue
+
+                if has_template and self.morpho_check(line, entry, current_pos):
+                    elenco_flag = False
+                    continue
+
+                etim_flag = "etim" in section_tags
+                if etim_flag:
+                    elenco_flag = False
+                    continue
+
+                sin_ant_flag = next((tag for tag in section_tags if tag in ("sin", "ant")), False) # the first of the two tags
+                if sin_ant_flag != False:
+                    elenco_flag = False
+                    continue
+
+                if line[0] == "#": # it introduces glosses or examples (usually...)
+                    if has_template and self.nodef_check(line):
+                        continue
+                    if line == "":
+                        continue
+                    n_indent = sum(1 for c in line[:4] if c in ["#", "*", ":"])
+                    line = clean_indent_and_spaces(line)
+                    if self.example_check(line) and n_indent > 1: # with this we assume that examples are always in italic
+                        self.get_examples(line, lemma, entry, current_pos)
+                    else: # and glossa are not in italic
+                        self.glossa_check(line, lemma, entry, current_pos)
+                #     try:
+                #         if line[1] in ["*", ":", "#"] and not elenco_flag: # from the guidelines one indentation indicates usage examples, although this is not always the case
+                #             if example_check(line):
+                #                 get_examples(line, lemma, current_pos)
+                #             continue
+                #     except IndexError:
+                #         continue # if line[1:] is empty
+                #     glossa_check(line, lemma, current_pos, elenco_flag)
+                # else:
+                #     elenco_flag = False
+
+        except Exception as e:
+            print("ERROR at lemma", lemma)
+            raise e
+
+        if self.compact and entry != None:
+            return LemmaRecord.from_entry(entry)
+        return entry
+
+
+class ProfiledPageParser(WiktionaryPageParser):
+    """WiktionaryPageParser recording page counters and per-helper timings in a ParseProfile (see parse_profile.py). Its output is the same of the plain parser"""
+
+    def __init__(self, profile=None, **kwargs):
+        super().__init__(**kwargs)
+        self.profile = ParseProfile() if profile == None else profile
+        self.recorded_cache_stats = {}
+
+    def record_cache_stats(self):
+        """Adds to the profile the cache hits and misses since the previous call"""
+        for name, stats in self.cache_stats().items():
+            hits, misses = self.recorded_cache_stats.get(name, (0, 0))
+            self.profile.add_cache_counters(name, stats["hits"] - hits, stats["misses"] - misses)
+            self.recorded_cache_stats[name] = (stats["hits"], stats["misses"])
+
+    def parse_page(self, title, wikitext):
+        start = perf_counter_ns()
+        entry = super().parse_page(title, wikitext)
+        self.profile.add_page(title, perf_counter_ns() - start)
+        counters = self.profile.counters
+        counters["pages_seen"] += 1
+        if entry != None:
+            counters["lemmas_emitted"] += 1
+        elif ":" in title or title in ["Pagina principale", "Pagina principale/Categorie"]: # same checks of parse_page
+            counters["skipped_namespace"] += 1
+        elif wikitext == None:
+            counters["skipped_no_text"] += 1
+        else:
+            counters["no_italian_entry"] += 1
+        return entry
+
+for name in HELPERS: # every helper records its calls, parse_page calls them through self so the wrappers are always used
+    setattr(ProfiledPageParser, name, timed_helper(name, getattr(WiktionaryPageParser, name)))
+
+
+def iter_pages(xml_dump_path, reader="etree"):
+    """Streams the dump (plain xml or compressed with bz2, gz or xz) yielding the (title, text) pair of each page. Each page subtree is dropped as soon as it's read to keep the memory flat.
+    With reader="bytes" the pages are scanned as bytes by dump_reader.scan_pages, that yields the same pairs without the pages outside the main namespace (they never have an italian lemma)"""
+
+    from tqdm import tqdm
+    if reader == "bytes":
+        from dump_reader import scan_pages
+        yield from tqdm(scan_pages(xml_dump_path), desc="Parsing XML", unit=" pages")
+        return
+    from collections import deque
+    from xml.etree.ElementTree import XMLParser, TreeBuilder
+    from dump_reader import open_dump
+    with open_dump(xml_dump_path) as dump: # closed (with the threads of a bz2 dump) also when the caller stops early
+        # the pull parsing of iterparse, but the start events are reported only until the start of the root element, that we keep
+        # to get the namespace and to free the pages already parsed (_setevents is the call iterparse makes to choose the events)
+        parser = XMLParser(target=TreeBuilder())
+        events = deque()
+        parser._setevents(events, ("start", "end"))
+        root = None
+        progress = tqdm(desc="Parsing XML", unit=" pages")
+        while True:
+            data = dump.read(XML_CHUNK_SIZE)
+            if data:
+                parser.feed(data)
+            else:
+                parser.close()
+            if root == None and events:
+                root = events[0][1] # the first event is the start of the root element
+                namespace = get_namespace(root)
+                page_tag = prepend_ns("page", namespace)
+                parser._setevents(events, ("end",)) # the start events of this chunk are still in the queue
+            while events:
+                event, elem = events.popleft()
+                if event == "end" and elem.tag == page_tag: # if we find a page (usually there is a page for each lemma)
+                    lemma = elem.find(prepend_ns("title", namespace)) # the title tag contains the lemma string
+                    text = elem.find(prepend_ns("revision", namespace) + "/" + prepend_ns("text", namespace))
+                    lemma = str(lemma.text) if lemma != None else None
+                    glossa = text.text if text != None else None # this contains all the metadata for a specific lemma
+                    root.clear() # we already have the strings we need, so we drop the page subtree to keep the memory flat
+                    progress.update()
+                    if lemma != None:
+                        yield lemma, glossa
+            if not data:
+                progress.close()
+                return
+
+def init_worker(parser):
+    """Worker initializer: each worker process keeps its own copy of the page parser"""
+    global worker_parser
+    worker_parser = parser
+
+def parse_page_batch(pages):
+    """Worker function: parses a batch of (title, text) pairs and returns the (title, entry) pairs in the same order"""
+    return [(lemma, worker_parser.parse_page(lemma, glossa)) for lemma, glossa in pages]
+
+def parse_page_batch_profiled(pages):
+    """Like parse_page_batch for a ProfiledPageParser, also returns the profile of the batch so that the main process can merge it"""
+    parsed = parse_page_batch(pages)
+    worker_parser.record_cache_stats()
+    profile = worker_parser.profile
+    worker_parser.profile = ParseProfile(profile.n_slowest)
+    return parsed, profile
+
+def batched(iterable, batch_size):
+    """Groups an iterable into lists of batch_size elements (the last one can be shorter)"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def parse_pages(pages, parser, workers=1, batch_size=500):
+    """Parses an iterable of (title, text) pairs yielding (title, entry) in the same order, entry is None if the page has no italian lemma.
+    With more than one worker the pages are parsed by a pool of processes while this process reads the dump"""
+    if workers <= 1:
+        for lemma, glossa in pages:
+            yield lemma, parser.parse_page(lemma, glossa)
+        return
+
+    import multiprocessing
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(parser,)) as pool:
+        # imap keeps the order of the batches, so the results come out in the same order of a serial run
+        if isinstance(parser, ProfiledPageParser):
+            for parsed, profile in pool.imap(parse_page_batch_profiled, batched(pages, batch_size)):
+                parser.profile.merge(profile)
+                yield from parsed
+        else:
+            for parsed in pool.imap(parse_page_batch, batched(pages, batch_size)):
+                yield from parsed
+
+def iter_lemmas(pages, workers=1, batch_size=500, parser=None):
+    """Yields the (lemma, entry) pairs of the italian lemmas among the (title, text) pages as soon as they are parsed"""
+
+    if parser == None:
+        parser = WiktionaryPageParser()
+
+    for lemma, entry in parse_pages(pages, parser, workers, batch_size):
+        if entry != None:
+            yield lemma, entry
+
+def main(xml_dump_path, workers=1, batch_size=500, parser=None, reader="etree"):
+    """main function. Returns the dictionary of the italian lemmas"""
+    return dict(iter_lemmas(iter_pages(xml_dump_path, reader), workers, batch_size, parser))
+
+def text_hash(glossa):
+    """Hash of the wikitext of a page, used by the page index to find the pages that changed"""
+    import hashlib
+    return hashlib.blake2b((glossa or "").encode("utf-8"), digest_size=16).hexdigest()
+
+def page_index_path(out_path):
+    """The page index is saved next to the compressed dictionary (i.e. it-dictionary.gz ---> it-dictionary.pages.gz)"""
+    return os.path.splitext(out_path)[0] + ".pages.gz"
+
+def load_page_index(index_path):
+    """Loads the page index (title ---> text hash) written by a previous run, empty if there is none"""
+    page_index = {}
+    if not os.path.exists(index_path):
+        return page_index
+    with gzip.open(index_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            title, page_hash = line.rstrip("\n").split("\t") # titles can't contain tabs or newlines
+            page_index[title] = page_hash
+    return page_index
+
+def save_page_index(page_index, index_path):
+    """Saves the page index as a compressed tsv. Like the dictionary, it's written to a temporary file that replaces the previous index only when complete"""
+    output = AtomicOutput(index_path)
+    try:
+        for title, page_hash in page_index.items():
+            output.write(f"{title}\t{page_hash}\n".encode("utf-8"))
+    except BaseException:
+        output.discard()
+        raise
+    output.commit()
+
+def load_dictionary(path, compact=False):
+    """Loads a parser output (in any format) into a dictionary, with compact=True the entries are LemmaRecord objects"""
+    return dict(iter_dictionary(path, compact))
+
+def save_dictionary(parsed_dict, out_path, output_format="json", n_shards=8):
+    """Saves the dictionary in the given output format. The previous output is replaced only when the new one is complete (see dictionary_io.AtomicOutput)"""
+    with open_writer(out_path, output_format, n_shards) as writer:
+        for lemma, entry in parsed_dict.items():
+            writer.write(lemma, entry)
+
+def update(pages, parsed_dict, page_index, workers=1, batch_size=500, parser=None, full_dump=True):
+    """Incremental parsing: only the pages whose text hash is not in the page index are parsed, the others keep their previous entry.
+    With a full dump the result is rebuilt in the dump order (so it's identical to a complete run) and the pages missing from the dump are dropped,
+    with an adds-changes dump the new and edited pages are patched into parsed_dict. Returns the updated dictionary and the number of parsed pages"""
+
+    if parser == None:
+        parser = WiktionaryPageParser()
+    dump_titles = [] # order of the pages in a full dump
+
+    def changed_pages():
+        for lemma, glossa in pages:
+            if full_dump:
+                dump_titles.append(lemma)
+            page_hash = text_hash(glossa)
+            if page_index.get(lemma) == page_hash: # unchanged page
+                continue
+            page_index[lemma] = page_hash
+            yield lemma, glossa
+
+    parsed = {}
+    for lemma, entry in parse_pages(changed_pages(), parser, workers, batch_size):
+        parsed[lemma] = entry
+
+    if not full_dump:
+        for lemma, entry in parsed.items():
+            if entry != None:
+                parsed_dict[lemma] = entry
+            else:
+                parsed_dict.pop(lemma, None) # the page doesn't have an italian entry anymore
+        return parsed_dict, len(parsed)
+
+    for lemma in set(page_index) - set(dump_titles): # deleted pages
+        del page_index[lemma]
+    updated_dict = {}
+    for lemma in dump_titles:
+        entry = parsed[lemma] if lemma in parsed else parsed_dict.get(lemma)
+        if entry != None:
+            updated_dict[lemma] = entry
+    return updated_dict, len(parsed)
 
 if __name__ == "__main__":
-    
-    # load and convert to dictionary with the most frequent iso 639-1 language codes, those are used by the wiktionary usually like {{la}} ---> Latino
-    df = pd.read_csv("lang_list.tsv", sep="\t")
-    lang_dict = {k:v for k, v in zip(df["Language Code"], df["Language Name (Italian)"])}
-
-    # use the following dictionary as a PoS converter. The following key value pairs handles some tag errors made by users 
-    pos_converter_dict = {
-                          "voce verb": "verb",
-                          "verbm form": "verb form",
-                          "adj": "agg",
-                          "adj form": "agg form"}
-    
-    ambito_dict = {"{{Est}}": "(per estensione)",
-                    "{{Lett}}": "(letteralmente)",
-                    "{{Fig}}": "(senso figurato)"}
-
-    parsed_dict = {} # dictionary
-
-    context = iterparse(sys.argv[1], events=("start", "end"))
-
-    # Get the root element
-    _, root = next(context)
-
-    # Extract the namespace from the root element
-    NAMESPACE = root.tag.split("}")[0] + "}"
-    del context
-
-    punctuation = '!"$%&\')*+,-./:;<=>?@[\\]^_`{|}~ ' # all punct + white space excluding the "#" special character used for Term tags
-
-    # compiling regex
-    lang_pattern = re.compile("=={{-?(.+?)-?}}==")
-    vedi_pattern = re.compile("{{[Vv]d\|(.*?)}}")
-    pos_pattern = re.compile("{{-(.*?)-\|(?:\|?.*?)*}}")
-    morpho_pattern = re.compile("{{[Pp][Nn].*?}}(?:\s{1,5})?''\s?((?:m|f|inv).*?)\s?''\s?(?: e ''((?:m|f|inv).*?)\s?'')?") 
-    # glossa_pattern = re.compile("\[\[(-?\w*?-?(?:\s?\w*?)*)\]\]|\[\[\w*?(?:#\w*)?\|(.*?)\]\]")
-    special_redirect_pattern = re.compile("\[\[[^\[\]]+?\|(.+?)\]\]") # [[:w:.... ... | .... ....]] [[:s:.... ... | .... ....]] 
-    redirect_pattern = re.compile("\[\[(.*?)\]\]")  
-    quote_marks_pattern = re.compile("'{2,3}")
-    ipa_pattern = re.compile("{{IPA\|\/(.*?)\/}}")
-    sill_pattern = re.compile("{{-sill-}}")
-    etim_pattern = re.compile("{{-etim-}}")
-    noetim_pattern = re.compile("{{Noetim\|it}}")
-    nodef_pattern = re.compile("{{Nodef\|it}}")
-    etimlink_pattern = re.compile("{{Etim-link\|(.*?)}}")
-    pron_pattern = re.compile("{{-pron-}}")
-    file_pattern = re.compile("\[\[File:.*?\]\]")
-    ref_pattern = re.compile("<ref.*?>.*?<\/ref>|<ref.*?\/>")
-    general_tag_pattern = re.compile("<.+?>(.+?)<\/.+?>") 
-    closing_tag_pattern = re.compile("<.+?/>")
-    lang_pointer_pattern = re.compile("{{(\w+)}}")
-    tag_term_pattern = re.compile("\{\{[Tt]erm\|([\w ]+)(?:\|it)?(?:[\|\w ])*\}\}")
-    white_spaces_pattern = re.compile("\s{2,}")
-    char_pattern = re.compile("[a-zA-Z]")
-    template_utili_pattern = re.compile("<!-- altri template utili:") # line usually found at the end of a glossa referencing templates
-    sin_ant_pattern = re.compile("{{-(sin)-}}|{{-(ant)-}}")
-    parenthesis_pattern = re.compile("\(.*?\)")
-    hash_pattern = re.compile("(##.*?##)")
-    example_pattern = re.compile("^''(.*?)(?:'')?\s*(?:\(.*?\))?\.?$") # extracts examples that, per guidelines, are always in italic (obv this is not always the case)
-
-    main(sys.argv[1])
-
-    print(f"The xml dump was completely parsed! {len(parsed_dict)} lemmas were extracted.\nSaving the file (this can take some seconds depending on the size of the dictionary)...")
-
-    json_str = json.dumps(parsed_dict).encode('utf-8')  # Convert to string and then to bytes
-    with gzip.GzipFile(sys.argv[2], 'wb') as f:
-        f.write(json_str)
-
-    print(f"Compressed file saved at {sys.argv[2]}.")
-
-# from command line: python iterparse.py xml_dump_path out_path
\ No newline at end of file
+
+    import argparse
+    from dump_reader import read_multistream_index, iter_selected_pages
+    from dictionary_io import FORMATS, find_shards, load_lemma_list
+    from inverted_index import IndexBuilder, index_path_of
+
+    arg_parser = argparse.ArgumentParser(description="Parses the xml dump of the Italian Wiktionary into a compressed json dictionary.")
+    arg_parser.add_argument("xml_dump_path", help="path of the xml dump (.bz2, .gz and .xz dumps are decompressed on the fly)")
+    arg_parser.add_argument("out_path", help="path of the compressed output (with --format shards the shards are saved next to it)")
+    arg_parser.add_argument("--workers", type=int, default=1, help="number of processes parsing the pages (default: 1, no multiprocessing)")
+    arg_parser.add_argument("--batch-size", type=int, default=500, help="number of pages sent to a worker at once (default: 500)")
+    arg_parser.add_argument("--reader", default="etree", choices=PAGE_READERS, help="etree: ElementTree iterparse (default), bytes: scan the pages as bytes, only decoding title and text of the main namespace pages (faster, same lemmas)")
+    arg_parser.add_argument("--incremental", action="store_true", help="parse only the pages that changed since the previous run, using the page index saved next to the output")
+    arg_parser.add_argument("--adds-changes", action="store_true", help="the input is a Wikimedia adds-changes dump with only the new and edited pages (implies --incremental)")
+    arg_parser.add_argument("--format", default="json", choices=FORMATS, help="json: a single json object (default), jsonl: JSON Lines, shards: JSON Lines split by hash into --shards files, parquet: Parquet tables in the out_path directory (requires pyarrow)")
+    arg_parser.add_argument("--shards", type=int, default=8, help="number of shards with --format shards (default: 8)")
+    arg_parser.add_argument("--lemmas", help="parse only the lemmas in this list, one per line (i.e. vdb_lemmas.txt). Requires a multistream dump and its --multistream-index")
+    arg_parser.add_argument("--multistream-index", help="index of the multistream dump (i.e. itwiktionary-latest-pages-articles-multistream-index.txt.bz2)")
+    arg_parser.add_argument("--cache-size", type=int, default=LINE_CACHE_SIZE, help=f"size of the LRU caches of the PoS and of the morphology of the lines (default: {LINE_CACHE_SIZE}, 0 disables them)")
+    arg_parser.add_argument("--index", action="store_true", help="save the inverted indexes of domain tags, PoS and synonyms/antonyms next to the output (i.e. it-dictionary.index)")
+    arg_parser.add_argument("--profile", metavar="REPORT_PATH", help="save a json report with page counters, per-stage and per-helper timings, peak memory and the slowest pages")
+    arg_parser.add_argument("--profile-slowest", type=int, default=20, help="number of slowest pages in the --profile report (default: 20)")
+    args = arg_parser.parse_args()
+
+    start_time = perf_counter()
+    incremental = args.incremental or args.adds_changes
+    if incremental and args.format == "parquet":
+        arg_parser.error("the parquet tables can't be read back, use --incremental with another format and export it with parquet_export.py")
+    # the incremental runs hold the whole dictionary in memory, so the lemmas are kept as compact records
+    parser_options = {"compact": incremental, "cache_size": args.cache_size}
+    parser = ProfiledPageParser(ParseProfile(args.profile_slowest), **parser_options) if args.profile else WiktionaryPageParser(**parser_options)
+
+    if args.lemmas:
+        if not args.multistream_index:
+            arg_parser.error("--lemmas requires --multistream-index")
+        lemma_list = load_lemma_list(args.lemmas)
+        title_offsets, stream_ends = read_multistream_index(args.multistream_index, lemma_list)
+        print(f"{len(title_offsets)} of the {len(lemma_list)} lemmas are in the index, {len(stream_ends)} streams of the dump will be decompressed.")
+        pages = iter_selected_pages(args.xml_dump_path, title_offsets, stream_ends)
+    else:
+        pages = iter_pages(args.xml_dump_path, args.reader)
+    if args.profile:
+        pages = parser.profile.timed_pages(pages)
+    index_builder = IndexBuilder() if args.index else None
+
+    if incremental:
+        index_path = page_index_path(args.out_path)
+        output_exists = os.path.exists(args.out_path) or find_shards(args.out_path)
+        page_index = load_page_index(index_path) if output_exists else {} # without the previous output every page is parsed again
+        parsed_dict = load_dictionary(args.out_path, compact=True) if page_index else {}
+        parsed_dict, n_parsed = update(pages, parsed_dict, page_index, args.workers, args.batch_size, parser, full_dump=not (args.adds_changes or args.lemmas))
+        print(f"The xml dump was completely parsed! {n_parsed} new or edited pages were parsed, the dictionary has {len(parsed_dict)} lemmas (peak memory usage: {format_mb(peak_rss_mb())}).")
+        print("Saving the file (this can take some seconds depending on the size of the dictionary)...")
+        save_dictionary(parsed_dict, args.out_path, args.format, args.shards)
+        if index_builder != None:
+            for lemma, entry in parsed_dict.items():
+                index_builder.add(lemma, entry)
+        save_page_index(page_index, index_path) # saved after the dictionary, so an interrupted run never leaves an index newer than the output
+    else:
+        # each lemma is written as soon as it's parsed, the dictionary is never held in memory
+        with open_writer(args.out_path, args.format, args.shards) as writer:
+            for lemma, entry in iter_lemmas(pages, args.workers, args.batch_size, parser):
+                writer.write(lemma, entry)
+                if index_builder != None:
+                    index_builder.add(lemma, entry)
+        print(f"The xml dump was completely parsed! {writer.n_lemmas} lemmas were extracted.")
+
+    print(f"Compressed file saved at {args.out_path} (peak memory usage: {format_mb(peak_rss_mb())}).")
+    if index_builder != None:
+        n_terms = index_builder.save(index_path_of(args.out_path))
+        print(f"Inverted index of {n_terms} terms saved at {index_path_of(args.out_path)}.")
+    if args.profile:
+        parser.record_cache_stats()
+        parser.profile.save(args.profile, perf_counter() - start_time, args.workers)
+        print(f"Profile report saved at {args.profile}.")
+
+# from command line: python iterparse.py xml_dump_path out_path [--workers N] [--reader bytes] [--incremental | --adds-changes] [--format json|jsonl|shards|parquet] [--index] [--cache-size N] [--lemmas list --multistream-index index] [--profile report.json]
@@ -0,0 +1,155 @@
+import re
+import csv
+import json
+import argparse
+import unicodedata
+from collections import Counter
+from dictionary_io import iter_dictionary
+from inverted_index import normalize_term, pos_of_key
+
+# Coverage of lemma lists (vdb_lemmas.txt, ONLI-NEO.csv, corpus frequency lists...) in the parsed dictionary.
+# The dictionary is streamed once and its lemmas are indexed by a normalized key: lowercase, without accents and with the same
+# separator for the words of a multiword lemma ("Abito-Camicia", "abito camicia" and "abito  camicia" have the same key).
+# Each list is then joined with set operations: first on the exact lemmas, then on the normalized keys of the remaining ones.
+# For each list the report gives the coverage (exact and normalized matches), the coverage of each PoS, the missing lemmas and,
+# when the list has a PoS column, the lemmas found in the dictionary only with other PoS. The PoS of the dictionary are the ones of the
+# pos field of inverted_index.py (pos_of_key) and the PoS of the lists are normalized in the same way.
+#
+# Lists are read by extension: .csv and .tsv files need a header with a "lemma" column and can have a "pos" one (like ONLI-NEO.csv),
+# the other files have one lemma per line (like vdb_lemmas.txt, only the first tab separated column is read, so a frequency list
+# "lemma\tfrequency" can be given as it is).
+
+separators_pattern = re.compile(r"[\s\-‐‑–—_]+")
+apostrophes_pattern = re.compile("[’‘`ʼ]")
+combining_pattern = re.compile("[\u0300-\u036f]+")
+ends_pattern = re.compile(" ?\0 ?")
+
+
+def normalize_lemmas(lemmas):
+    """Lowercase, accent-folded keys of a list of lemmas, the words of a multiword lemma are separated by a single space.
+    The lemmas are joined in a single string (separated by NUL) and normalized at once, with a few regex passes over the whole list"""
+    if not lemmas:
+        return []
+    text = "\0".join(lemmas)
+    if not text.isascii():
+        text = combining_pattern.sub("", unicodedata.normalize("NFKD", apostrophes_pattern.sub("'", text)))
+    text = separators_pattern.sub(" ", text)
+    if " \0" in text or "\0 " in text:
+        text = ends_pattern.sub("\0", text)
+    return text.strip(" ").lower().split("\0")
+
+def normalize_lemma(lemma):
+    return normalize_lemmas([lemma])[0]
+
+
+class DictionaryKeys:
+    """Lemmas of a parser output with their PoS (without the number), indexed by normalized key"""
+
+    def __init__(self, dictionary_path):
+        self.pos = {} # lemma ---> PoS of its meanings
+        for lemma, entry in iter_dictionary(dictionary_path):
+            self.pos[lemma] = frozenset(pos_of_key(pos_key) for pos_key in entry["meanings"])
+        self.keys = {} # normalized key ---> lemmas with that key
+        for lemma, key in zip(self.pos, normalize_lemmas(self.pos)):
+            self.keys.setdefault(key, []).append(lemma)
+
+    def __len__(self):
+        return len(self.pos)
+
+
+def load_list(path):
+    """Loads a lemma list as a dictionary lemma ---> PoS (None if the list has no PoS), keeping the first occurrence of each lemma"""
+    items = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith((".csv", ".tsv")):
+            reader = csv.DictReader(f, delimiter="," if path.endswith(".csv") else "\t")
+            if "lemma" not in reader.fieldnames:
+                raise ValueError(f"{path} has no lemma column")
+            has_pos = "pos" in reader.fieldnames
+            for row in reader:
+                lemma = row["lemma"].strip()
+                if lemma != "" and lemma not in items:
+                    items[lemma] = (normalize_term(row["pos"]) or None) if has_pos else None # normalized like the PoS of the dictionary
+        else:
+            lines = f.read().split("\n")
+            items = dict.fromkeys(line.split("\t", 1)[0].strip() for line in lines)
+            items.pop("", None)
+    return items
+
+def coverage(dictionary, items):
+    """Joins a lemma list (lemma ---> PoS or None) with the dictionary. Returns the report of the list"""
+    exact = items.keys() & dictionary.pos.keys()
+    rest = [lemma for lemma in items if lemma not in exact]
+    rest_keys = normalize_lemmas(rest)
+    found_keys = set(rest_keys) & dictionary.keys.keys()
+    normalized = {lemma: key for lemma, key in zip(rest, rest_keys) if key in found_keys} # lemmas found only after normalization ---> key
+    missing = [lemma for lemma in rest if lemma not in normalized]
+
+    list_pos = Counter(items.values())
+    covered_pos = Counter() # PoS of the list of the covered lemmas
+    matched_pos = Counter() # PoS in the dictionary of the covered lemmas
+    exact_multiword = sum(1 for lemma in exact if separators_pattern.search(lemma) != None)
+    multiword = {"lemmas": exact_multiword + sum(1 for key in rest_keys if " " in key),
+                 "covered": exact_multiword + sum(1 for key in normalized.values() if " " in key)}
+    mismatches = []
+    for lemma, found in [(lemma, [lemma]) for lemma in exact] + [(lemma, dictionary.keys[key]) for lemma, key in normalized.items()]:
+        found_pos = frozenset().union(*(dictionary.pos[match] for match in found))
+        pos = items[lemma]
+        covered_pos[pos] += 1
+        matched_pos.update(found_pos)
+        if pos != None and pos not in found_pos:
+            mismatches.append({"lemma": lemma, "pos": pos, "matches": found, "dictionary_pos": sorted(found_pos)})
+
+    n_covered = len(exact) + len(normalized)
+    return {
+        "lemmas": len(items),
+        "covered": n_covered,
+        "exact": len(exact),
+        "normalized": len(normalized),
+        "coverage": n_covered / len(items) if items else 0.0,
+        "multiword": multiword,
+        "per_pos": {pos or "-": {"lemmas": n, "covered": covered_pos[pos], "coverage": covered_pos[pos] / n} for pos, n in list_pos.most_common()},
+        "matched_pos": dict(matched_pos.most_common()),
+        "missing": missing,
+        "pos_mismatches": mismatches,
+    }
+
+def print_report(path, report, n_examples=10):
+    print(f"{path}: {report['covered']} of {report['lemmas']} lemmas in the dictionary ({report['coverage']:.1%}), "
+          f"{report['exact']} exact and {report['normalized']} after normalization (case, accents, separators).")
+    if report["multiword"]["lemmas"]:
+        print(f"  multiword: {report['multiword']['covered']} of {report['multiword']['lemmas']}")
+    if list(report["per_pos"]) != ["-"]:
+        for pos, counts in report["per_pos"].items():
+            print(f"  {pos}: {counts['covered']} of {counts['lemmas']} ({counts['coverage']:.1%})")
+        print(f"  {len(report['pos_mismatches'])} lemmas found with other PoS, i.e.: " + ", ".join(f"{m['lemma']} ({m['pos']} ---> {'/'.join(m['dictionary_pos']) or 'no meanings'})" for m in report["pos_mismatches"][:n_examples]))
+    else:
+        print("  PoS of the covered lemmas in the dictionary: " + ", ".join(f"{pos} {n}" for pos, n in report["matched_pos"].items()))
+    print(f"  {len(report['missing'])} missing, i.e.: " + ", ".join(report["missing"][:n_examples]))
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Coverage of lemma lists in the parsed dictionary, with per-PoS coverage, missing lemmas and PoS mismatches.")
+    arg_parser.add_argument("dictionary", help="output of iterparse.py (in any of its formats)")
+    arg_parser.add_argument("lists", nargs="+", help="lemma lists: .csv/.tsv with a lemma (and pos) column, or one lemma per line (i.e. vdb_lemmas.txt, frequency lists)")
+    arg_parser.add_argument("--report", help="save the full reports (with all the missing lemmas and mismatches) as json")
+    arg_parser.add_argument("--missing", help="save the missing lemmas of every list in this tsv (list, lemma, pos)")
+    args = arg_parser.parse_args()
+
+    dictionary = DictionaryKeys(args.dictionary)
+    print(f"{len(dictionary)} lemmas in the dictionary, {len(dictionary.keys)} normalized keys.")
+    reports = {}
+    for path in args.lists:
+        items = load_list(path)
+        reports[path] = coverage(dictionary, items)
+        print_report(path, reports[path])
+        if args.missing:
+            with open(args.missing, "a" if len(reports) > 1 else "w", encoding="utf-8") as f:
+                for lemma in reports[path]["missing"]:
+                    f.write(f"{path}\t{lemma}\t{items[lemma] or ''}\n")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=1)
+
+# from command line: python lemma_coverage.py it-dictionary.gz vdb_lemmas.txt ONLI-NEO.csv [--report coverage.json] [--missing missing.tsv]
@@ -0,0 +1,131 @@
+import sys
+import json
+
+# Compact in-memory representation of the parsed lemmas. A lemma dictionary of the parser
+#
+#   {"meta": {"ipa": [...], "sill": [...], "etim": "...", "sin": [...], "ant": [...]}, "meanings": {"sost_1": {"morpho": "...", "glossa": "..."}, ...}}
+#
+# costs a handful of dicts and lists per lemma, and the same keys and values ("sost_1", "m sing"...) are repeated in every lemma.
+# A LemmaRecord keeps the same data in a single slotted object: the lists become tuples (empty ones are all the same object),
+# the meanings are stored as parallel tuples, the PoS keys and the morphological informations are interned in vocabularies shared
+# by all the records (a record only keeps their integer ids) and the syllables are interned strings. to_entry gives back the lemma
+# dictionary, so the json output is the same.
+#
+# python lemma_record.py check it-dictionary.gz loads an output both ways, checks that the json is the same and compares the memory.
+
+
+class Vocabulary:
+    """Interns the values of a field: each distinct string gets a small integer id"""
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def id(self, string):
+        """Returns the id of a string, adding it to the vocabulary if it's new"""
+        string_id = self.ids.get(string)
+        if string_id == None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __contains__(self, string):
+        return string in self.ids
+
+    def __len__(self):
+        return len(self.strings)
+
+POS_KEYS = Vocabulary() # "sost_1", "verb form_2"...
+MORPHO = Vocabulary() # "m sing", "f inv"...
+
+
+class LemmaRecord:
+    """A lemma of the parsed dictionary in a single slotted object. pos, morpho and glosse have one element per meaning:
+    the ids of the PoS key and of the morphology and the glossa"""
+    __slots__ = ("ipa", "sill", "etim", "sin", "ant", "pos", "morpho", "glosse")
+
+    def __init__(self, ipa=(), sill=(), etim="", sin=(), ant=(), pos=(), morpho=(), glosse=()):
+        self.ipa = ipa
+        self.sill = sill
+        self.etim = etim
+        self.sin = sin
+        self.ant = ant
+        self.pos = pos
+        self.morpho = morpho
+        self.glosse = glosse
+
+    @classmethod
+    def from_entry(cls, entry):
+        """Builds the record of a lemma dictionary"""
+        meta = entry["meta"]
+        meanings = entry["meanings"]
+        pos = []
+        morpho = []
+        glosse = []
+        for pos_key, meaning in meanings.items():
+            pos.append(POS_KEYS.id(pos_key))
+            morpho.append(MORPHO.id(meaning["morpho"]))
+            glosse.append(meaning["glossa"])
+        return cls(tuple(meta["ipa"]), tuple(sys.intern(syllable) for syllable in meta["sill"]), meta["etim"], tuple(meta["sin"]), tuple(meta["ant"]),
+                   tuple(pos), tuple(morpho), tuple(glosse))
+
+    def to_entry(self):
+        """Returns the lemma dictionary of the parser, json.dumps gives the same json of the original one"""
+        return {"meta": {"ipa": list(self.ipa), "sill": list(self.sill), "etim": self.etim, "sin": list(self.sin), "ant": list(self.ant)},
+                "meanings": {pos_key: {"morpho": morpho, "glossa": glossa} for pos_key, morpho, glossa in self.meanings()}}
+
+    def meanings(self):
+        """Yields the (PoS key, morphology, glossa) of each meaning"""
+        for pos_id, morpho_id, glossa in zip(self.pos, self.morpho, self.glosse):
+            yield POS_KEYS[pos_id], MORPHO[morpho_id], glossa
+
+    def __eq__(self, other):
+        if not isinstance(other, LemmaRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __reduce__(self):
+        # the ids are only valid in the process that made them, so a record is pickled (i.e. sent by a parser worker) as its dictionary
+        return LemmaRecord.from_entry, (self.to_entry(),)
+
+    def __repr__(self):
+        return f"LemmaRecord({self.to_entry()!r})"
+
+
+def as_entry(entry):
+    """The lemma dictionary of a record, a lemma dictionary is returned as it is"""
+    return entry.to_entry() if isinstance(entry, LemmaRecord) else entry
+
+def traced_size_mb(load):
+    """Calls load, returns its result and the memory it allocated (still allocated at the end) in MB"""
+    import tracemalloc # only for check, the parser imports this module
+    tracemalloc.start()
+    result = load()
+    size = tracemalloc.get_traced_memory()[0] / (1 << 20)
+    tracemalloc.stop()
+    return result, size
+
+def check(path):
+    """Loads a parser output as lemma dictionaries and as records, prints the memory of both. Returns the lemmas with a different json"""
+    from dictionary_io import iter_dictionary
+    import lemma_record # the vocabularies filled by iter_dictionary (this file can run as __main__)
+    entries, entries_mb = traced_size_mb(lambda: dict(iter_dictionary(path)))
+    records, records_mb = traced_size_mb(lambda: dict(iter_dictionary(path, compact=True)))
+    different = [lemma for lemma, entry in entries.items() if json.dumps(records[lemma].to_entry()) != json.dumps(entry)]
+    print(f"{len(entries)} lemmas: {entries_mb:.1f} MB as dictionaries, {records_mb:.1f} MB as records ({entries_mb / records_mb:.1f}x smaller).")
+    print(f"Vocabularies: {len(lemma_record.POS_KEYS)} PoS keys and {len(lemma_record.MORPHO)} morphologies.")
+    return different
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "check":
+        sys.exit("usage: python lemma_record.py check it-dictionary.gz")
+    different = check(sys.argv[2])
+    if different:
+        sys.exit(f"{len(different)} lemmas with a different json, i.e.: " + ", ".join(different[:20]))
+    print("The json of every lemma is the same.")
+
+# from command line: python lemma_record.py check it-dictionary.gz
@@ -1,116 +1,238 @@
-import requests
-from bs4 import BeautifulSoup
+import os
+import json
 import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 import pandas as pd
+from http_cache import ResponseCache
+from onli_extract import extract_index_page, extract_entry
 
-# This script scrapes the ONLI (Opera del Vocabolario Italiano) dictionary and saves the data in a CSV file. 
+# This script scrapes the ONLI (Opera del Vocabolario Italiano) dictionary and saves the data in a CSV file.
 # The data includes the lemma, the PoS, the glossa and the examples. To extract also other data, modify this script accordingly.
+#
+# The pages are downloaded by a pool of threads sharing a session (so the connections are kept alive and reused), the request rate
+# is limited by a token bucket and the failed requests are retried with an exponential backoff. Each scraped lemma is appended to a
+# checkpoint file (JSON Lines) as soon as it's ready: if the run is interrupted, the next one only downloads the missing lemmas.
+# --base-url points the scraper to another server, i.e. a local server replaying recorded ONLI pages.
+#
+# The responses are kept in an on-disk cache (http_cache.py) and requested again with conditional requests, and the results are merged
+# into the existing CSV: a refresh downloads the index pages (an unchanged page is a 304 without body) and only the entries of the new
+# lemmas. With --revalidate every known entry is checked too, and only the pages that changed are parsed again.
+# The fields are extracted from the pages by onli_extract.py.
+
+BASE_URL = "https://www.iliesi.cnr.it/ONLI/"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
-
-# Dictionary for converting the ONLI PoS into the Wiktionary PoS
-abbreviazioni_pos = {
-    "agg.": "agg",
-    "agg.le": "agg",
-    "art.": "art",
-    "avv.": "avv",
-    "avv.le": "avv",
-    "cong.": "cong",
-    "inter.": "inter",
-    "loc.": "loc",
-    "prep.": "prep",
-    "pron.": "pron",
-    "s.": "sost",
-    "s.le": "sost",
-    "v.": "verb"
-}
-
-def handle_pos(posses):
-    if "loc" in posses and "sost" in posses:
-        return "loc nom"
-    if "loc" in posses and "agg" in posses:
-        return "loc agg"
-    if "loc" in posses and "avv" in posses:
-        return "loc avv"
-    if "loc" in posses and "verb" in posses:
-        return "loc verb"
-    if "sost" in posses and "agg" in posses:
-        return "sost"
-    return posses[0]
-    
-
-    
 letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z']
-final_dict = {}
-for letter in tqdm(letters, desc=f"Letter", leave=False): # for each letter
-    url = f"https://www.iliesi.cnr.it/ONLI/elenca.php?al={letter}%&page=1"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
+
+
+class TokenBucket:
+    """Thread safe rate limiter: on average at most rate requests per second, with bursts of at most burst requests"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Waits for a token"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class OnliClient:
+    """HTTP client for the ONLI pages: pooled keep-alive connections, rate limiting and retries with exponential backoff (and jitter)"""
+
+    def __init__(self, base_url=BASE_URL, rate=5, concurrency=4, retries=5, backoff=1, timeout=30, cache=None):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency) # one connection for each thread
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bucket = TokenBucket(rate, burst=concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+
+    def fetch(self, path):
+        """Returns the text of a page (path is relative to the base url, i.e. entrata.php?id=1) and whether it changed since it was cached.
+        A cached page is requested with its validators, so if the server supports them an unchanged page is not downloaded again"""
+        url = self.base_url + path
+        cached = self.cache.get(url) if self.cache != None else None
+        headers = {}
+        if cached != None:
+            cached_text, etag, last_modified = cached
+            if etag != None:
+                headers["If-None-Match"] = etag
+            if last_modified != None:
+                headers["If-Modified-Since"] = last_modified
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+                if response.status_code == 304 and cached != None:
+                    return cached_text, False
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    text = response.text
+                    if self.cache != None:
+                        self.cache.put(url, text, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                    return text, cached == None or text != cached_text # servers without validators send the page again
+                error = requests.HTTPError(f"{response.status_code} for {response.url}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        raise error
+
+    def get(self, path):
+        """Returns the text of a page"""
+        return self.fetch(path)[0]
+
+    def close(self):
+        self.session.close()
+
+
+def index_page_path(letter, page):
+    return f"elenca.php?al={letter}%&page={page}"
+
+def scrape_entry(client, lemma, path, previous=None):
+    """Downloads and parses an entry page. If the page didn't change since the previous run its previous data is returned without parsing it"""
+    html, changed = client.fetch(path)
+    if not changed and previous != None:
+        return previous
+    return extract_entry(html, lemma)
+
+def load_csv(csv_path):
+    """Loads the CSV of a previous run into {lemma: (pos, glossa, etymology, examples)}"""
+    previous = {}
+    if not os.path.exists(csv_path):
+        return previous
+    df = pd.read_csv(csv_path, keep_default_na=False, dtype=str)
+    for lemma, lemma_pos, glossa, examples, etymology in zip(df["lemma"], df["pos"], df["glossa"], df["examples"], df["etymology"]):
+        previous[lemma] = (lemma_pos, glossa, etymology, examples.split(" ** ") if examples != "" else [])
+    return previous
+
+def load_checkpoint(checkpoint_path):
+    """Loads the lemmas already scraped by a previous (interrupted) run"""
+    scraped = {}
+    if not os.path.exists(checkpoint_path):
+        return scraped
+    with open(checkpoint_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError: # last line cut by an interruption
+                continue
+            scraped[record["lemma"]] = (record["pos"], record["glossa"], record["etymology"], record["examples"])
+    return scraped
+
+def list_entries(client, executor):
+    """Downloads the index pages of all the letters. Returns {lemma: entry page path} in the order of the index"""
+    first_pages = [executor.submit(client.get, index_page_path(letter, 1)) for letter in letters]
+    index_pages = {}
+    other_pages = {}
+    for letter, future in zip(letters, tqdm(first_pages, desc="Letter", leave=False)):
+        pages, entries = extract_index_page(future.result())
+        index_pages[(letter, 1)] = entries
+        for p in range(2, pages + 1):
+            other_pages[(letter, p)] = executor.submit(client.get, index_page_path(letter, p))
+    for key, future in tqdm(other_pages.items(), desc="page", leave=False):
+        index_pages[key] = extract_index_page(future.result())[1]
+
+    entry_paths = {}
+    for key in sorted(index_pages, key=lambda key: (letters.index(key[0]), key[1])):
+        for lemma, path in index_pages[key]:
+            entry_paths[lemma] = path # like in the serial scraper, a repeated lemma keeps its first position and its last page
+    return entry_paths
+
+def scrape(out_path="ONLI-NEO.csv", base_url=BASE_URL, rate=5, concurrency=4, retries=5, timeout=30, cache_path=None, cache_size=256 << 20, revalidate=False):
+    """Scrapes ONLI and merges the results into the CSV, resuming from the checkpoint of an interrupted run.
+    Only the lemmas missing from the CSV are downloaded, unless revalidate is True. Returns the number of saved lemmas, the number of new and updated lemmas and the failed ones"""
+    checkpoint_path = os.path.splitext(out_path)[0] + ".checkpoint.jsonl"
+    previous = load_csv(out_path)
+    scraped = load_checkpoint(checkpoint_path)
+    if scraped:
+        print(f"{len(scraped)} lemmas already scraped, resuming from {checkpoint_path}.")
+    final_dict = {**previous, **scraped}
+
+    cache = ResponseCache(cache_path, cache_size) if cache_path != None else None
+    client = OnliClient(base_url, rate, concurrency, retries, timeout=timeout, cache=cache)
+    executor = ThreadPoolExecutor(concurrency)
+    failed = []
     try:
-        pages = int(soup.find_all("td", {"height": "50", "valign": "bottom", "align": "center"})[0].text.strip().split("/")[1]) # get the number of pages for each letter
-    except: # if there are no pages
-        pages = 1
-    for p in tqdm(range(1, pages+1), desc=f"page", leave=False): # for each page
-        if p != 1:
-            url = f"https://www.iliesi.cnr.it/ONLI/elenca.php?al={letter}%&page={p}"
-            response = requests.get(url)
-            soup = BeautifulSoup(response.text, "html.parser")
-        # else soup is already defined
-        for a in soup.find_all("a", href=True):
-            if a.text:
-                if a["href"].startswith("entrata.php"):
-                    lemma = a.text.strip()
-                    lemma_url = "https://www.iliesi.cnr.it/ONLI/" + a["href"]
-                    lemma_response = requests.get(lemma_url)
-                    lemma_soup = BeautifulSoup(lemma_response.text, "html.parser")
-
-                    # PoS
-                    lemma_pos_text = lemma_soup.find_all("div", {"class": "boxentry"})[0].text.strip().split("\r")[0].split(lemma)[-1]
-                    posses = [abbreviazioni_pos[pos] for pos in abbreviazioni_pos if pos in lemma_pos_text.split(" ")]
-                    lemma_pos = handle_pos(posses)
-
-                    # glossa
-                    glossa = lemma_soup.find_all("p")[1].text
-
-                    # if the PoS is an acronym
-                    if glossa.strip().startswith("Acronimo"):
-                        lemma_pos = "acron"
-
-                    # examples
-                    target_p = lemma_soup.find('p', text=glossa)
-                    target_ul = target_p.find_next_sibling('ul')
-                    li_elements = target_ul.find_all('li')
-                    examples = []
-                    for li in li_elements:
-                        li_text = li.text
-                        examples.append(li_text)
-
-                    # etymology
-                    etymology = ""
-                    start_element = lemma_soup.find('b', class_='diamondb')
-                    etymology += start_element.text
-
-                    for sibling in start_element.next_siblings:
-                        if sibling.name == 'br':
-                            break
-                        etymology += sibling.text
-
-                    new_start_element = lemma_soup.find('b', class_='diamondv')
-                    etymology += ", " + new_start_element.text
-
-                    for sibling in new_start_element.next_siblings:
-                        if sibling.name == 'br':
-                            break
-                        etymology += sibling.text
-
-                    final_dict[lemma] = (lemma_pos, glossa.strip(), etymology, examples) # save the data in the dictionary
-                    time.sleep(0.1) # to avoid being blocked
-
-lemmas = list(final_dict.keys())
-lemmas_pos = [final_dict[lemma][0] for lemma in lemmas]
-lemmas_glossa = [final_dict[lemma][1] for lemma in lemmas]
-lemmas_etymology = [final_dict[lemma][2] for lemma in lemmas]
-lemmas_examples = [" ** ".join(final_dict[lemma][3]) for lemma in lemmas]
-df = pd.DataFrame({"lemma": lemmas, "pos": lemmas_pos, "glossa": lemmas_glossa, "examples": lemmas_examples, "etymology": lemmas_etymology}) # create a DataFrame
-
-df.to_csv("ONLI-NEO.csv", index=False) # save the DataFrame as a CSV file
\ No newline at end of file
+        entry_paths = list_entries(client, executor)
+        to_scrape = [lemma for lemma in entry_paths if lemma not in scraped and (revalidate or lemma not in previous)]
+        futures = {executor.submit(scrape_entry, client, lemma, entry_paths[lemma], previous.get(lemma)): lemma for lemma in to_scrape}
+        with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Lemma", leave=False):
+                lemma = futures[future]
+                try:
+                    final_dict[lemma] = future.result()
+                except Exception as e: # the lemma is not in the checkpoint, so the next run tries again
+                    print("ERROR at lemma", lemma, repr(e))
+                    failed.append(lemma)
+                    continue
+                lemma_pos, glossa, etymology, examples = final_dict[lemma]
+                checkpoint.write(json.dumps({"lemma": lemma, "pos": lemma_pos, "glossa": glossa, "etymology": etymology, "examples": examples}, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+    finally:
+        executor.shutdown(cancel_futures=True) # on an interruption the queued requests are dropped, the checkpoint is already on disk
+        client.close()
+        if cache != None:
+            cache.close()
+
+    n_new = sum(1 for lemma in final_dict if lemma not in previous)
+    n_updated = sum(1 for lemma in previous if final_dict[lemma] != previous[lemma])
+    lemmas = [lemma for lemma in entry_paths if lemma in final_dict] # in the order of the index
+    lemmas += [lemma for lemma in previous if lemma not in entry_paths] # lemmas of the previous runs missing from the index are kept
+    lemmas_pos = [final_dict[lemma][0] for lemma in lemmas]
+    lemmas_glossa = [final_dict[lemma][1] for lemma in lemmas]
+    lemmas_etymology = [final_dict[lemma][2] for lemma in lemmas]
+    lemmas_examples = [" ** ".join(final_dict[lemma][3]) for lemma in lemmas]
+    df = pd.DataFrame({"lemma": lemmas, "pos": lemmas_pos, "glossa": lemmas_glossa, "examples": lemmas_examples, "etymology": lemmas_etymology}) # create a DataFrame
+
+    df.to_csv(out_path, index=False) # save the DataFrame as a CSV file
+    if not failed:
+        os.remove(checkpoint_path) # complete scrape, everything is in the CSV
+    return len(lemmas), n_new, n_updated, failed
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Scrapes the ONLI neologisms into a CSV file.")
+    arg_parser.add_argument("--out", default="ONLI-NEO.csv", help="path of the CSV (default: ONLI-NEO.csv), the checkpoint is saved next to it")
+    arg_parser.add_argument("--base-url", default=BASE_URL, help=f"base url of the ONLI pages (default: {BASE_URL})")
+    arg_parser.add_argument("--rate", type=float, default=5, help="maximum number of requests per second (default: 5)")
+    arg_parser.add_argument("--concurrency", type=int, default=4, help="maximum number of concurrent requests (default: 4)")
+    arg_parser.add_argument("--retries", type=int, default=5, help="retries of a failed request (default: 5)")
+    arg_parser.add_argument("--timeout", type=float, default=30, help="timeout of a request in seconds (default: 30)")
+    arg_parser.add_argument("--cache", help="path of the response cache (default: next to the CSV, i.e. ONLI-NEO.cache.sqlite)")
+    arg_parser.add_argument("--cache-size", type=int, default=256, help="maximum size of the response cache in MB, the least recently used responses are evicted (default: 256)")
+    arg_parser.add_argument("--no-cache", action="store_true", help="don't use the response cache")
+    arg_parser.add_argument("--revalidate", action="store_true", help="check also the entries of the lemmas already in the CSV (with conditional requests) and update the changed ones")
+    args = arg_parser.parse_args()
+
+    cache_path = None if args.no_cache else args.cache or os.path.splitext(args.out)[0] + ".cache.sqlite"
+    n_lemmas, n_new, n_updated, failed = scrape(args.out, args.base_url, args.rate, args.concurrency, args.retries, args.timeout, cache_path, args.cache_size << 20, args.revalidate)
+    print(f"{n_lemmas} lemmas saved at {args.out} ({n_new} new, {n_updated} updated).")
+    if failed:
+        print(f"{len(failed)} lemmas failed, run the script again to retry them.")
+
+# from command line: python onli-scraper.py [--rate 5] [--concurrency 4] [--revalidate] [--base-url http://localhost:8000/ONLI/]
@@ -0,0 +1,440 @@
+import sys
+import json
+import time
+import sqlite3
+from html.parser import HTMLParser
+from html.entities import html5
+
+# Extraction of the ONLI pages used by onli-scraper.py. The page is read by html.parser (the parser BeautifulSoup used) into a light
+# tree (Node objects with slots), on which the same lookups of the original BeautifulSoup code are run. TreeBuilder turns the
+# html.parser events into the tree with the rules of BeautifulSoup with the html.parser backend, so the extracted fields are the same:
+# - tags are never closed implicitly, an end tag closes the innermost open tag with the same name (and is ignored if there is none)
+# - void elements (br, img...) have no children
+# - comments, declarations, processing instructions and the contents of script, style, template, rt and rp are not part of the text of a tag
+# - entities are replaced like BeautifulSoup does (a named entity is replaced even without ";", an unknown one is kept as "&name")
+# - a string made only of whitespace becomes a single newline (or space), like BeautifulSoup does outside pre and textarea
+# What is skipped is the BeautifulSoup object model (a Tag with its navigation links and multi-valued attributes for every element).
+# tests/test_onli_extract.py compares the fields with the ones of BeautifulSoup on the entry and index pages in tests/onli_pages.jsonl.
+#
+# python onli_extract.py check ONLI-NEO.cache.sqlite compares the fields with the ones of the original BeautifulSoup code (kept in
+# extract_entry_reference) on all the entry pages saved in the response cache of the scraper, and times both. python onli_extract.py record
+# ONLI-NEO.cache.sqlite tests/onli_pages.jsonl saves the cached index pages and their entry pages as the corpus of the test.
+
+# Dictionary for converting the ONLI PoS into the Wiktionary PoS
+abbreviazioni_pos = {
+    "agg.": "agg",
+    "agg.le": "agg",
+    "art.": "art",
+    "avv.": "avv",
+    "avv.le": "avv",
+    "cong.": "cong",
+    "inter.": "inter",
+    "loc.": "loc",
+    "prep.": "prep",
+    "pron.": "pron",
+    "s.": "sost",
+    "s.le": "sost",
+    "v.": "verb"
+}
+
+def handle_pos(posses):
+    if "loc" in posses and "sost" in posses:
+        return "loc nom"
+    if "loc" in posses and "agg" in posses:
+        return "loc agg"
+    if "loc" in posses and "avv" in posses:
+        return "loc avv"
+    if "loc" in posses and "verb" in posses:
+        return "loc verb"
+    if "sost" in posses and "agg" in posses:
+        return "sost"
+    return posses[0]
+
+
+ascii_spaces = " \n\t\f\r"
+void_elements = frozenset(["area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta", "param", "source", "track", "wbr",
+                           "basefont", "bgsound", "command", "frame", "image", "isindex", "nextid", "spacer"])
+preserve_whitespace_tags = frozenset(["pre", "textarea"])
+
+
+class Markup(str):
+    """Comments, declarations and processing instructions: children of a node but not part of its text"""
+
+
+class CData(str):
+    """CDATA sections: part of the text"""
+
+
+class ContainerString(str):
+    """The strings inside script, style, template, rt and rp: part only of the text of the innermost of these elements"""
+
+container_strings = {name: type(name.capitalize() + "String", (ContainerString,), {}) for name in ["rt", "rp", "style", "script", "template"]}
+
+
+class Node:
+    """Element of the light tree"""
+    __slots__ = ("name", "attrs", "children", "parent")
+
+    def __init__(self, name, attrs=None, parent=None):
+        self.name = name
+        self.attrs = attrs if attrs != None else {}
+        self.children = []
+        self.parent = parent
+
+    def has_class(self, class_name):
+        classes = self.attrs.get("class")
+        return classes != None and (class_name in classes.split() or classes == class_name)
+
+    def iter(self, name):
+        """The descendants with the given tag name, in document order"""
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            if type(node) is Node:
+                if node.name == name:
+                    yield node
+                stack.extend(reversed(node.children))
+
+    @property
+    def text(self):
+        string_types = (container_strings[self.name],) if self.name in container_strings else (str, CData)
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if type(node) is Node:
+                stack.extend(reversed(node.children))
+            elif type(node) in string_types:
+                parts.append(node)
+        return "".join(parts)
+
+    @property
+    def string(self):
+        """Like BeautifulSoup: the only string inside the node, None if the node has more children"""
+        if len(self.children) != 1:
+            return None
+        child = self.children[0]
+        if type(child) is Node:
+            return child.string
+        return child
+
+    def next_siblings(self):
+        siblings = self.parent.children
+        return siblings[siblings.index(self) + 1:]
+
+
+def charref_character(codepoint):
+    """The character of a numeric character reference, as BeautifulSoup replaces it"""
+    if codepoint == 0 or codepoint > 0x10ffff or 0xd800 <= codepoint <= 0xdfff:
+        return "\N{REPLACEMENT CHARACTER}"
+    if 0x80 <= codepoint <= 0x9f: # references to windows-1252 characters
+        try:
+            return bytes([codepoint]).decode("windows-1252")
+        except UnicodeDecodeError:
+            pass
+    return chr(codepoint)
+
+
+class TreeBuilder(HTMLParser):
+    """Builds the light tree from the events of html.parser, with the tree rules of BeautifulSoup (html.parser backend)"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.root = Node("[document]")
+        self.current = self.root
+        self.data = [] # text since the last tag, comment...
+        self.open_tags = {} # number of open elements with each name
+        self.preserve_whitespace = 0 # open pre and textarea elements
+        self.containers = [] # the open script, style, template, rt and rp elements
+        self.already_closed_empty_element = []
+
+    def end_data(self, string_class=str):
+        """Adds the text read since the last tag as a string of the current node"""
+        if not self.data:
+            return
+        data = "".join(self.data)
+        self.data = []
+        if not self.preserve_whitespace and not data.strip(ascii_spaces): # a string of whitespace is collapsed, like BeautifulSoup does
+            data = "\n" if "\n" in data else " "
+        if string_class is str and self.containers:
+            string_class = container_strings[self.containers[-1]]
+        self.current.children.append(string_class(data))
+
+    def push(self, node):
+        self.current.children.append(node)
+        self.current = node
+        self.open_tags[node.name] = self.open_tags.get(node.name, 0) + 1
+        if node.name in preserve_whitespace_tags:
+            self.preserve_whitespace += 1
+        if node.name in container_strings:
+            self.containers.append(node.name)
+
+    def pop(self):
+        node = self.current
+        self.open_tags[node.name] -= 1
+        if node.name in preserve_whitespace_tags:
+            self.preserve_whitespace -= 1
+        if node.name in container_strings:
+            self.containers.pop()
+        self.current = node.parent
+
+    def pop_to(self, name):
+        """Closes the innermost open element with the given name and the ones inside it, nothing if there is none"""
+        if not self.open_tags.get(name):
+            return
+        while self.current.name != name:
+            self.pop()
+        self.pop()
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.end_data()
+        self.push(Node(tag, {name: value if value != None else "" for name, value in attrs}, self.current)) # the last repeated attribute wins
+        if handle_empty_element and tag in void_elements:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_empty_element.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed_empty_element: # the end tag of a void element (<br></br>)
+            self.already_closed_empty_element.remove(tag)
+        else:
+            self.end_data()
+            self.pop_to(tag)
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        self.data.append(charref_character(int(name[1:], 16) if name[0] in "xX" else int(name)))
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ";")
+        self.data.append(character if character != None else "&" + name) # an unknown entity is kept as it is, without ";"
+
+    def handle_comment(self, data):
+        self.add_markup(data, Markup)
+
+    def handle_decl(self, decl):
+        self.add_markup(decl[len("DOCTYPE "):], Markup)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self.add_markup(data[len("CDATA["):], CData)
+        else:
+            self.add_markup(data, Markup)
+
+    def handle_pi(self, data):
+        self.add_markup(data, Markup)
+
+    def add_markup(self, data, string_class):
+        self.end_data()
+        self.data.append(data)
+        self.end_data(string_class)
+
+    def close(self):
+        super().close()
+        self.end_data()
+
+
+def parse_html(html):
+    """Parses the page into the light tree, returns the root node"""
+    builder = TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+def find_first(root, name, predicate):
+    for node in root.iter(name):
+        if predicate(node):
+            return node
+    return None
+
+
+def extract_index_page(html):
+    """Returns the number of index pages of the letter and the (lemma, entry page path) pairs of an index page"""
+    root = parse_html(html)
+    try:
+        pager = find_first(root, "td", lambda node: node.attrs.get("height") == "50" and node.attrs.get("valign") == "bottom" and node.attrs.get("align") == "center")
+        pages = int(pager.text.strip().split("/")[1]) # get the number of pages for each letter
+    except: # if there are no pages
+        pages = 1
+    entries = []
+    for a in root.iter("a"):
+        href = a.attrs.get("href")
+        if href != None and a.text and href.startswith("entrata.php"):
+            entries.append((a.text.strip(), href))
+    return pages, entries
+
+def sibling_text_until_br(element):
+    text = element.text
+    for sibling in element.next_siblings():
+        if type(sibling) is Node:
+            if sibling.name == "br":
+                break
+            text += sibling.text
+        elif type(sibling) in (str, CData):
+            text += sibling
+    return text
+
+def extract_entry(html, lemma):
+    """Extracts PoS, glossa, etymology and examples from an entry page"""
+    root = parse_html(html)
+
+    # PoS
+    boxentry = find_first(root, "div", lambda node: node.has_class("boxentry"))
+    lemma_pos_text = boxentry.text.strip().split("\r")[0].split(lemma)[-1]
+    posses = [abbreviazioni_pos[pos] for pos in abbreviazioni_pos if pos in lemma_pos_text.split(" ")]
+    lemma_pos = handle_pos(posses)
+
+    # glossa
+    paragraphs = root.iter("p")
+    next(paragraphs)
+    glossa = next(paragraphs).text
+
+    # if the PoS is an acronym
+    if glossa.strip().startswith("Acronimo"):
+        lemma_pos = "acron"
+
+    # examples: the first list after the paragraph made only of the glossa
+    target_p = find_first(root, "p", lambda node: node.string == glossa)
+    target_ul = next(node for node in target_p.next_siblings() if type(node) is Node and node.name == "ul")
+    examples = [li.text for li in target_ul.iter("li")]
+
+    # etymology
+    etymology = sibling_text_until_br(find_first(root, "b", lambda node: node.has_class("diamondb")))
+    etymology += ", " + sibling_text_until_br(find_first(root, "b", lambda node: node.has_class("diamondv")))
+
+    return lemma_pos, glossa.strip(), etymology, examples
+
+
+def extract_index_page_reference(html):
+    """The original extraction of the index pages with BeautifulSoup, kept to check extract_index_page"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    try:
+        pages = int(soup.find_all("td", {"height": "50", "valign": "bottom", "align": "center"})[0].text.strip().split("/")[1]) # get the number of pages for each letter
+    except: # if there are no pages
+        pages = 1
+    entries = []
+    for a in soup.find_all("a", href=True):
+        if a.text:
+            if a["href"].startswith("entrata.php"):
+                entries.append((a.text.strip(), a["href"]))
+    return pages, entries
+
+def extract_entry_reference(html, lemma):
+    """The original extraction with BeautifulSoup, kept to check extract_entry"""
+    from bs4 import BeautifulSoup
+    lemma_soup = BeautifulSoup(html, "html.parser")
+
+    # PoS
+    lemma_pos_text = lemma_soup.find_all("div", {"class": "boxentry"})[0].text.strip().split("\r")[0].split(lemma)[-1]
+    posses = [abbreviazioni_pos[pos] for pos in abbreviazioni_pos if pos in lemma_pos_text.split(" ")]
+    lemma_pos = handle_pos(posses)
+
+    # glossa
+    glossa = lemma_soup.find_all("p")[1].text
+
+    # if the PoS is an acronym
+    if glossa.strip().startswith("Acronimo"):
+        lemma_pos = "acron"
+
+    # examples
+    target_p = lemma_soup.find('p', string=glossa)
+    target_ul = target_p.find_next_sibling('ul')
+    li_elements = target_ul.find_all('li')
+    examples = []
+    for li in li_elements:
+        li_text = li.text
+        examples.append(li_text)
+
+    # etymology
+    etymology = ""
+    start_element = lemma_soup.find('b', class_='diamondb')
+    etymology += start_element.text
+
+    for sibling in start_element.next_siblings:
+        if sibling.name == 'br':
+            break
+        etymology += sibling.text
+
+    new_start_element = lemma_soup.find('b', class_='diamondv')
+    etymology += ", " + new_start_element.text
+
+    for sibling in new_start_element.next_siblings:
+        if sibling.name == 'br':
+            break
+        etymology += sibling.text
+
+    return lemma_pos, glossa.strip(), etymology, examples
+
+def try_extract(extract, html, lemma):
+    """Returns the extracted fields, None if the page can't be parsed (both extractions must fail on the same pages)"""
+    try:
+        return extract(html, lemma)
+    except Exception:
+        return None
+
+def read_cache(cache_path):
+    """The (url, body) pairs of the responses saved in the cache of the scraper"""
+    db = sqlite3.connect(cache_path)
+    pages = db.execute("SELECT url, body FROM responses").fetchall()
+    db.close()
+    return pages
+
+def entry_pages(pages):
+    """The (lemma, body) pairs of the entry pages linked by the index pages, from (url, body) pairs"""
+    lemmas = {}
+    for url, body in pages:
+        if "elenca.php" in url:
+            base_url = url[:url.index("elenca.php")]
+            for lemma, path in extract_index_page(body)[1]:
+                lemmas[base_url + path] = lemma
+    return [(lemmas[url], body) for url, body in pages if url in lemmas]
+
+def check(cache_path):
+    """Compares extract_entry with the original code on the entry pages of the scraper cache. Returns the lemmas with different fields"""
+    entries = entry_pages(read_cache(cache_path))
+
+    times = {}
+    results = {}
+    for name, extract in [("BeautifulSoup", extract_entry_reference), ("onli_extract", extract_entry)]:
+        start = time.perf_counter()
+        results[name] = [try_extract(extract, body, lemma) for lemma, body in entries]
+        times[name] = time.perf_counter() - start
+    different = [lemma for (lemma, _), reference, fast in zip(entries, results["BeautifulSoup"], results["onli_extract"]) if reference != fast]
+    for name, seconds in times.items():
+        print(f"{name}: {len(entries)} entry pages in {seconds:.2f}s ({seconds / max(len(entries), 1) * 1000:.2f} ms per page)")
+    print(f"{len(entries) - len(different)} of {len(entries)} pages with the same fields, {times['BeautifulSoup'] / times['onli_extract']:.1f}x faster.")
+    return different
+
+def record(cache_path, out_path, max_pages=None):
+    """Saves the index pages of the scraper cache and the entry pages they link (at most max_pages) as the JSON Lines test corpus"""
+    pages = read_cache(cache_path)
+    index_pages = [(url, body) for url, body in pages if "elenca.php" in url]
+    linked = set()
+    for url, body in index_pages:
+        base_url = url[:url.index("elenca.php")]
+        linked.update(base_url + path for _, path in extract_index_page(body)[1])
+    entries = sorted((url, body) for url, body in pages if url in linked)[:max_pages]
+    with open(out_path, "w", encoding="utf-8") as f:
+        for url, body in sorted(index_pages) + entries:
+            f.write(json.dumps({"url": url, "body": body}, ensure_ascii=False) + "\n")
+    print(f"{len(index_pages)} index pages and {len(entries)} entry pages saved in {out_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "check":
+        different = check(sys.argv[2])
+        if different:
+            sys.exit("Different fields for: " + ", ".join(different[:20]))
+    elif len(sys.argv) in (4, 5) and sys.argv[1] == "record":
+        record(sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) == 5 else None)
+    else:
+        sys.exit("usage: python onli_extract.py check ONLI-NEO.cache.sqlite\n       python onli_extract.py record ONLI-NEO.cache.sqlite tests/onli_pages.jsonl [max_entry_pages]")
+
+# from command line: python onli_extract.py check ONLI-NEO.cache.sqlite
+# or: python onli_extract.py record ONLI-NEO.cache.sqlite tests/onli_pages.jsonl 200
@@ -0,0 +1,162 @@
+import os
+import re
+import sys
+import shutil
+from lemma_record import as_entry
+
+# Export of the parsed dictionary as flat Parquet tables, for the analytical jobs that would otherwise flatten the nested json
+# every time. The tables are written in a directory:
+# - lemmas.parquet: lemma_id, lemma, ipa, sill, etim
+# - senses.parquet: one row per line of a glossa (a definition), sense_id, lemma_id, pos_key ("sost_1"), pos ("sost"), morpho and
+#   the definition without its examples and its domain tags
+# - examples.parquet: sense_id, lemma_id, example (the [ESEMPIO: ...] spans of the definition)
+# - tags.parquet: sense_id, lemma_id, tag (the ##...## domain tags of the definition, without the "##")
+# - sin_ant.parquet: lemma_id, relation ("sin" or "ant"), text
+# The repeated values (pos_key, pos, morpho, tag, relation) are dictionary encoded. The rows are written in batches while the
+# lemmas arrive, so the export can run inside iterparse.py (--format parquet) or on a finished output (python parquet_export.py).
+# Like the outputs of dictionary_io, the tables are written to a .tmp directory next to out_dir, that replaces the previous out_dir
+# only when the writer is closed without errors: a failed run leaves no truncated .parquet file.
+# Requires pyarrow.
+
+TABLES = ["lemmas", "senses", "examples", "tags", "sin_ant"]
+EXAMPLE_START = "[ESEMPIO: "
+tag_pattern = re.compile("##(.*?)##")
+white_spaces_pattern = re.compile(r"\s{2,}")
+
+
+def split_examples(line):
+    """Splits a line of a glossa into its definition and the examples appended to it by the parser"""
+    start = line.find(EXAMPLE_START)
+    if start == -1:
+        return line, []
+    examples = line[start + len(EXAMPLE_START):].split(EXAMPLE_START)
+    return line[:start], [example[:-1] if example.endswith("]") else example for example in examples]
+
+def split_tags(definition):
+    """Returns the definition without the ##...## domain tags and the tags"""
+    if "##" not in definition:
+        return definition.strip(), []
+    tags = tag_pattern.findall(definition)
+    definition = white_spaces_pattern.sub(" ", tag_pattern.sub("", definition))
+    return definition.strip(), tags
+
+def table_schemas():
+    import pyarrow as pa
+    category = pa.dictionary(pa.int32(), pa.string())
+    return {
+        "lemmas": pa.schema([("lemma_id", pa.int64()), ("lemma", pa.string()), ("ipa", pa.list_(pa.string())), ("sill", pa.list_(pa.string())), ("etim", pa.string())]),
+        "senses": pa.schema([("sense_id", pa.int64()), ("lemma_id", pa.int64()), ("pos_key", category), ("pos", category), ("morpho", category), ("definition", pa.string())]),
+        "examples": pa.schema([("sense_id", pa.int64()), ("lemma_id", pa.int64()), ("example", pa.string())]),
+        "tags": pa.schema([("sense_id", pa.int64()), ("lemma_id", pa.int64()), ("tag", category)]),
+        "sin_ant": pa.schema([("lemma_id", pa.int64()), ("relation", category), ("text", pa.string())]),
+    }
+
+
+class ParquetWriter:
+    """Streams the lemmas into the Parquet tables of out_dir, batch_size lemmas per row group. Same interface of the writers of dictionary_io:
+    close commits the tables to out_dir, discard deletes them"""
+
+    def __init__(self, out_dir, batch_size=10000, compression="zstd"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("The parquet export requires pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.out_dir = os.path.normpath(out_dir)
+        self.tmp_dir = self.out_dir + ".tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True) # left by a run that was killed
+        os.makedirs(self.tmp_dir)
+        self.schemas = table_schemas()
+        self.writers = {name: pq.ParquetWriter(os.path.join(self.tmp_dir, f"{name}.parquet"), schema, compression=compression) for name, schema in self.schemas.items()}
+        self.batch_size = batch_size
+        self.columns = {name: {column: [] for column in schema.names} for name, schema in self.schemas.items()}
+        self.n_lemmas = 0
+        self.n_senses = 0
+        self.batch_lemmas = 0
+
+    def add_row(self, table, *values):
+        for column, value in zip(self.columns[table].values(), values):
+            column.append(value)
+
+    def write(self, lemma, entry):
+        entry = as_entry(entry)
+        lemma_id = self.n_lemmas
+        meta = entry["meta"]
+        self.add_row("lemmas", lemma_id, lemma, meta["ipa"], meta["sill"], meta["etim"])
+        for pos_key, meaning in entry["meanings"].items():
+            pos = pos_key.rsplit("_", 1)[0]
+            for line in meaning["glossa"].split("\n"):
+                if line == "":
+                    continue
+                sense_id = self.n_senses
+                self.n_senses += 1
+                definition, examples = split_examples(line)
+                definition, tags = split_tags(definition)
+                self.add_row("senses", sense_id, lemma_id, pos_key, pos, meaning["morpho"], definition)
+                for example in examples:
+                    self.add_row("examples", sense_id, lemma_id, example)
+                for tag in tags:
+                    self.add_row("tags", sense_id, lemma_id, tag)
+        for relation in ["sin", "ant"]:
+            for text in meta[relation]:
+                self.add_row("sin_ant", lemma_id, relation, text)
+        self.n_lemmas += 1
+        self.batch_lemmas += 1
+        if self.batch_lemmas == self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered rows as a new row group of each table"""
+        for name, columns in self.columns.items():
+            if columns[next(iter(columns))]:
+                batch = self.pa.record_batch([self.pa.array(values, field.type) for values, field in zip(columns.values(), self.schemas[name])], schema=self.schemas[name])
+                self.writers[name].write_batch(batch)
+                for values in columns.values():
+                    values.clear()
+        self.batch_lemmas = 0
+
+    def close_writers(self):
+        for writer in self.writers.values():
+            writer.close()
+
+    def close(self):
+        self.flush()
+        self.close_writers()
+        old_dir = self.out_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.out_dir): # a directory can't be replaced by os.replace if it isn't empty
+            os.replace(self.out_dir, old_dir)
+        os.replace(self.tmp_dir, self.out_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def discard(self):
+        self.close_writers()
+        shutil.rmtree(self.tmp_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type == None:
+            self.close()
+        else: # out_dir is replaced only by complete tables
+            self.discard()
+
+
+def export(dictionary_path, out_dir, batch_size=10000):
+    """Exports a parser output (in any of the formats of dictionary_io) to Parquet. Returns the number of lemmas and of senses"""
+    from dictionary_io import iter_dictionary
+    with ParquetWriter(out_dir, batch_size) as writer:
+        for lemma, entry in iter_dictionary(dictionary_path):
+            writer.write(lemma, entry)
+    return writer.n_lemmas, writer.n_senses
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python parquet_export.py compressed_dictionary out_dir")
+    n_lemmas, n_senses = export(sys.argv[1], sys.argv[2])
+    print(f"{n_lemmas} lemmas and {n_senses} senses exported to {sys.argv[2]}.")
+
+# from command line: python parquet_export.py it-dictionary.gz it-dictionary-parquet
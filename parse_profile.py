@@ -0,0 +1,158 @@
+import sys
+import json
+import heapq
+from time import perf_counter_ns
+
+# Opt-in instrumentation of the dump parser (python iterparse.py ... --profile report.json). A ParseProfile collects:
+# - the page counters: pages seen, pages skipped (namespaced titles, pages without text), pages without an italian entry, lemmas emitted
+# - the time spent reading the xml, in the line state machine of parse_page and in string_cleaner
+# - for each helper of the page parser the number of calls, the total time and a histogram of the call durations
+#   (power of two buckets in microseconds). Helpers calling string_cleaner include its time
+# - the peak RSS and the slowest pages
+# - the hits and misses of the line caches of the parser
+# Nothing of this runs without --profile. With more workers each process fills its own profile and they are merged.
+
+HELPERS = ["lang_check", "get_ipa", "get_sill", "unk_pos", "check_pos", "morpho_check", "section_tags", "noetim_check", "nodef_check",
+           "template_utili_check", "other_tags_check", "string_cleaner", "get_etim", "get_sin_ant", "glossa_check", "example_check", "get_examples"]
+PAGE_COUNTERS = ["pages_seen", "skipped_namespace", "skipped_no_text", "no_italian_entry", "lemmas_emitted"]
+
+
+def bucket_label(i):
+    """Label of the i-th histogram bucket, i.e. 0 ---> "<1us", 3 ---> "4-8us" """
+    if i == 0:
+        return "<1us"
+    return f"{1 << (i - 1)}-{1 << i}us"
+
+def max_rss_mb(children=False):
+    """Peak resident set size in MB of the process or of its finished children, None where the resource module is missing (Windows)"""
+    try:
+        import resource # Unix only
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin": # bytes on macOS, KB on Linux
+        peak_rss = peak_rss / 1024
+    return round(peak_rss / 1024, 1)
+
+def format_mb(mb):
+    """"12.3 MB", or "unknown" without the peak memory"""
+    return f"{mb:.1f} MB" if mb != None else "unknown"
+
+
+class ParseProfile:
+    """Counters and timings of a parser run. All the times are kept in nanoseconds"""
+
+    def __init__(self, n_slowest=20):
+        self.n_slowest = n_slowest
+        self.counters = dict.fromkeys(PAGE_COUNTERS, 0)
+        self.xml_read_ns = 0
+        self.parse_page_ns = 0
+        self.helper_calls = dict.fromkeys(HELPERS, 0)
+        self.helper_ns = dict.fromkeys(HELPERS, 0)
+        self.helper_histograms = {name: [] for name in HELPERS}
+        self.cache_counters = {} # cache name ---> [hits, misses]
+        self.slowest_pages = [] # min heap of (ns, title)
+
+    def add_call(self, name, elapsed_ns):
+        """Records a call of a helper"""
+        self.helper_calls[name] += 1
+        self.helper_ns[name] += elapsed_ns
+        histogram = self.helper_histograms[name]
+        bucket = (elapsed_ns // 1000).bit_length() # 0: <1us, 1: 1-2us, 2: 2-4us, ...
+        if bucket >= len(histogram):
+            histogram.extend([0] * (bucket + 1 - len(histogram)))
+        histogram[bucket] += 1
+
+    def add_page(self, title, elapsed_ns):
+        """Records the parse time of a page, keeping only the n_slowest ones"""
+        self.parse_page_ns += elapsed_ns
+        if len(self.slowest_pages) < self.n_slowest:
+            heapq.heappush(self.slowest_pages, (elapsed_ns, title))
+        elif elapsed_ns > self.slowest_pages[0][0]:
+            heapq.heapreplace(self.slowest_pages, (elapsed_ns, title))
+
+    def add_cache_counters(self, name, hits, misses):
+        """Adds the hits and misses of a cache of the parser"""
+        counters = self.cache_counters.setdefault(name, [0, 0])
+        counters[0] += hits
+        counters[1] += misses
+
+    def timed_pages(self, pages):
+        """Wraps an iterable of (title, text) pages, adding the time spent producing them (reading and decompressing the xml) to the profile"""
+        pages = iter(pages)
+        while True:
+            start = perf_counter_ns()
+            page = next(pages, None)
+            self.xml_read_ns += perf_counter_ns() - start
+            if page == None:
+                return
+            yield page
+
+    def merge(self, other):
+        """Adds the counters and the timings of another profile (i.e. the one of a worker process) to this one"""
+        for name in PAGE_COUNTERS:
+            self.counters[name] += other.counters[name]
+        self.xml_read_ns += other.xml_read_ns
+        self.parse_page_ns += other.parse_page_ns
+        for name in HELPERS:
+            self.helper_calls[name] += other.helper_calls[name]
+            self.helper_ns[name] += other.helper_ns[name]
+            histogram = self.helper_histograms[name]
+            other_histogram = other.helper_histograms[name]
+            if len(other_histogram) > len(histogram):
+                histogram.extend([0] * (len(other_histogram) - len(histogram)))
+            for i, count in enumerate(other_histogram):
+                histogram[i] += count
+        for name, (hits, misses) in other.cache_counters.items():
+            self.add_cache_counters(name, hits, misses)
+        self.slowest_pages = heapq.nlargest(self.n_slowest, self.slowest_pages + other.slowest_pages)
+        heapq.heapify(self.slowest_pages)
+
+    def report(self, total_s=None, workers=1):
+        """Returns the report as a json serializable dictionary"""
+        string_cleaner_ns = self.helper_ns["string_cleaner"]
+        helpers = {}
+        for name in HELPERS:
+            calls = self.helper_calls[name]
+            helpers[name] = {
+                "calls": calls,
+                "total_s": round(self.helper_ns[name] / 1e9, 6),
+                "mean_us": round(self.helper_ns[name] / calls / 1000, 3) if calls else 0,
+                "histogram_us": {bucket_label(i): count for i, count in enumerate(self.helper_histograms[name]) if count},
+            }
+        return {
+            "workers": workers,
+            "pages": dict(self.counters),
+            "time_s": {
+                "total": round(total_s, 6) if total_s != None else None,
+                "xml_reading": round(self.xml_read_ns / 1e9, 6),
+                "parse_pages": round(self.parse_page_ns / 1e9, 6), # summed over the workers
+                "state_machine": round((self.parse_page_ns - string_cleaner_ns) / 1e9, 6), # parse_page without string_cleaner
+                "string_cleaner": round(string_cleaner_ns / 1e9, 6),
+            },
+            "helpers": helpers,
+            "caches": {name: {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0} for name, (hits, misses) in self.cache_counters.items()},
+            "peak_rss_mb": {
+                "main": max_rss_mb(),
+                "workers": max_rss_mb(children=True) if workers > 1 else None, # the biggest worker
+            },
+            "slowest_pages": [{"title": title, "ms": round(elapsed_ns / 1e6, 3)} for elapsed_ns, title in sorted(self.slowest_pages, reverse=True)],
+        }
+
+    def save(self, report_path, total_s=None, workers=1):
+        """Writes the json report"""
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(total_s, workers), f, ensure_ascii=False, indent=2)
+
+
+def timed_helper(name, method):
+    """Wraps a method of the page parser so that each call is recorded in self.profile"""
+    def wrapper(self, *args, **kwargs):
+        start = perf_counter_ns()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.profile.add_call(name, perf_counter_ns() - start)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
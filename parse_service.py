@@ -0,0 +1,408 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+from time import perf_counter_ns
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+import iterparse
+from iterparse import WiktionaryPageParser, LINE_CACHE_SIZE, init_worker
+from parse_profile import bucket_label
+
+# Local HTTP/JSON service parsing single pages, i.e. the pages of the Wiktionary edits as they arrive, without a dump.
+# The parser is loaded once (language table, converters, caches) and shared by a pool of worker processes.
+#
+#   POST /parse    {"title": "casa", "text": "=={{-it-}}==..."} ---> {"title": "casa", "entry": {...}} (entry is the lemma dictionary of
+#                  main(), null if the page has no italian entry). A json list of pages gets the list of the results, title and text
+#                  must be strings (400 otherwise).
+#                  The wikitext can also be sent as it is (any other Content-Type) with the title in the query: POST /parse?title=casa
+#   GET /stats     counters and latency histograms (request, queue and parse time, power of two buckets in microseconds)
+#   GET /health
+#
+# The pages of all the requests go in a single queue and are sent to the workers in batches: a batch is sent as soon as a worker is
+# free, with all the pages that arrived in the meantime (up to --batch-size), so an idle service parses a page right away and a busy
+# one sends bigger batches. At most 2 batches per worker are in flight, a request whose pages would take the queue above --max-pending
+# pages is rejected with 503 before any of them is queued (backpressure). With --workers 0 the pages are parsed in the event loop, without the inter-process round trip.
+#
+# python parse_service.py replay dump.xml replays the pages of a dump against the service from concurrent connections, checks the
+# results against the local parser (--check) and prints the latency percentiles.
+
+DEFAULT_PORT = 8750
+MAX_BODY_SIZE = 32 << 20
+STATUS_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+def parse_batch(pages):
+    """Parses a batch of (title, text) pages with the parser of the worker (see iterparse.init_worker), returns for each page the json of
+    its entry ("null" without an italian entry) and the error (or None). The json is made by the worker, so the event loop only joins the strings"""
+    results = []
+    for title, text in pages:
+        try:
+            results.append((json.dumps(iterparse.worker_parser.parse_page(title, text), ensure_ascii=False), None))
+        except Exception as e:
+            results.append((None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+class LatencyHistogram:
+    """Latencies in power of two buckets of microseconds (like the --profile histograms), the percentiles are the upper bounds of the buckets"""
+
+    def __init__(self):
+        self.buckets = []
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def add(self, elapsed_ns):
+        bucket = (elapsed_ns // 1000).bit_length() # 0: <1us, 1: 1-2us, 2: 2-4us, ...
+        if bucket >= len(self.buckets):
+            self.buckets.extend([0] * (bucket + 1 - len(self.buckets)))
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total_ns += elapsed_ns
+        self.max_ns = max(self.max_ns, elapsed_ns)
+
+    def percentile(self, q):
+        """Upper bound in microseconds of the bucket of the q-th percentile"""
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(1 << i, round(self.max_ns / 1000, 1))
+        return 0
+
+    def report(self):
+        return {
+            "count": self.count,
+            "mean_us": round(self.total_ns / self.count / 1000, 1) if self.count else 0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "max_us": round(self.max_ns / 1000, 1),
+            "histogram_us": {bucket_label(i): count for i, count in enumerate(self.buckets) if count},
+        }
+
+
+class Overloaded(Exception):
+    pass
+
+
+class PageBatcher:
+    """Queue of the pages to parse, sent in batches to the process pool (or parsed in the event loop without workers)"""
+
+    def __init__(self, parser, workers, batch_size=64, max_pending=10000):
+        self.parser = parser
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pool = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(parser,)) if workers > 0 else None
+        if self.pool == None:
+            init_worker(parser)
+        self.slots = asyncio.Semaphore(2 * workers if workers > 0 else 1) # batches in flight
+        self.pending = [] # (title, text, future, enqueue time)
+        self.ready = asyncio.Event()
+        self.n_batches = 0
+        self.n_pages = 0
+        self.queue_latency = LatencyHistogram()
+        self.parse_latency = LatencyHistogram() # of the batches, including the round trip to the worker
+        self.tasks = set() # the parse tasks in flight (the event loop only keeps weak references to the tasks)
+        self.dispatcher = asyncio.create_task(self.dispatch())
+
+    def submit(self, pages):
+        """Queues the (title, text) pages, returns the futures of their (entry json, error). Raises Overloaded, without queueing any
+        of them, when the pages don't fit in the queue"""
+        if len(self.pending) + len(pages) > self.max_pending:
+            raise Overloaded()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for title, text in pages:
+            future = loop.create_future()
+            self.pending.append((title, text, future, perf_counter_ns()))
+            futures.append(future)
+        self.ready.set()
+        return futures
+
+    async def dispatch(self):
+        while True:
+            await self.ready.wait()
+            await self.slots.acquire() # while the workers are busy the pages pile up, so the next batch is bigger
+            batch = self.pending[:self.batch_size]
+            del self.pending[:self.batch_size]
+            if not self.pending:
+                self.ready.clear()
+            task = asyncio.create_task(self.parse(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def parse(self, batch):
+        start = perf_counter_ns()
+        for _, _, _, enqueued in batch:
+            self.queue_latency.add(start - enqueued)
+        pages = [(title, text) for title, text, _, _ in batch]
+        try:
+            if self.pool != None:
+                results = await asyncio.get_running_loop().run_in_executor(self.pool, parse_batch, pages)
+            else:
+                results = parse_batch(pages)
+        except Exception as e: # i.e. a worker died
+            results = [(None, f"{type(e).__name__}: {e}")] * len(batch)
+        finally:
+            self.slots.release()
+        self.parse_latency.add(perf_counter_ns() - start)
+        self.n_batches += 1
+        self.n_pages += len(batch)
+        for (_, _, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def close(self):
+        self.dispatcher.cancel()
+        if self.pool != None:
+            self.pool.shutdown(cancel_futures=True)
+
+
+class ParseService:
+    """The HTTP/1.1 server (keep-alive connections, Content-Length bodies) in front of a PageBatcher"""
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.request_latency = LatencyHistogram()
+        self.counters = {"requests": 0, "pages": 0, "errors": 0, "rejected": 0}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = perf_counter_ns()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {"error": "body too large"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+                method, target = request_line.decode("latin-1").split()[:2]
+                status, response = await self.route(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self.respond(writer, status, response, keep_alive)
+                if method == "POST" and status == 200:
+                    self.request_latency.add(perf_counter_ns() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, target, headers, body):
+        """Returns the status and the response (a json string or a json serializable object)"""
+        url = urlsplit(target)
+        if url.path == "/health":
+            return 200, {"status": "ok"}
+        if url.path == "/stats":
+            return 200, self.stats()
+        if url.path != "/parse":
+            return 404, {"error": f"unknown path {url.path}"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        self.counters["requests"] += 1
+        if headers.get("content-type", "").startswith("application/json"):
+            try:
+                pages = json.loads(body)
+                single = isinstance(pages, dict)
+                pages = [(page["title"], page["text"]) for page in ([pages] if single else pages)]
+            except (ValueError, KeyError, TypeError):
+                return 400, {"error": 'the body must be {"title": ..., "text": ...} or a list of them'}
+            if not all(isinstance(title, str) and isinstance(text, str) for title, text in pages):
+                return 400, {"error": "the title and the text of the pages must be strings"}
+            if not pages: # nothing to parse, the batcher is not woken up
+                return 200, "[]"
+        else:
+            title = parse_qs(url.query).get("title")
+            if title == None:
+                return 400, {"error": "missing title in the query"}
+            single = True
+            try:
+                pages = [(title[0], body.decode("utf-8"))]
+            except UnicodeDecodeError:
+                return 400, {"error": "the wikitext must be utf-8"}
+        if len(pages) > self.batcher.max_pending:
+            return 413, {"error": f"too many pages, at most {self.batcher.max_pending} per request"}
+        try:
+            futures = self.batcher.submit(pages)
+        except Overloaded:
+            self.counters["rejected"] += 1
+            return 503, {"error": "too many pending pages, retry later"}
+        results = []
+        for (title, _), (entry_json, error) in zip(pages, await asyncio.gather(*futures)):
+            if error != None:
+                self.counters["errors"] += 1
+                results.append(json.dumps({"title": title, "error": error}, ensure_ascii=False))
+            else:
+                results.append('{"title": ' + json.dumps(title, ensure_ascii=False) + ', "entry": ' + entry_json + "}")
+        self.counters["pages"] += len(pages)
+        return 200, results[0] if single else "[" + ", ".join(results) + "]"
+
+    async def respond(self, writer, status, response, keep_alive=True):
+        body = (response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {STATUS_REASONS[status]}", "Content-Type: application/json; charset=utf-8", f"Content-Length: {len(body)}"]
+        if not keep_alive:
+            head.append("Connection: close")
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    def stats(self):
+        batcher = self.batcher
+        return {
+            **self.counters,
+            "pending": len(batcher.pending),
+            "batches": batcher.n_batches,
+            "mean_batch_size": round(batcher.n_pages / batcher.n_batches, 2) if batcher.n_batches else 0,
+            "caches": batcher.parser.cache_stats() if batcher.pool == None else None, # the caches of the workers are in their processes
+            "latency": {"request": self.request_latency.report(), "queue": batcher.queue_latency.report(), "batch_parse": batcher.parse_latency.report()},
+        }
+
+
+async def serve(host, port, unix_path, workers, batch_size, max_pending, cache_size):
+    parser = WiktionaryPageParser(cache_size=cache_size)
+    batcher = PageBatcher(parser, workers, batch_size, max_pending)
+    service = ParseService(batcher)
+    if unix_path:
+        server = await asyncio.start_unix_server(service.handle_connection, unix_path)
+        print(f"Parsing pages on unix socket {unix_path} with {workers} workers.")
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        print(f"Parsing pages on http://{host}:{port} with {workers} workers.")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher.close()
+
+
+async def read_response(reader):
+    """Reads an HTTP response, returns its status and body"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed by the service")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return int(status_line.split()[1]), await reader.readexactly(int(headers.get("content-length", 0)))
+
+async def request(reader, writer, host, method, path, payload=None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload != None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    return await read_response(reader)
+
+async def replay(pages, host, port, unix_path, concurrency, check):
+    """Sends the pages from concurrent keep-alive connections, returns the latencies (ns) of the requests, the mismatches with the local parser and the stats of the service"""
+    parser = WiktionaryPageParser() if check else None
+    pages = iter(pages)
+    latencies = []
+    mismatches = []
+    rejected = 0
+
+    async def connect():
+        return await (asyncio.open_unix_connection(unix_path) if unix_path else asyncio.open_connection(host, port))
+
+    async def client():
+        nonlocal rejected
+        reader, writer = await connect()
+        for title, text in pages: # the iterator is shared by the clients
+            while True:
+                start = perf_counter_ns()
+                status, body = await request(reader, writer, host, "POST", "/parse", {"title": title, "text": text})
+                if status != 503:
+                    break
+                rejected += 1
+                await asyncio.sleep(0.01)
+            latencies.append(perf_counter_ns() - start)
+            result = json.loads(body)
+            if status != 200 or "error" in result:
+                mismatches.append((title, result.get("error", status)))
+            elif parser != None and result["entry"] != json.loads(json.dumps(parser.parse_page(title, text))): # same json types
+                mismatches.append((title, "different entry"))
+        writer.close()
+
+    start = perf_counter_ns()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed_s = (perf_counter_ns() - start) / 1e9
+    reader, writer = await connect()
+    _, stats = await request(reader, writer, host, "GET", "/stats")
+    writer.close()
+    return latencies, elapsed_s, mismatches, rejected, json.loads(stats)
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+def load_pages(dump_path, max_pages):
+    """The (title, text) pages of the main namespace of a dump, up to max_pages"""
+    from iterparse import iter_pages
+    pages = []
+    for title, text in iter_pages(dump_path):
+        if ":" in title or text == None:
+            continue
+        pages.append((title, text))
+        if len(pages) == max_pages:
+            break
+    return pages
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Local HTTP/JSON service parsing single Wiktionary pages, and a client replaying the pages of a dump against it.")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="start the service")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"default: {DEFAULT_PORT}")
+    serve_parser.add_argument("--unix", help="listen on this unix socket instead of host and port")
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parser processes (default: the number of cpus, 0: parse in the event loop)")
+    serve_parser.add_argument("--batch-size", type=int, default=64, help="maximum pages sent to a worker at once (default: 64)")
+    serve_parser.add_argument("--max-pending", type=int, default=10000, help="queued pages above which the requests are rejected with 503 (default: 10000)")
+    serve_parser.add_argument("--cache-size", type=int, default=LINE_CACHE_SIZE, help=f"size of the line caches of the parser (default: {LINE_CACHE_SIZE})")
+    replay_parser = commands.add_parser("replay", help="replay the pages of a dump against a running service")
+    replay_parser.add_argument("dump", help="xml dump (plain or compressed), i.e. a sample of the real dump")
+    replay_parser.add_argument("--host", default="127.0.0.1")
+    replay_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    replay_parser.add_argument("--unix", help="unix socket of the service")
+    replay_parser.add_argument("--pages", type=int, default=10000, help="pages to replay (default: 10000)")
+    replay_parser.add_argument("--concurrency", type=int, default=16, help="concurrent connections (default: 16)")
+    replay_parser.add_argument("--check", action="store_true", help="compare each result with the one of the local parser")
+    args = arg_parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.batch_size, args.max_pending, args.cache_size))
+        except KeyboardInterrupt:
+            pass
+    else:
+        os.environ["TQDM_DISABLE"] = "1"
+        pages = load_pages(args.dump, args.pages)
+        latencies, elapsed_s, mismatches, rejected, stats = asyncio.run(replay(pages, args.host, args.port, args.unix, args.concurrency, args.check))
+        latencies.sort()
+        print(f"{len(latencies)} pages in {elapsed_s:.2f}s ({len(latencies) / elapsed_s:,.0f} pages/s) from {args.concurrency} connections, {rejected} retries after a 503.")
+        print("latency ms: " + ", ".join(f"p{q} {percentile(latencies, q) / 1e6:.2f}" for q in (50, 90, 99)) + f", max {latencies[-1] / 1e6:.2f}")
+        print(f"service: {stats['batches']} batches of {stats['mean_batch_size']} pages on average, p99 request {stats['latency']['request']['p99_us']}us (bucket bound)")
+        if mismatches:
+            sys.exit(f"{len(mismatches)} pages with an error or a different entry, i.e.: " + ", ".join(f"{title} ({reason})" for title, reason in mismatches[:10]))
+        if args.check:
+            print("Every entry is the same of the local parser.")
+
+# from command line: python parse_service.py serve [--workers 4] [--unix /tmp/parse.sock]
+# python parse_service.py replay itwiktionary-sample.xml.bz2 --concurrency 16 --check
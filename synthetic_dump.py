@@ -0,0 +1,207 @@
+import bz2
+import gzip
+import random
+import argparse
+from xml.sax.saxutils import escape
+
+# Generator of synthetic Wikizionario dumps for the benchmarks. The pages follow the layout of the real ones
+# (https://it.wiktionary.org/wiki/Wikizionario:Manuale_di_stile): an italian section with one or more PoS, morphology, glosses
+# with Term tags, links and examples, pronunciation, syllabation, etymology, synonyms and antonyms, translations, and the
+# usual noise of a full dump: other namespaces, redirects, pages without an italian section, other languages before and after it.
+# The same seed always gives the same dump.
+# With multistream=True the dump is written like the multistream dumps of Wikimedia (pages-articles-multistream.xml.bz2): a bz2 stream
+# with the header, independent bz2 streams of STREAM_PAGES pages and a last stream with the end of the root element, plus the index
+# of the streams (offset:page_id:title lines, bz2 compressed) at multistream_index_path(path).
+
+SYLLABLES = ["ca", "sa", "pa", "sso", "ro", "ma", "to", "te", "le", "li", "no", "na", "ti", "re", "ri", "do", "di", "bel", "lo", "ta", "vo", "la",
+             "ce", "ci", "gna", "glio", "sco", "stra", "pre", "con", "in", "men", "zio", "ne", "tà", "rò", "gat", "can", "ac", "qua", "fuo", "co"]
+POS_TAGS = ["sost", "sost", "sost", "agg", "agg", "verb", "avv", "sost form", "agg form", "verb form", "verb form", "verb form", "inter", "prep", "cong"]
+MORPHO = ["''m sing''", "''f sing''", "''m inv''", "''f inv''", "''m pl''", "''f pl''", "''m sing'' e ''f sing''", "''inv''"]
+TERMS = ["Architettura", "Fisica", "Sport", "Medicina", "Diritto", "Botanica", "Zoologia", "Cucina", "Informatica", "Musica"]
+AMBITI = ["{{Est}}", "{{Fig}}", "{{Lett}}", "{{Raro}}", "{{Fam}}", "{{Spreg}}"]
+LANGS = ["la", "grc", "fr", "en", "de", "es", "ar", "got"]
+OTHER_LANGS = ["en", "fr", "es", "de", "pt", "la", "ro"]
+VERB_FORMS = ["prima persona singolare dell'indicativo presente", "terza persona singolare del congiuntivo presente",
+              "seconda persona plurale dell'indicativo imperfetto", "participio passato", "gerundio"]
+NOUN_FORMS = ["plurale", "femminile", "femminile plurale", "maschile plurale"]
+DUMP_HEADER = ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="it">\n'
+               "  <siteinfo>\n    <sitename>Wikizionario</sitename>\n    <dbname>itwiktionary</dbname>\n  </siteinfo>\n")
+DUMP_FOOTER = "</mediawiki>\n"
+STREAM_PAGES = 100 # pages in each stream of a multistream dump
+NAMESPACES = {"Wikizionario": 4, "Template": 10, "Categoria": 14, "Appendice": 100}
+
+
+def make_word(rng, min_syllables=1, max_syllables=4):
+    """Returns a random word and its syllables"""
+    syllables = [rng.choice(SYLLABLES) for _ in range(rng.randint(min_syllables, max_syllables))]
+    return "".join(syllables), syllables
+
+def make_link(rng):
+    """A wiki link, sometimes with a different label ([[casa|case]])"""
+    word, _ = make_word(rng)
+    if rng.random() < 0.2:
+        return f"[[{word}|{word}e]]"
+    return f"[[{word}]]"
+
+def make_gloss(rng, pos):
+    """A definition line, with its usage examples"""
+    if pos.endswith(" form"):
+        base, _ = make_word(rng, 2)
+        forms = VERB_FORMS if pos == "verb form" else NOUN_FORMS
+        return [f"# {rng.choice(forms)} di [[{base}]]"]
+    parts = []
+    if rng.random() < 0.3:
+        parts.append(f"{{{{Term|{rng.choice(TERMS)}|it}}}}")
+    if rng.random() < 0.15:
+        parts.append(rng.choice(AMBITI))
+    parts.append(" ".join(make_link(rng) if rng.random() < 0.3 else make_word(rng)[0] for _ in range(rng.randint(3, 12))))
+    if rng.random() < 0.1:
+        parts.append("<ref>{{Cita libro|autore=Rossi|titolo=Dizionario}}</ref>")
+    lines = ["# " + " ".join(parts)]
+    for _ in range(rng.choice([0, 0, 1, 1, 2])):
+        lines.append("#* ''" + " ".join(rng.choice(["{{Pn}}", make_word(rng)[0], make_word(rng)[0]]) for _ in range(rng.randint(3, 8))) + "''")
+    return lines
+
+def make_italian_section(rng, syllables):
+    """The italian section of a page"""
+    lines = ["== {{-it-}} ==" if rng.random() < 0.7 else "=={{-it-}}=="]
+    for _ in range(1 if rng.random() < 0.8 else rng.randint(2, 3)):
+        pos = rng.choice(POS_TAGS)
+        lines.append(f"{{{{-{pos}-|it}}}}")
+        if pos in ["sost", "agg", "sost form", "agg form"]:
+            lines.append(f"{{{{Pn|w}}}} {rng.choice(MORPHO)}" + (f" (pl.: {make_link(rng)})" if rng.random() < 0.3 else ""))
+        else:
+            lines.append("{{Pn|w}}")
+        for _ in range(rng.randint(1, 4) if not pos.endswith(" form") else 1):
+            lines.extend(make_gloss(rng, pos))
+        lines.append("")
+    if rng.random() < 0.8:
+        lines += ["{{-sill-}}", "; " + " | ".join(syllables), ""]
+    if rng.random() < 0.7:
+        lines += ["{{-pron-}}", "{{IPA|/" + ".".join(syllables) + "/}}", ""]
+    if rng.random() < 0.6:
+        if rng.random() < 0.2:
+            lines += ["{{-etim-}}", "{{Noetim|it}}", ""]
+        else:
+            lines += ["{{-etim-}}", f"dal {{{{{rng.choice(LANGS)}}}}} ''{make_word(rng)[0]}'', {make_word(rng)[0]} {make_link(rng)}", ""]
+    for tag in ["sin", "ant"]:
+        if rng.random() < (0.4 if tag == "sin" else 0.15):
+            lines.append(f"{{{{-{tag}-}}}}")
+            for _ in range(rng.randint(1, 3)):
+                prefix = f"({rng.choice(['senso figurato', 'raro', 'familiare'])}) " if rng.random() < 0.3 else ""
+                lines.append("* " + prefix + ", ".join(make_link(rng) for _ in range(rng.randint(1, 4))))
+            lines.append("")
+    if rng.random() < 0.3:
+        lines += ["{{-der-}}", "* " + ", ".join(make_link(rng) for _ in range(3)), ""]
+    if rng.random() < 0.5:
+        lines += ["{{-trad-}}", "{{Trad1|}}"] + [f":*{{{{{lang}}}}}: {make_link(rng)}" for lang in rng.sample(OTHER_LANGS, 3)] + ["{{Trad2}}", ""]
+    if rng.random() < 0.4:
+        lines += ["== Note / Riferimenti ==", "<references/>", "* {{Fonte|trec}}", ""]
+    return lines
+
+def make_other_section(rng, lang):
+    """The section of another language"""
+    pos = rng.choice(["sost", "agg", "verb"])
+    return [f"== {{{{-{lang}-}}}} ==", f"{{{{-{pos}-|{lang}}}}}", "{{Pn|w}}", *make_gloss(rng, pos), ""]
+
+def make_page(rng, i):
+    """Returns the (title, namespace, text) of the i-th page"""
+    lemma, syllables = make_word(rng)
+    title = f"{lemma}{i}"
+    r = rng.random()
+    if r < 0.08:
+        namespace = rng.choice(list(NAMESPACES))
+        return f"{namespace}:{title}", NAMESPACES[namespace], "{{Documentazione}}\n[[Categoria:" + lemma + "]]"
+    if r < 0.11:
+        return title, 0, f"#RINVIA [[{lemma}]]"
+    if r < 0.12:
+        return title, 0, None # page with a missing revision text
+    sections = []
+    if rng.random() < 0.15:
+        sections += make_other_section(rng, rng.choice(OTHER_LANGS[:3]))
+    if r < 0.25:
+        sections += make_other_section(rng, rng.choice(OTHER_LANGS))
+    else:
+        sections += make_italian_section(rng, syllables)
+    if rng.random() < 0.25:
+        sections += make_other_section(rng, rng.choice(OTHER_LANGS))
+    return title, 0, "\n".join(sections).strip()
+
+def page_xml(title, ns, text, page_id):
+    """Serializes a page like the Wikimedia dumps do"""
+    if text == None:
+        text_xml = '<text bytes="0" />'
+    else:
+        text_xml = f'<text bytes="{len(text.encode("utf-8"))}" xml:space="preserve">{escape(text)}</text>'
+    return (f"  <page>\n    <title>{escape(title)}</title>\n    <ns>{ns}</ns>\n    <id>{page_id}</id>\n    <revision>\n      <id>{page_id * 7}</id>\n"
+            f"      <contributor>\n        <username>Bot</username>\n        <id>1</id>\n      </contributor>\n"
+            f"      <model>wikitext</model>\n      <format>text/x-wiki</format>\n      {text_xml}\n    </revision>\n  </page>\n")
+
+def open_dump_output(path):
+    """Opens the output in text mode, compressed according to the extension (.bz2, .gz or plain xml)"""
+    if path.endswith(".bz2"):
+        return bz2.open(path, "wt", encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def multistream_index_path(path):
+    """Path of the index of a multistream dump (i.e. synthetic-multistream.xml.bz2 ---> synthetic-multistream-index.txt.bz2)"""
+    stem = path[:-len(".bz2")] if path.endswith(".bz2") else path
+    stem = stem[:-len(".xml")] if stem.endswith(".xml") else stem
+    return stem + "-index.txt.bz2"
+
+def write_multistream_dump(path, pages):
+    """Writes the (title, ns, text) pages as a multistream bz2 dump and its index"""
+    with open(path, "wb") as f, bz2.open(multistream_index_path(path), "wt", encoding="utf-8") as index:
+        f.write(bz2.compress(DUMP_HEADER.encode("utf-8")))
+        stream = []
+        for page_id, (title, ns, text) in enumerate(pages, 1):
+            stream.append((page_id, title, page_xml(title, ns, text, page_id)))
+            if len(stream) == STREAM_PAGES:
+                write_stream(f, index, stream)
+                stream = []
+        if stream:
+            write_stream(f, index, stream)
+        f.write(bz2.compress(DUMP_FOOTER.encode("utf-8")))
+
+def write_stream(f, index, stream):
+    """Writes the pages of a stream as a single bz2 stream and their index lines"""
+    offset = f.tell()
+    f.write(bz2.compress("".join(page for _, _, page in stream).encode("utf-8")))
+    for page_id, title, _ in stream:
+        index.write(f"{offset}:{page_id}:{title}\n")
+
+def write_dump(path, n_pages, seed=0, multistream=False):
+    """Writes a synthetic dump of n_pages pages, one page at a time. With multistream=True the dump (that must be a .bz2 file) is a multistream one, with its index"""
+    rng = random.Random(seed)
+    pages = (make_page(rng, i) for i in range(n_pages))
+    if multistream:
+        if not path.endswith(".bz2"):
+            raise ValueError("A multistream dump is a .bz2 file")
+        write_multistream_dump(path, pages)
+        return
+    with open_dump_output(path) as f:
+        f.write(DUMP_HEADER)
+        for page_id, (title, ns, text) in enumerate(pages, 1):
+            f.write(page_xml(title, ns, text, page_id))
+        f.write(DUMP_FOOTER)
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Writes a synthetic Wikizionario dump for the benchmarks.")
+    arg_parser.add_argument("n_pages", type=int, help="number of pages (i.e. 10000, 100000, 1000000)")
+    arg_parser.add_argument("out_path", help="path of the dump, compressed if it ends with .bz2 or .gz")
+    arg_parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    arg_parser.add_argument("--multistream", action="store_true", help=f"write a multistream bz2 dump ({STREAM_PAGES} pages per stream) and its index")
+    args = arg_parser.parse_args()
+    if args.multistream and not args.out_path.endswith(".bz2"):
+        arg_parser.error("a multistream dump must end with .bz2")
+
+    write_dump(args.out_path, args.n_pages, args.seed, args.multistream)
+    print(f"Synthetic dump with {args.n_pages} pages saved at {args.out_path}.")
+    if args.multistream:
+        print(f"Multistream index saved at {multistream_index_path(args.out_path)}.")
+
+# from command line: python synthetic_dump.py 100000 synthetic-100k.xml.bz2 [--multistream]
@@ -0,0 +1,39 @@
+import os
+import sys
+import random
+import pytest
+
+# the modules of the repository are top-level scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_dump import make_page
+
+# Line corpus of the equivalence tests: the lines of synthetic pages (the layout of the real ones) and random lines made of
+# the markup fragments string_cleaner deals with, glued together or separated by spaces. The seeds are fixed.
+N_PAGES = 3000
+N_RANDOM_LINES = 60000
+LEMMAS = ["casa", "l'acqua", "abito-camicia", "perché", "New York", "C++", "a_b", "1°", "(test)", "[[x]]", "{{y}}", "A. B.", "sé stesso"]
+FRAGMENTS = ["{{Pn}}", "{{pn}}", "{{Pn|w}}", "{{Vd|casa}}", "{{Vd|Afghanistan#Italiano|Afghanistan}}", "{{vd|a|b}}", "{{Etim-link|casa}}",
+             "{{la}}", "{{grc}}", "{{xx}}", "{{Term|Sport|it}}", "{{term|Fisica}}", "{{Term|a b|it|x}}", "{{Est}}", "{{Fig}}", "{{Raro}}", "{{-sost-|it}}",
+             "{{", "}}", "{", "}", "[[", "]]", "[", "]", "[[casa]]", "[[casa|case]]", "[[:w:Roma|Roma]]", "[[File:x.jpg|thumb]]", "[[Immagine:y.png]]",
+             "<ref>nota</ref>", "<ref name=a/>", "<ref name=b>x</ref>", "<small>piccolo</small>", "<br/>", "</", "<", ">", "''", "'''", "'",
+             "#", "*", ":", ";", " ", "  ", "\t", ",", ".", "|", "(", ")", "-", "!", "?", "casa", "bello", "città", "perché", "uno due", "\\", "##x##"]
+
+
+def random_line(rng):
+    separator = rng.choice(["", " "])
+    return separator.join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12)))
+
+
+@pytest.fixture(scope="session")
+def line_corpus():
+    """(line, lemma) pairs"""
+    rng = random.Random(0)
+    corpus = []
+    for i in range(N_PAGES):
+        title, ns, text = make_page(rng, i)
+        if text != None:
+            corpus.extend((line, title) for line in text.split("\n"))
+    rng = random.Random(1)
+    corpus.extend((random_line(rng), rng.choice(LEMMAS)) for _ in range(N_RANDOM_LINES))
+    return corpus
@@ -0,0 +1,78 @@
+import os
+import sys
+import csv
+import html
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_cache import ResponseCache
+from onli_extract import record
+
+# Builds tests/onli_pages.jsonl, the corpus of tests/test_onli_extract.py and of the stand-in server of tests/onli_server.py, from
+# ONLI-NEO.csv: pages in the layout of the ONLI ones (doctype, script, style, comments, entities, CRLF line endings, the boxentry
+# of the entry pages with the diamondb/diamondv etymology and the pager of the index pages) are saved in a scraper cache, then
+# onli_extract.py record keeps the index pages and the entry pages they link. The pages are: the first index page of A, H, J, Q
+# and Y with their entries, and two entries for each of the rarer PoS (only the ones linked by those index pages are kept).
+# Recorded ONLI pages can replace them: python onli_extract.py record ONLI-NEO.cache.sqlite tests/onli_pages.jsonl 200
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_PATH = os.path.join(REPO_DIR, "ONLI-NEO.csv")
+OUT_PATH = os.path.join(REPO_DIR, "tests", "onli_pages.jsonl")
+BASE_URL = "https://www.iliesi.cnr.it/ONLI/"
+PER_PAGE = 50 # lemmas in an index page
+INDEX_PAGES = [("A", 1), ("H", 1), ("J", 1), ("Q", 1), ("Y", 1)]
+RARE_POS = ["acron", "verb", "pron", "loc", "loc agg", "loc avv"]
+POS = {"sost": "s. m.", "agg": "agg.", "verb": "v. tr.", "acron": "s. m.", "pron": "pron.", "loc": "loc.", "loc nom": "loc. s. f.", "loc agg": "loc. agg.", "loc avv": "loc. avv."}
+ENTITIES = {"à": "&agrave;", "è": "&egrave;", "é": "&eacute;", "ì": "&igrave;", "ò": "&ograve;", "ù": "&ugrave;", "«": "&laquo;", "»": "&raquo;", "’": "&#8217;"}
+HEAD = ('<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN">\r\n<html>\r\n<head>\r\n<meta http-equiv="Content-Type" content="text/html; charset=utf-8">\r\n'
+        '<title>ONLI - Osservatorio Neologico della Lingua Italiana</title>\r\n<link href="stile.css" rel="stylesheet" type="text/css">\r\n'
+        '<script type="text/javascript">function apri(url) { if (a < b && c > d) window.open(url, "<b>x</b>"); }</script>\r\n'
+        '<style type="text/css">p.x > b { color: #333; }</style>\r\n</head>\r\n<body>\r\n<!-- intestazione -->\r\n'
+        '<table width="100%" border="0"><tr><td class="menu"><a href="index.php">Home</a> | <a href="cerca.php">Ricerca</a> | <a href="elenca.php?al=A%&page=1">Lemmario</a></td></tr></table>\r\n')
+FOOT = '\r\n<!-- piede -->\r\n<div class="piede">&copy; ILIESI-CNR&nbsp;2024 &mdash; <a href="mailto:onli@iliesi.cnr.it">contatti</a></div>\r\n</body>\r\n</html>\r\n'
+
+
+def escape(text):
+    """Escapes the text like the ONLI pages, with named entities for the accented letters"""
+    return "".join(ENTITIES.get(c, c) for c in html.escape(text, quote=False))
+
+def entry_html(row):
+    tipo, formanti = row["etymology"].split(", Formanti:", 1)
+    tipo_label, tipo = tipo.split(":", 1)
+    examples = "".join(f"\r\n<li>{escape(example)}</li>" for example in row["examples"].split(" ** "))
+    return (HEAD + f'<table><tr><td><div class="boxentry"><b>{escape(row["lemma"])}</b> {POS[row["pos"]]}\r\n<i>(prima attestazione)</i></div></td></tr></table>\r\n'
+            f'<p class="tit">Definizione</p>\r\n<p>{escape(row["glossa"])}</p>\r\n<ul class="esempi">{examples}\r\n</ul>\r\n'
+            f'<p><b class="diamondb">{tipo_label}:</b>{escape(tipo)}<br>\r\n<b class="diamondv">Formanti:</b>{escape(formanti)}<br>\r\n<i>Nota</i>: scheda redatta per l&#39;ONLI</p>' + FOOT)
+
+def index_html(rows, ids, letter, page):
+    """An index page of a letter, ids are the rows of its lemmas"""
+    n_pages = max(1, -(-len(ids) // PER_PAGE))
+    links = "".join(f'\r\n<tr><td><a href="entrata.php?id={i}">{escape(rows[i]["lemma"])}</a></td></tr>' for i in ids[(page - 1) * PER_PAGE:page * PER_PAGE])
+    pager = f'<tr><td height="50" valign="bottom" align="center"> <a href="elenca.php?al={letter}%&page={page + 1}">&gt;&gt;</a> {page}/{n_pages} </td></tr>' if n_pages > 1 else ""
+    return HEAD + f'<table class="lemmi">{links}\r\n{pager}</table>' + FOOT
+
+def make_pages(csv_path=CSV_PATH, out_path=OUT_PATH):
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    by_letter = {}
+    for i, row in enumerate(rows):
+        by_letter.setdefault(row["lemma"][0].upper(), []).append(i)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = os.path.join(tmp_dir, "onli.cache.sqlite")
+        cache = ResponseCache(cache_path)
+        for letter, page in INDEX_PAGES:
+            ids = by_letter[letter]
+            cache.put(f"{BASE_URL}elenca.php?al={letter}%&page={page}", index_html(rows, ids, letter, page))
+            for i in ids[(page - 1) * PER_PAGE:page * PER_PAGE]:
+                cache.put(f"{BASE_URL}entrata.php?id={i}", entry_html(rows[i]))
+        for pos in RARE_POS:
+            for i in [i for i, row in enumerate(rows) if row["pos"] == pos][:2]:
+                cache.put(f"{BASE_URL}entrata.php?id={i}", entry_html(rows[i]))
+        cache.close()
+        record(cache_path, out_path)
+
+
+if __name__ == "__main__":
+    make_pages()
+
+# from command line: python tests/make_onli_pages.py
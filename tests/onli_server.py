@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import threading
+from urllib.parse import unquote
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in of the ONLI server for the scraper and cache tests: it serves the pages of tests/onli_pages.jsonl under /ONLI/,
+# with ETag and Last-Modified validators (a matching conditional request gets a 304 without body). The index pages of the letters
+# missing from the file are empty. Errors can be injected per page: fail(path, statuses) answers the next requests of the page with
+# the given statuses, fail_always(path, status) with status until heal(path). Every request is logged with its headers.
+
+PAGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onli_pages.jsonl")
+ONLI_URL = "https://www.iliesi.cnr.it/ONLI/"
+EMPTY_INDEX_PAGE = "<html><body><table><tr></tr></table></body></html>"
+
+
+def load_pages(pages_path=PAGES_PATH):
+    """{path: body} of the recorded pages, the paths are relative to the ONLI url (i.e. entrata.php?id=1)"""
+    with open(pages_path, encoding="utf-8") as f:
+        return {unquote(page["url"][len(ONLI_URL):]): page["body"] for page in map(json.loads, f)}
+
+
+class OnliServer:
+    """The server runs in a thread on a free port of localhost, base_url is the one to give to the scraper"""
+
+    def __init__(self, pages=None):
+        self.pages = load_pages() if pages == None else pages
+        self.failures = {} # path ---> statuses of the next requests
+        self.always_failing = {} # path ---> status
+        self.requests = [] # (path, headers) of every request
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            wbufsize = 1 << 16 # headers and body in one send, an unbuffered body waits for the delayed ack of the headers
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}/ONLI/"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def fail(self, path, statuses):
+        with self.lock:
+            self.failures[path] = list(statuses)
+
+    def fail_always(self, path, status=503):
+        with self.lock:
+            self.always_failing[path] = status
+
+    def heal(self, path=None):
+        """Stops the injected errors of a page (of all the pages if path is None)"""
+        with self.lock:
+            for failures in [self.failures, self.always_failing]:
+                if path == None:
+                    failures.clear()
+                else:
+                    failures.pop(path, None)
+
+    def requested(self, path):
+        """Number of requests of a page"""
+        with self.lock:
+            return sum(1 for requested_path, _ in self.requests if requested_path == path)
+
+    def requested_paths(self):
+        with self.lock:
+            return [path for path, _ in self.requests]
+
+    def body(self, path):
+        if path in self.pages:
+            return self.pages[path]
+        if path.startswith("elenca.php"):
+            return EMPTY_INDEX_PAGE
+        return None
+
+    def handle(self, request):
+        path = unquote(request.path)
+        path = path[len("/ONLI/"):] if path.startswith("/ONLI/") else path
+        with self.lock:
+            self.requests.append((path, dict(request.headers)))
+            if self.failures.get(path):
+                status = self.failures[path].pop(0)
+            else:
+                status = self.always_failing.get(path)
+        body = self.body(path)
+        if status != None:
+            self.send(request, status, b"busy")
+        elif body == None:
+            self.send(request, 404, b"not found")
+        else:
+            body = body.encode("utf-8")
+            etag = '"' + hashlib.md5(body).hexdigest() + '"'
+            last_modified = formatdate(0, usegmt=True)
+            if request.headers.get("If-None-Match") == etag or (request.headers.get("If-None-Match") == None and request.headers.get("If-Modified-Since") == last_modified):
+                self.send(request, 304, b"", etag, last_modified)
+            else:
+                self.send(request, 200, body, etag, last_modified)
+
+    def send(self, request, status, body, etag=None, last_modified=None):
+        request.send_response(status)
+        request.send_header("Content-Type", "text/html; charset=utf-8")
+        request.send_header("Content-Length", str(len(body)))
+        if etag != None:
+            request.send_header("ETag", etag)
+            request.send_header("Last-Modified", last_modified)
+        request.end_headers()
+        request.wfile.write(body)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,520 @@
+import re
+
+# Frozen copies of the text helpers of iterparse.py as they were before they were optimized: string_cleaner with its regex passes
+# in their original order, the recursive trimming helpers, lang_check and the state machine of parse_page (PageParser, before its
+# prefilters). They are the reference of the equivalence tests, don't change them.
+# (The patterns are the original ones, written as raw strings.)
+
+punctuation = '!"$%&\')*+,-./:;<=>?@[\\]^_`{|}~ ' # all punct + white space excluding the "#" special character used for Term tags
+
+lang_pattern = re.compile(r"=={{-?(.+?)-?}}==")
+vedi_pattern = re.compile(r"{{[Vv]d\|(.*?)}}")
+special_redirect_pattern = re.compile(r"\[\[[^\[\]]+?\|(.+?)\]\]")
+redirect_pattern = re.compile(r"\[\[(.*?)\]\]")
+quote_marks_pattern = re.compile(r"'{2,3}")
+etimlink_pattern = re.compile(r"{{Etim-link\|(.*?)}}")
+file_pattern = re.compile(r"\[\[File:.*?\]\]")
+ref_pattern = re.compile(r"<ref.*?>.*?<\/ref>|<ref.*?\/>")
+general_tag_pattern = re.compile(r"<.+?>(.+?)<\/.+?>")
+lang_pointer_pattern = re.compile(r"{{(\w+)}}")
+tag_term_pattern = re.compile(r"\{\{[Tt]erm\|([\w ]+)(?:\|it)?(?:[\|\w ])*\}\}")
+white_spaces_pattern = re.compile(r"\s{2,}")
+pos_pattern = re.compile(r"{{-(.*?)-\|(?:\|?.*?)*}}")
+morpho_pattern = re.compile(r"{{[Pp][Nn].*?}}(?:\s{1,5})?''\s?((?:m|f|inv).*?)\s?''\s?(?: e ''((?:m|f|inv).*?)\s?'')?")
+ipa_pattern = re.compile(r"{{IPA\|\/(.*?)\/}}")
+sill_pattern = re.compile(r"{{-sill-}}")
+etim_pattern = re.compile(r"{{-etim-}}")
+noetim_pattern = re.compile(r"{{Noetim\|it}}")
+nodef_pattern = re.compile(r"{{Nodef\|it}}")
+pron_pattern = re.compile(r"{{-pron-}}")
+closing_tag_pattern = re.compile(r"<.+?/>")
+template_utili_pattern = re.compile(r"<!-- altri template utili:")
+sin_ant_pattern = re.compile(r"{{-(sin)-}}|{{-(ant)-}}")
+hash_pattern = re.compile(r"(##.*?##)")
+
+
+def remove_list_tokens(line):
+    """Recursively removes special tokens (*, #, :) at the beginning of a line in a list."""
+    if line == "":
+        return line
+    if line[0] in ["*", "#", ":"]:
+        return remove_list_tokens(line[1:])
+    else:
+        return line
+
+def remove_punct_at_start(line):
+    """Recursively removes punctuation at the beginning of a string often resulting from the text cleaning"""
+    if line == "":
+        return line
+    elif line[0] in punctuation:
+        return remove_punct_at_start(line[1:])
+    else:
+        return line
+
+def remove_punct_at_end(line):
+    """Recursively removes punctuation at the end of a string often resulting from the text cleaning"""
+    reverse_line = line[::-1]
+    if line == "":
+        return line
+    elif reverse_line[0] in punctuation:
+        return remove_punct_at_start(reverse_line[1:])[::-1]
+    else:
+        return line
+
+def clean_indent_and_spaces(line):
+    """Removes the first character if it is a special character (*, #, :) or a space and recursively calls itself"""
+    if len(line) > 0 and line[0] in ["*", "#", ":", " "]:
+        return clean_indent_and_spaces(line[1:])
+    else:
+        return line.strip()
+
+def lang_check(line):
+    """Check for the italian language tag, usually something like =={{-it-}}== (without the creation of the entry)"""
+    line = line.replace(" ", "") # removing white spaces for conformity
+    match =  re.search(lang_pattern, line)
+    if match != None: # if we found a lang tag
+        lang = match.group(1)
+        if lang == None:
+            lang = match.group(2)
+        if lang == "it":
+            return lang, True
+        else:
+            return lang, False
+    else:
+        return 0, False
+
+def string_cleaner(line, lemma, lang_dict, ambito_dict):
+    """Cleans a string from the usual wikimedia tags"""
+    line = remove_list_tokens(line)
+    cleaned_line = re.sub("{{Pn}}|{{pn}}", lemma, line)
+    cleaned_line = re.sub(ref_pattern, "", cleaned_line)
+    cleaned_line = re.sub(file_pattern, "", cleaned_line)
+    cleaned_line = re.sub(vedi_pattern, lambda m: "vedi " + m.group(1).split("|")[1] if "|" in m.group(1) else "vedi " + m.group(1) , cleaned_line) # {{Vd|Afghanistan#Italiano|Afghanistan}} ---> vedi Afghanistan
+    cleaned_line = re.sub(etimlink_pattern, lambda m: f"vedi {m.group(1)}", cleaned_line)
+    cleaned_line = re.sub(lang_pointer_pattern, lambda m: lang_dict.get(m.group(1), m.group(0)), cleaned_line)
+    cleaned_line = re.sub(tag_term_pattern, r"##\1##", cleaned_line)
+    cleaned_line = re.sub(r"({{\w*?}})", lambda m: ambito_dict.get(m.group(0)), cleaned_line)
+    cleaned_line = re.sub(r"{{.*?}}", "", cleaned_line)
+    cleaned_line = re.sub(special_redirect_pattern, r"\1", cleaned_line)
+    cleaned_line = re.sub(redirect_pattern, r"\1", cleaned_line)
+    cleaned_line = re.sub(r"\[\[\w.*?\]\]", "", cleaned_line)
+    cleaned_line = re.sub(quote_marks_pattern, "", cleaned_line)
+    cleaned_line = re.sub(general_tag_pattern, r"\1", cleaned_line)
+    cleaned_line = re.sub(white_spaces_pattern, " ", cleaned_line)
+    cleaned_line = remove_punct_at_start(cleaned_line)
+    cleaned_line = cleaned_line.strip()
+
+    return cleaned_line
+
+def new_entry():
+    """Returns an empty lemma dictionary"""
+    return {"meta": {"ipa": [], "sill": [], "etim": "", "sin": [], "ant": []}, "meanings": {}}
+
+def sill_splitter(line):
+    """Split the syllables """
+
+    sill = []
+    current_sill = ""
+    line = line.strip()
+    line = line.replace("'", "")
+    line = re.sub(closing_tag_pattern, "", line)
+    for i in range(len(line)):
+        char = line[i]
+        if char == " ":
+            continue
+        elif char == "|" and current_sill != "":
+            sill.append(current_sill)
+            current_sill = ""
+        elif char in ["-", "–"] and current_sill != "":
+            sill.append(current_sill)
+            sill.append("-")
+            current_sill = ""
+        elif i == len(line)-1:
+            current_sill += char
+            sill.append(current_sill)
+        else:
+            current_sill += char
+
+    sill = [x for x in sill if x != ""]
+
+    return sill
+
+def clean_sin_ant(text):
+    """Splits sin and ant"""
+    inside_par = False
+    clean_text = ""
+    par_text = ""
+    hashs = re.findall(hash_pattern, text)
+    text = re.sub(hash_pattern, "", text)
+    for c in text:
+        if c == "(":
+            inside_par = True
+        elif c == ")":
+            par_text+=c+" "
+            inside_par = False
+            continue
+        if inside_par:
+            par_text+=c
+        else:
+            clean_text+=c
+    clean_text = clean_text.replace(";", ",")
+    par_text+= " ".join(hashs)
+    clean_text = remove_punct_at_start(clean_text)
+    if "," not in par_text and par_text != "":
+        return par_text.strip()+" ** "+clean_text.strip()
+    else:
+        return clean_text
+
+
+class PageParser:
+    """WiktionaryPageParser before the prefilters of parse_page: every check runs its own search on every line"""
+
+    def __init__(self, lang_dict, pos_converter_dict, ambito_dict):
+        self.lang_dict = lang_dict
+        self.pos_converter_dict = pos_converter_dict
+        self.ambito_dict = ambito_dict
+
+    def lang_check(self, line):
+        return lang_check(line)
+
+    def pron_check(self, line):
+        """Checks for the pronouce tag {{pron}}"""
+        match = re.search(pron_pattern, line)
+        if match != None:
+            return True
+
+    def get_ipa(self, line, entry):
+        """Extracts IPA from a line"""
+        match = re.search(ipa_pattern, line) # ipa
+        if match != None:
+            ipa = match.group(1)
+            entry["meta"]["ipa"].append(ipa)
+            return True
+        else:
+            return False
+
+    def sill_check(self, line):
+        """Checks for the {{sill}} tag"""
+        match = re.search(sill_pattern, line) # sill
+        if match != None:
+            return True
+
+    def get_sill(self, line, entry):
+        """Extracts the syllables from a line"""
+        if line[0] == ";":
+            line = line[1:]
+            if line == " &lt;!-- inserire dopo le ; la sillabazione indicando l'accento e dividendo con un | come nell'esempio: sol | dà | to --&gt;": # common placeholder for wrong syllabation
+                return False
+            sill_split = sill_splitter(line) # it splits the sill string into ["ca", "sa"] for example, handles multi word lemmas too (usually separated with "-")
+            if sill_split == [""] or len(max(sill_split, key=len, default="")) > 7:
+                return False
+            entry["meta"]["sill"] = sill_split
+            return True
+        else:
+            return False
+
+    def unk_pos(self, entry):
+        """Adds the "unk" (unknown) PoS tag to a lemma"""
+        pos = "unk" # default option due to inconsistencies in the italian wiktionary tag system
+        entry["meanings"][pos] = {"morpho":"", "glossa":""}
+        return pos
+
+    def check_pos(self, entry, line, i_pos, current_pos):
+        """Checks for the PoS pattern and retrieves the available PoS"""
+        match = re.search(pos_pattern, line) # pos
+        if match != None:
+            pos = match.group(1)
+            if pos in ["sill", "noconf", "pron", "trad", "alter", "ant", "etim"]:
+                return current_pos
+            if pos in self.pos_converter_dict:
+                pos = self.pos_converter_dict[pos]
+            pos = re.sub(white_spaces_pattern, " ", pos)
+            pos = pos.strip() + f"_{i_pos}"
+            if pos != current_pos and pos != f"Varie lingue_{i_pos}":
+                current_pos = pos
+                entry["meanings"][pos] = {"morpho":"", "glossa":""}
+                if "unk" in entry["meanings"]:
+                    del entry["meanings"]["unk"] # if we find a PoS we delete the "unk" one
+            return pos
+        else:
+            return current_pos
+
+    def morpho_check(self, line, entry, pos):
+        """Checks and extracts morphological metadata (i.e. "f sing" from a typical morpho line: {{Pn|w}} ''f sing'' )"""
+        match = re.search(morpho_pattern, line) # informazioni morfologiche
+        if match != None:
+            morpho = ""
+            for group in match.groups():
+                if group != None:
+                    if morpho == "":
+                        morpho += group
+                    else:
+                        morpho += " e "+group
+            morpho = remove_punct_at_start(morpho.strip())
+            morpho = re.sub(white_spaces_pattern, "", morpho)
+            entry["meanings"][pos]["morpho"] = morpho
+            return True
+
+    def etim_check(self, line):
+        """Checks for the {{etim}} tag"""
+        match = re.search(etim_pattern, line)
+        if match != None:
+            return True
+
+    def noetim_check(self, line):
+        """Checks for the {{Noetim|it}} tag. Usually used when the etim is missing"""
+        match = re.search(noetim_pattern, line)
+        if match != None:
+            return True
+
+    def sin_ant_check(self, line):
+        match = re.search(sin_ant_pattern, line)
+        tag = ""
+        if match != None:
+            for g in match.groups():
+                if g != None:
+                    tag = g
+            return tag
+        else:
+            return False
+
+    def nodef_check(self, line):
+        """Checks for the {{Nodef|it}} tag. Usually used when the glossa is missing"""
+        match = re.search(nodef_pattern, line)
+        if match != None:
+            return True
+
+    def template_utili_check(self, line):
+        """Checks for the "template utili" line"""
+        match = re.search(template_utili_pattern, line)
+        if match != None:
+            return True
+        else:
+            return False
+
+    def other_tags_check(self, line):
+        """Tags that usually follows the one we are interested in. So if we find them we break. The order is taken from https://it.wiktionary.org/wiki/Wikizionario:Altri_titoli"""
+        other_tag = ["{{-der-}}", "{{-rel-}}", "{{-var-}}", "{{-alter-}}", "{{-ipon-}}", "{{-iperon-}}", "{{-noconf-}}", "{{-prov-}}", "{{-trad-}}", "{{Trad1}}", "{{Trad2}}", "{{-ref-}}", "==Altri progetti==", "{{interprogetto}}"]
+        line = line.strip()
+        for tag in other_tag:
+            if tag == line:
+                return True
+
+    def string_cleaner(self, line, lemma):
+        return string_cleaner(line, lemma, self.lang_dict, self.ambito_dict)
+
+    def get_etim(self, line, lemma, entry):
+        """Extracts and parses the etim"""
+        cleaned_line = self.string_cleaner(line, lemma)
+        if cleaned_line == "":
+            return
+        if entry["meta"]["etim"] == "":
+            entry["meta"]["etim"] += cleaned_line
+        else:
+            entry["meta"]["etim"] += "\n"+cleaned_line
+
+    def get_sin_ant(self, line, lemma, entry, sin_ant):
+        """Extracts and parses the synonym and antonym informations"""
+        cleaned_line = self.string_cleaner(line, lemma)
+        cleaned_line = remove_punct_at_end(cleaned_line)
+        cleaned_line = clean_sin_ant(cleaned_line)
+        if cleaned_line == "":
+            return
+        entry["meta"][sin_ant].append(cleaned_line)
+
+    def glossa_check(self, line, lemma, entry, pos):
+        """Extracts and parses the glossa"""
+        cleaned_line = self.string_cleaner(line, lemma)
+        if cleaned_line == "":
+            return
+        if entry["meanings"][pos]["glossa"] == "":
+            entry["meanings"][pos]["glossa"] += cleaned_line
+        else:
+            entry["meanings"][pos]["glossa"] += "\n"+cleaned_line
+
+    def example_check(self, line):
+        """Checks if the line is in italic and therefore an example"""
+        # match = re.search(example_pattern, line)
+        match = "''" in line
+        # if match != None:
+        #     return True
+        # else:
+        #     return False
+        return match
+
+    def get_examples(self, line, lemma, entry, pos):
+        """Extracts and parses usage examples from the glossa"""
+        # example = re.search(example_pattern, line).group(1)
+        example = line
+        cleaned_line = self.string_cleaner(example, lemma)
+        if cleaned_line == "":
+            return
+
+        entry["meanings"][pos]["glossa"] += f"[ESEMPIO: {cleaned_line}]"
+
+    def parse_page(self, title, wikitext):
+        """Parses the wikitext of a single page. Returns the italian lemma dictionary or None if the page has no italian entry"""
+        lemma = title
+        glossa = wikitext
+        if ":" in lemma or lemma in ["Pagina principale", "Pagina principale/Categorie"]:
+            return None
+        if glossa == None:
+            return None
+
+        entry = None
+        current_pos = ""
+        lang_found = False
+        sill_flag = False
+        unk_pos_flag = False
+        elenco_flag = False
+        etim_flag = False
+        pron_flag = False
+        sin_ant_flag = False
+        i_pos = 0
+
+        try:
+            lines = glossa.splitlines()
+            for i in range(len(lines)): # iterating one line at a time (this modus operandi is due to the non closing nature of the wiktionary tamplate. Also, glosses are not introduced by templates)
+                line = lines[i]
+
+                if line == "":
+                    sin_ant_flag = False
+                    sill_flag = False
+                    etim_flag = False
+                    pron_flag = False
+                    continue
+
+                if line[0] == "<":
+                    if self.template_utili_check(line): # line usually found at the end of a glossa referencing templates
+                        break # we break it here since a lot of template tags could trigger the boolean flags
+
+                if pron_flag:
+                    pron_flag = self.get_ipa(line, entry)
+                    if pron_flag:
+                        continue # there can be more than one IPA
+
+                if sill_flag:
+                    found = self.get_sill(line, entry)
+                    if found:
+                        sill_flag = False
+                        continue
+                    else:
+                        sill_flag = False
+
+                if etim_flag:
+                    if self.noetim_check(line):
+                        etim_flag = False
+                        continue
+                    if line[0] == "#" or line[0] == "*" or line[0] == ":":
+                        self.get_etim(line, lemma, entry)
+                        continue
+                    else:
+                        self.get_etim(line, lemma, entry)
+                        etim_flag = False
+                        continue
+
+                if sin_ant_flag != False:
+                    if line[0] in ["*", "#"]:
+                        self.get_sin_ant(line, lemma, entry, sin_ant_flag)
+                        continue
+                    else:
+                        sin_ant_flag = False
+
+                if line.find("{{Vedi|") != -1:
+                    continue
+                if line[0] == "[": # images
+                    continue
+
+                if line[0] == "=":
+                    elenco_flag = False
+                    lang, lang_found = self.lang_check(line)
+                    if lang == 0: # if the line starts with "=" but do not contains lang information (rare)
+                        continue
+                    if lang != "it":
+                        if entry != None: # if lang is different form "it" and we already have the lemma
+                            break # it means we already got an italian tag and we are moving into a different language, so we break
+                        else:
+                            continue # else we keep on iterating hoping to find an italian tag
+                    if lang_found:
+                        entry = new_entry()
+                        continue
+
+                if not lang_found:
+                    continue
+
+                if not unk_pos_flag: # default pos unk
+                    current_pos = self.unk_pos(entry)
+                    unk_pos_flag = True
+
+                if line.strip()[:2] == "{{":
+                    if self.other_tags_check(line):
+                        break
+
+                pos = self.check_pos(entry, line, i_pos, current_pos)
+                if pos == "sill": # there are 4 cases where the sill tag is written like a PoS, this if statement handles this. (Due to bad annotation)
+                    sill_flag = True
+                    continue
+                elif pos == "pron": # only one case (also bad annotation)
+                    pron_flag = True
+                    continue
+                elif pos == "etim":
+                    etim_flag = True
+                    continue
+                if current_pos != pos:
+                    elenco_flag = False
+                    etim_flag = False
+                    i_pos +=1
+                    current_pos = pos
+                    continue
+
+                pron_flag = self.pron_check(line)
+                if pron_flag:
+                    elenco_flag = False
+                    continue
+
+                sill_flag = self.sill_check(line)
+                if sill_flag:
+                    elenco_flag = False
+                    continue
+
+                if self.morpho_check(line, entry, current_pos):
+                    elenco_flag = False
+                    continue
+
+                etim_flag = self.etim_check(line)
+                if etim_flag:
+                    elenco_flag = False
+                    continue
+
+                sin_ant_flag = self.sin_ant_check(line)
+                if sin_ant_flag != False:
+                    elenco_flag = False
+                    continue
+
+                if line[0] == "#": # it introduces glosses or examples (usually...)
+                    if self.nodef_check(line):
+                        continue
+                    if line == "":
+                        continue
+                    n_indent = sum(1 for c in line[:4] if c in ["#", "*", ":"])
+                    line = clean_indent_and_spaces(line)
+                    if self.example_check(line) and n_indent > 1: # with this we assume that examples are always in italic
+                        self.get_examples(line, lemma, entry, current_pos)
+                    else: # and glossa are not in italic
+                        self.glossa_check(line, lemma, entry, current_pos)
+                #     try:
+                #         if line[1] in ["*", ":", "#"] and not elenco_flag: # from the guidelines one indentation indicates usage examples, although this is not always the case
+                #             if example_check(line):
+                #                 get_examples(line, lemma, current_pos)
+                #             continue
+                #     except IndexError:
+                #         continue # if line[1:] is empty
+                #     glossa_check(line, lemma, current_pos, elenco_flag)
+                # else:
+                #     elenco_flag = False
+
+        except Exception as e:
+            print("ERROR at lemma", lemma)
+            raise e
+
+        return entry
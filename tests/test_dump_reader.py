@@ -0,0 +1,97 @@
+import bz2
+import gzip
+import random
+import pytest
+import dump_reader
+from dump_reader import scan_pages, read_multistream_index, iter_selected_pages
+from iterparse import iter_pages
+from synthetic_dump import write_dump, multistream_index_path
+
+# scan_pages against the ElementTree reader of iterparse.iter_pages: same (title, text) pairs on a synthetic dump and on a small dump
+# with the edge cases of the byte scan (entities, CR and CRLF line endings, empty and self closing <text>, other namespaces), plain and compressed.
+# The selection of the pages of a multistream dump through its index against the pages of a full read. A reader stopped early closes the dump.
+
+N_PAGES = 2000
+EDGE_DUMP = (b'<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="it">\r\n'
+             b"  <siteinfo>\r\n    <sitename>Wikizionario</sitename>\r\n  </siteinfo>\r\n"
+             b"  <page>\r\n    <title>citt\xc3\xa0 &amp; paese</title>\r\n    <ns>0</ns>\r\n    <id>1</id>\r\n    <revision>\r\n      <id>7</id>\r\n"
+             b'      <text bytes="60" xml:space="preserve">== {{-it-}} ==\r\n# &lt;b&gt;caf&#233;&lt;/b&gt; &quot;&#x41;&apos; &amp;lt;\rfine\r\n</text>\r\n'
+             b"    </revision>\r\n  </page>\r\n"
+             b"  <page>\n    <title>Template:Pn</title>\n    <ns>10</ns>\n    <id>2</id>\n    <revision>\n      <id>14</id>\n"
+             b'      <text bytes="5" xml:space="preserve">{{Pn}}</text>\n    </revision>\n  </page>\n'
+             b"  <page>\n    <title>vuota</title>\n    <ns>0</ns>\n    <id>3</id>\n    <revision>\n      <id>21</id>\n"
+             b'      <text bytes="0" />\n    </revision>\n  </page>\n'
+             b"  <page>\n    <title>vuota2</title>\n    <ns>0</ns>\n    <id>4</id>\n    <revision>\n      <id>28</id>\n"
+             b'      <text bytes="0" xml:space="preserve"></text>\n    </revision>\n  </page>\n'
+             b"  <page>\n    <title></title>\n    <ns>0</ns>\n    <id>5</id>\n    <revision>\n      <id>35</id>\n"
+             b'      <text xml:space="preserve">senza titolo &#13;</text>\n    </revision>\n  </page>\n'
+             b"  <page>\n    <title>Wikizionario:Bar</title>\n    <ns>4</ns>\n    <id>6</id>\n    <revision>\n      <id>42</id>\n"
+             b'      <text xml:space="preserve">discussione\r\n</text>\n    </revision>\n  </page>\n'
+             b"</mediawiki>\r\n")
+
+
+def compressed_copies(path):
+    """The dump itself and its .bz2 and .gz copies"""
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + ".bz2", "wb") as f:
+        f.write(bz2.compress(data))
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data))
+    return [path, path + ".bz2", path + ".gz"]
+
+@pytest.fixture(scope="module")
+def synthetic_dumps(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dumps") / "synthetic.xml")
+    write_dump(path, N_PAGES, seed=3)
+    return compressed_copies(path)
+
+@pytest.fixture(scope="module")
+def edge_dumps(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("dumps") / "edge.xml")
+    with open(path, "wb") as f:
+        f.write(EDGE_DUMP)
+    return compressed_copies(path)
+
+def test_synthetic_dump(synthetic_dumps, monkeypatch):
+    monkeypatch.setattr(dump_reader, "PAGE_CHUNK_SIZE", 4096) # many pages across the chunks of the compressed dumps
+    for path in synthetic_dumps:
+        pages = list(scan_pages(path, main_namespace_only=False))
+        assert len(pages) == N_PAGES
+        assert pages == list(iter_pages(path, "etree")), path
+
+def test_edge_cases(edge_dumps, monkeypatch):
+    monkeypatch.setattr(dump_reader, "PAGE_CHUNK_SIZE", 64)
+    for path in edge_dumps:
+        pages = list(scan_pages(path, main_namespace_only=False))
+        assert pages == list(iter_pages(path, "etree")), path
+        assert pages[0] == ("città & paese", "== {{-it-}} ==\n# <b>café</b> \"A' &lt;\nfine\n")
+        assert [title for title, text in scan_pages(path)] == ["città & paese", "vuota", "vuota2", "None"]
+
+def test_multistream_selection(synthetic_dumps, tmp_path):
+    path = str(tmp_path / "synthetic-multistream.xml.bz2")
+    write_dump(path, N_PAGES, seed=3, multistream=True)
+    pages = list(iter_pages(synthetic_dumps[0], "etree"))
+    assert list(iter_pages(path, "etree")) == pages # the streams decompressed in parallel
+    rng = random.Random(0)
+    titles = set(rng.sample([title for title, text in pages], 10)) | {"assente", pages[0][0], pages[-1][0]} # first and last stream
+    title_offsets, stream_ends = read_multistream_index(multistream_index_path(path), titles)
+    assert set(title_offsets) == titles - {"assente"}
+    assert len(stream_ends) < N_PAGES // 100
+    selected = list(iter_selected_pages(path, title_offsets, stream_ends, threads=2))
+    assert selected == [(title, text) for title, text in pages if title in titles]
+
+def test_early_stop_closes_the_dump(synthetic_dumps, monkeypatch):
+    opened = []
+    original_open_dump = dump_reader.open_dump
+    def open_dump(path, threads=None):
+        opened.append(original_open_dump(path, threads))
+        return opened[-1]
+    monkeypatch.setattr(dump_reader, "open_dump", open_dump)
+    for path in synthetic_dumps:
+        for reader in ["etree", "bytes"]:
+            pages = iter_pages(path, reader)
+            next(pages)
+            pages.close()
+    assert len(opened) == 5 # the plain dump is memory mapped by the bytes reader
+    assert all(dump.closed for dump in opened)
@@ -0,0 +1,62 @@
+import os
+import importlib.util
+import pytest
+from http_cache import ResponseCache
+from onli_server import OnliServer
+
+# ResponseCache with the client of onli-scraper.py against the local stand-in server of onli_server.py: a cached page is requested
+# with its validators and a 304 gives back the cached body. Without the server: the LRU eviction keeps the cache under its size limit.
+
+SCRAPER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "onli-scraper.py")
+
+
+@pytest.fixture(scope="module")
+def scraper():
+    spec = importlib.util.spec_from_file_location("onli_scraper", SCRAPER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def server():
+    server = OnliServer()
+    yield server
+    server.close()
+
+def test_conditional_requests(scraper, server, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    client = scraper.OnliClient(server.base_url, rate=1000, retries=0, cache=cache)
+    path = "entrata.php?id=1"
+    body, changed = client.fetch(path)
+    assert body == server.pages[path] and changed
+    assert "If-None-Match" not in server.requests[-1][1] and "If-Modified-Since" not in server.requests[-1][1]
+    body, etag, last_modified = cache.get(server.base_url + path)
+    assert body == server.pages[path] and etag != None and last_modified != None
+
+    assert client.fetch(path) == (server.pages[path], False) # a 304, the body comes from the cache
+    headers = server.requests[-1][1]
+    assert headers["If-None-Match"] == etag and headers["If-Modified-Since"] == last_modified
+
+    server.pages[path] = server.pages[path].replace("</body>", "<p>nuovo</p></body>") # the page changed, a 200 with the new body
+    assert client.fetch(path) == (server.pages[path], True)
+    assert cache.get(server.base_url + path)[0] == server.pages[path]
+    client.close()
+    cache.close()
+
+def test_eviction(tmp_path):
+    max_size = 10000
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_size)
+    for i in range(100):
+        cache.put(f"http://x/{i}", str(i % 10) * 700, f'"{i}"')
+        if i == 50:
+            assert cache.get("http://x/40") != None # recently used, it outlives the responses put after it
+        if i == 60:
+            assert cache.get("http://x/41") == None and cache.get("http://x/40") != None
+        assert cache.size <= max_size
+    assert cache.size == sum(len(cache.get(f"http://x/{i}")[0]) for i in range(100) if cache.get(f"http://x/{i}") != None)
+    assert cache.get("http://x/99")[0] == "9" * 700
+    assert cache.get("http://x/0") == None
+    cache.close()
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_size) # the size is read back from the file
+    assert 0 < cache.size <= max_size
+    cache.close()
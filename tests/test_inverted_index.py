@@ -0,0 +1,22 @@
+from inverted_index import IndexBuilder, InvertedIndex
+
+# The postings returned by a lookup are copies: they can be kept after the index is closed
+
+
+def entry(pos_keys, glossa=""):
+    return {"meta": {"ipa": [], "sill": [], "etim": "", "sin": [], "ant": []}, "meanings": {pos_key: {"morpho": "", "glossa": glossa} for pos_key in pos_keys}}
+
+def test_lookup_after_close(tmp_path):
+    builder = IndexBuilder()
+    builder.add("casa", entry(["sost_1"], "##Architettura## edificio"))
+    builder.add("bello", entry(["agg_1"]))
+    builder.add("abito", entry(["sost_1", "verb form_1"]))
+    index_path = str(tmp_path / "it-dictionary.index")
+    builder.save(index_path)
+    with InvertedIndex(index_path) as index:
+        sost = index.lookup("pos", "sost")
+        tags = index.lookup("tag", "architettura")
+        lemmas = index.lemmas(index.query(["pos:sost", "pos:verb form"]))
+    assert list(sost) == [0, 2] # abito, casa
+    assert list(tags) == [2]
+    assert lemmas == ["abito"]
@@ -0,0 +1,13 @@
+from iterparse import WiktionaryPageParser
+import original_helpers
+
+# The prefilters of the per-line checks of parse_page must not change their results
+
+HEADERS = ["=={{-it-}}==", "== {{-it-}} ==", "=={ {-it-}}==", "== { {-it-} } ==", "==  {{ -it- }}  ==", "=={{it}}==", "== {{-en-}} ==", "={{-it-}}=",
+           "=={-it-}==", "{{-it-}}", "== Italiano ==", ""]
+
+
+def test_lang_check(line_corpus):
+    parser = WiktionaryPageParser()
+    for line in HEADERS + [line for line, _ in line_corpus]:
+        assert parser.lang_check(line) == original_helpers.lang_check(line), line
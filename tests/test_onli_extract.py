@@ -0,0 +1,105 @@
+import os
+import json
+import random
+import pytest
+from onli_extract import parse_html, extract_entry, extract_entry_reference, extract_index_page, extract_index_page_reference, entry_pages, try_extract
+from onli_extract import Node, Markup, CData
+
+bs4 = pytest.importorskip("bs4")
+
+# The ONLI extraction against the original BeautifulSoup code: same fields on the pages of tests/onli_pages.jsonl (the index pages
+# and the entry pages they link, built from ONLI-NEO.csv by tests/make_onli_pages.py) and on damaged copies of them, same tree on random markup.
+
+PAGES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onli_pages.jsonl")
+N_DAMAGED = 1500
+N_SNIPPETS = 5000
+# inserted at random positions of the pages
+INSERTS = ["<!-- c -->", "<!--x<b>-->", "<script>a<b>c</script>", "<style>p{}</style>", "&amp;", "&amp", "&foo;", "&#150;", "&#x41;", "&#0;", "&lt",
+           "<br>", "<br/>", "</br>", "</p>", "<p>", "</ul>", "<ul>", "<li>", "</li>", "<i>", "</i>", "</b>", "<b class='diamondb x'>", "<b class=diamondv>",
+           "<!DOCTYPE html>", "<?xml x?>", "< notatag", "a < b", "</ >", "<P>", "</P>", "<img src=x/>", "<div class=\"boxentry\">", "</div>", "\r\n", " ",
+           "<td height=50 valign=bottom align=center>Pag 1/3</td>", "<a href='entrata.php?id=9'>zz &amp; y</a>", "<a href=entrata.php>", "<![CDATA[x]]>",
+           "<span title='a>b'>", "<p/>", "<ul/>", "&nbsp;", "&eacute", "&Eacute;x", "<textarea>", "<pre>", "<template>", "<rt>"]
+# random markup made of these fragments
+FRAGMENTS = ["<p>", "</p>", "<b class=' a  b '>", "</b>", "<br>", "</br>", "<br/>", "<img src=x>", "<pre>", "</pre>", "<textarea>", "</textarea>", "<rt>", "</rt>",
+             "<rp>", "<template>", "</template>", "<script>", "</script>", "<style>", "</style>", "<!-- c -->", "<!---->", "<!DOCTYPE html>", "<![CDATA[ x ]]>",
+             "<![CDATA[  ]]>", "<?pi x?>", "&amp;", "&amp", "&ampx", "&unknown;", "&#65;", "&#x41;", "&#0;", "&#150;", "&#129;", "&#xD800;", "&#99999999;", "&#",
+             "&#x", "&", " ", "\n", "\r\n", "\t", "x", "testo", "é", "<", ">", "</", "< b>", "<a href=\"entrata.php?x=1&amp;y\">", "</a>", "<div class=boxentry>",
+             "</div>", "<p/>", "<li>", "</ul>", "<ul>", "<span title='a>b'>", "<i", "</i >", "</ i>", "<A HREF=x>", "</A>", "<input/>", "<b/>", "</html>", "<html>"]
+
+
+@pytest.fixture(scope="module")
+def pages():
+    """(url, body) pairs"""
+    with open(PAGES_PATH, encoding="utf-8") as f:
+        return [(page["url"], page["body"]) for page in map(json.loads, f)]
+
+@pytest.fixture(scope="module")
+def entries(pages):
+    return entry_pages(pages)
+
+def damage(rng, html):
+    for _ in range(rng.randint(1, 6)):
+        i = rng.randrange(len(html) + 1)
+        r = rng.random()
+        if r < 0.7:
+            html = html[:i] + rng.choice(INSERTS) + html[i:]
+        elif r < 0.85:
+            html = html[:i] + html[i + rng.randint(1, 20):]
+        else:
+            j = rng.randrange(len(html) + 1)
+            html = html[:i] + html[j:j + 30] + html[i:]
+    return html
+
+def extract_index(extract, html):
+    try:
+        return extract(html)
+    except Exception:
+        return None
+
+def test_entry_pages(entries):
+    assert len(entries) > 0
+    for lemma, body in entries:
+        fields = extract_entry(body, lemma)
+        assert fields == extract_entry_reference(body, lemma), lemma
+
+def test_index_pages(pages):
+    index_pages = [body for url, body in pages if "elenca.php" in url]
+    assert len(index_pages) > 0
+    for body in index_pages:
+        assert extract_index_page(body) == extract_index_page_reference(body)
+
+@pytest.mark.filterwarnings("ignore") # BeautifulSoup warns about some damaged pages
+def test_damaged_pages(pages, entries):
+    rng = random.Random(0)
+    index_pages = [body for url, body in pages if "elenca.php" in url]
+    for _ in range(N_DAMAGED):
+        lemma, body = rng.choice(entries)
+        body = damage(rng, body)
+        assert try_extract(extract_entry, body, lemma) == try_extract(extract_entry_reference, body, lemma), body
+        body = damage(rng, rng.choice(index_pages))
+        assert extract_index(extract_index_page, body) == extract_index(extract_index_page_reference, body), body
+
+
+def light_tree(node):
+    """The tree of parse_html as nested tuples: (name, attrs, children, text, string) for the elements, (kind, string) for the strings"""
+    if type(node) is Node:
+        attrs = {name: " ".join(value.split()) if name == "class" else value for name, value in node.attrs.items()}
+        return (node.name, attrs, [light_tree(child) for child in node.children], node.text, node.string)
+    kind = {str: "text", CData: "cdata", Markup: "markup"}.get(type(node))
+    return (kind if kind != None else type(node).__name__[:-len("String")].lower(), str(node))
+
+def soup_tree(element):
+    """The same tuples from a BeautifulSoup tree"""
+    from bs4.element import Tag, NavigableString, CData, Script, Stylesheet, TemplateString, RubyTextString, RubyParenthesisString
+    if isinstance(element, Tag):
+        attrs = {name: " ".join(value) if isinstance(value, list) else value for name, value in element.attrs.items()}
+        return (element.name, attrs, [soup_tree(child) for child in element.contents], element.text, element.string)
+    kinds = {NavigableString: "text", CData: "cdata", Script: "script", Stylesheet: "style", TemplateString: "template", RubyTextString: "rt", RubyParenthesisString: "rp"}
+    return (kinds.get(type(element), "markup"), str(element))
+
+@pytest.mark.filterwarnings("ignore")
+def test_same_tree_of_beautifulsoup():
+    rng = random.Random(1)
+    for _ in range(N_SNIPPETS):
+        html = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 25)))
+        assert light_tree(parse_html(html)) == soup_tree(bs4.BeautifulSoup(html, "html.parser")), html
@@ -0,0 +1,95 @@
+import os
+import functools
+import importlib.util
+import pytest
+import requests
+from onli_server import OnliServer
+
+# onli-scraper.py against the local stand-in server of onli_server.py: the retries of the failed requests stop at the limit,
+# a resumed run downloads only the lemmas missing from the checkpoint and a concurrent run with errors gives the CSV of a serial run.
+
+SCRAPER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "onli-scraper.py")
+RATE = 1000 # requests per second, the rate limit is not under test
+BACKOFF = 0.001 # seconds
+
+
+@pytest.fixture(scope="module")
+def scraper():
+    spec = importlib.util.spec_from_file_location("onli_scraper", SCRAPER_PATH) # the name of the script is not a module name
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def server():
+    server = OnliServer()
+    yield server
+    server.close()
+
+@pytest.fixture
+def fast_retries(scraper, monkeypatch):
+    monkeypatch.setattr(scraper, "OnliClient", functools.partial(scraper.OnliClient, backoff=BACKOFF))
+
+def entry_paths(server):
+    return sorted(path for path in server.pages if path.startswith("entrata.php"))
+
+def serial_csv(scraper, server, tmp_path):
+    """The CSV of a serial run without errors"""
+    out_path = str(tmp_path / "serial.csv")
+    n_lemmas, n_new, n_updated, failed = scraper.scrape(out_path, server.base_url, rate=RATE, concurrency=1, retries=0)
+    assert failed == []
+    with open(out_path, encoding="utf-8") as f:
+        return f.read()
+
+def test_retries_stop_at_the_limit(scraper, server):
+    client = scraper.OnliClient(server.base_url, rate=RATE, retries=3, backoff=BACKOFF)
+    recovering, failing = entry_paths(server)[:2]
+    server.fail(recovering, [429, 500, 503])
+    server.fail_always(failing, 502)
+    assert client.get(recovering) == server.pages[recovering]
+    assert server.requested(recovering) == 4
+    with pytest.raises(requests.HTTPError):
+        client.get(failing)
+    assert server.requested(failing) == 4 # the first request and 3 retries
+    server.fail(failing, [404])
+    with pytest.raises(requests.HTTPError): # not retried
+        client.get(failing)
+    assert server.requested(failing) == 5
+    client.close()
+
+def test_concurrent_run_with_errors(scraper, server, fast_retries, tmp_path):
+    expected = serial_csv(scraper, server, tmp_path)
+    for i, path in enumerate(entry_paths(server)):
+        server.fail(path, [[429, 500, 502, 503, 504][i % 5]] * (i % 3))
+    out_path = str(tmp_path / "ONLI-NEO.csv")
+    n_lemmas, n_new, n_updated, failed = scraper.scrape(out_path, server.base_url, rate=RATE, concurrency=4, retries=2)
+    assert failed == []
+    assert n_lemmas == n_new == len(entry_paths(server))
+    with open(out_path, encoding="utf-8") as f:
+        assert f.read() == expected
+    assert not os.path.exists(str(tmp_path / "ONLI-NEO.checkpoint.jsonl"))
+
+def test_resume_from_checkpoint(scraper, server, fast_retries, tmp_path):
+    expected = serial_csv(scraper, server, tmp_path)
+    paths = entry_paths(server)
+    failing = paths[::7]
+    for path in failing:
+        server.fail_always(path)
+    out_path = str(tmp_path / "ONLI-NEO.csv")
+    checkpoint_path = str(tmp_path / "ONLI-NEO.checkpoint.jsonl")
+    n_lemmas, n_new, n_updated, failed = scraper.scrape(out_path, server.base_url, rate=RATE, concurrency=4, retries=1)
+    assert len(failed) == len(failing)
+    assert os.path.exists(checkpoint_path)
+    with open(checkpoint_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == len(paths) - len(failing)
+
+    server.heal()
+    os.remove(out_path) # only the checkpoint is left, like after an interruption
+    n_requests = len(server.requested_paths())
+    n_lemmas, n_new, n_updated, failed = scraper.scrape(out_path, server.base_url, rate=RATE, concurrency=4, retries=1)
+    assert failed == []
+    resumed_entries = [path for path in server.requested_paths()[n_requests:] if path.startswith("entrata.php")]
+    assert sorted(resumed_entries) == sorted(failing) # the entries in the checkpoint are not downloaded again
+    with open(out_path, encoding="utf-8") as f:
+        assert f.read() == expected
+    assert not os.path.exists(checkpoint_path)
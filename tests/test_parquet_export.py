@@ -0,0 +1,26 @@
+import os
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+from parquet_export import ParquetWriter
+
+# The Parquet tables replace the previous output directory only when the export completes.
+
+def entry(glossa):
+    return {"meta": {"ipa": [], "sill": [], "etim": "", "sin": [], "ant": []}, "meanings": {"sost_1": {"morpho": "", "glossa": glossa}}}
+
+def test_failed_export_keeps_previous_output(tmp_path):
+    out_dir = str(tmp_path / "dictionary")
+    with ParquetWriter(out_dir, batch_size=1) as writer:
+        writer.write("casa", entry("edificio"))
+    with pytest.raises(RuntimeError):
+        with ParquetWriter(out_dir, batch_size=1) as writer:
+            writer.write("cane", entry("animale"))
+            writer.write("gatto", entry("animale"))
+            raise RuntimeError("interrupted")
+    assert sorted(os.listdir(tmp_path)) == ["dictionary"]
+    assert pq.read_table(os.path.join(out_dir, "lemmas.parquet")).column("lemma").to_pylist() == ["casa"]
+    with ParquetWriter(out_dir) as writer:
+        writer.write("cane", entry("animale"))
+    assert sorted(os.listdir(tmp_path)) == ["dictionary"]
+    assert pq.read_table(os.path.join(out_dir, "senses.parquet")).column("definition").to_pylist() == ["animale"]
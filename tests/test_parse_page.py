@@ -0,0 +1,50 @@
+import random
+from iterparse import WiktionaryPageParser, load_lang_dict, POS_CONVERTER_DICT, AMBITO_DICT
+from synthetic_dump import make_page
+from original_helpers import PageParser
+
+# parse_page against the frozen state machine of original_helpers.PageParser: the prefilters of the per-line checks (the section tags
+# found in one search, the "{{-" prefilter of the PoS tags, the "{{" one of morphology and Nodef) must not change any entry.
+# The pages are synthetic pages and copies of them with lines that carry more tags or the tags in unusual places.
+
+N_PAGES = 3000
+N_MIXED_PAGES = 3000
+LINES = ["{{-pron-}}", "{{-sill-}}", "{{-etim-}}", "{{-sin-}}", "{{-ant-}}", "{{-sin-}} {{-ant-}}", "{{-ant-}}{{-sin-}}", "{{-etim-}} {{-sill-}}",
+         "{{-pron-}}{{-etim-}}", "{{-sill-}} {{-pron-}}", "# {{-sin-}} testo", "testo {{-etim-}}", "{{ -sin- }}", "{{-sost-|it}}", "{{-agg-|it}}{{-sill-}}",
+         "{{-verb-|it}} {{-etim-}}", "{{-sill-|it}}", "{{-pron-|it}}", "{{-etim-|it}}", "{{-ant-|it}}", "{{-Varie lingue-|it}}", "{{-voce verb-|it}}",
+         "{{Pn|w}} ''f sing''", "{{pn}} ''m inv'' e ''f inv''", "# {{Pn}} ''m pl''", "#: ''{{Pn}} ''m sing''", "{{PN|w}}''inv''", "{{Pn}}", "''m sing''",
+         "# {{Nodef|it}}", "#{{Nodef|it}} {{-sin-}}", "{{Nodef|it}}", "# {{Noetim|it}}", "{{Noetim|it}}", "{{IPA|/ˈkasa/}}", "*{{IPA|/a/}}", "; ca | sa",
+         ";ca-sa", "; ca | sa | mol | to | lun | go", "=={{-it-}}==", "== {{-it-}} ==", "== { {-it-} } ==", "=={{-en-}}==", "== Italiano ==", "=",
+         "{{-der-}}", " {{-rel-}} ", "{{Trad1}}", "==Altri progetti==", "<!-- altri template utili: {{-sin-}}", "<ref>x</ref>", "[[File:x.jpg]]",
+         "{{Vedi|casa}}", "# glossa [[casa]]", "## ''esempio''", "#* {{-etim-}} ''esempio''", "* sinonimo, [[altro]]", ": ''x''", "", " ", "#", "*", ":"]
+
+
+def mixed_page(rng, text):
+    """A copy of a page with random LINES inserted"""
+    lines = text.split("\n")
+    for _ in range(rng.randint(1, 8)):
+        lines.insert(rng.randrange(len(lines) + 1), rng.choice(LINES))
+    return "\n".join(lines)
+
+def parse(parser, title, text):
+    """The entry of a page or the type of the exception (a second italian header can make both parsers fail)"""
+    try:
+        return parser.parse_page(title, text)
+    except Exception as e:
+        return type(e)
+
+def test_parse_page():
+    lang_dict = load_lang_dict()
+    parser = WiktionaryPageParser(lang_dict)
+    original_parser = PageParser(lang_dict, POS_CONVERTER_DICT, AMBITO_DICT)
+    rng = random.Random(0)
+    pages = [make_page(rng, i) for i in range(N_PAGES)]
+    italian_pages = [(title, text) for title, ns, text in pages if text != None and "{{-it-}}" in text]
+    rng = random.Random(1)
+    mixed_pages = [(title, mixed_page(rng, text)) for title, text in (rng.choice(italian_pages) for _ in range(N_MIXED_PAGES))]
+    n_entries = 0
+    for title, text in [(title, text) for title, ns, text in pages] + mixed_pages:
+        entry = parse(parser, title, text)
+        assert entry == parse(original_parser, title, text), (title, text)
+        n_entries += type(entry) is dict
+    assert n_entries > N_MIXED_PAGES
@@ -0,0 +1,34 @@
+import json
+import asyncio
+from iterparse import WiktionaryPageParser
+from parse_service import PageBatcher, ParseService
+
+# The validation of the /parse requests of parse_service.py, with the pages parsed in the event loop (no workers)
+
+JSON = {"content-type": "application/json"}
+PAGE = "== {{-it-}} ==\n{{-sost-|it}}\n{{Pn|w}} ''f sing''\n# [[edificio]] per abitare"
+
+
+async def responses(requests):
+    batcher = PageBatcher(WiktionaryPageParser(), workers=0, max_pending=4)
+    service = ParseService(batcher)
+    results = []
+    for body in requests:
+        status, response = await service.route("POST", "/parse", JSON, json.dumps(body).encode("utf-8"))
+        results.append((status, json.loads(response) if isinstance(response, str) else response, batcher.n_batches))
+    batcher.close()
+    return results
+
+def test_route():
+    (status, response, n_batches), *invalid, (full_status, _, _) = asyncio.run(responses([
+        [], {"title": 1, "text": "x"}, {"title": "casa", "text": None}, [{"title": "casa", "text": PAGE}, {"title": "casa", "text": ["x"]}],
+        {"title": "casa"}, [{"title": "casa", "text": PAGE}] * 5]))
+    assert (status, response, n_batches) == (200, [], 0) # answered without waking up the batcher
+    assert [status for status, _, _ in invalid] == [400, 400, 400, 400]
+    assert full_status == 413
+
+def test_parse():
+    [(status, response, n_batches)] = asyncio.run(responses([[{"title": "casa", "text": PAGE}, {"title": "Template:x", "text": "x"}]]))
+    assert status == 200 and n_batches == 1
+    assert response[0]["entry"]["meanings"]["sost_0"]["morpho"] == "f sing"
+    assert response[1] == {"title": "Template:x", "entry": None}
@@ -0,0 +1,11 @@
+from iterparse import WiktionaryPageParser, load_lang_dict, AMBITO_DICT
+import original_helpers
+
+# string_cleaner must give the same lines of the original string_cleaner
+
+
+def test_string_cleaner(line_corpus):
+    lang_dict = load_lang_dict()
+    parser = WiktionaryPageParser(lang_dict)
+    for line, lemma in line_corpus:
+        assert parser.string_cleaner(line, lemma) == original_helpers.string_cleaner(line, lemma, lang_dict, AMBITO_DICT), (line, lemma)
@@ -0,0 +1,38 @@
+import random
+import pytest
+from iterparse import remove_list_tokens, remove_punct_at_start, remove_punct_at_end, clean_indent_and_spaces, punctuation
+import original_helpers
+
+# The lstrip/rstrip trimming helpers against the original recursive ones: same results on random strings and no recursion limit.
+# Their speed is covered by benchmark.py (string_cleaner in the lines level, parse_page in the pages level).
+
+HELPERS = ["remove_list_tokens", "remove_punct_at_start", "remove_punct_at_end", "clean_indent_and_spaces"]
+ALPHABET = punctuation + "*#:\t\nabcàé1 "
+
+
+def random_strings(n, max_len=12, seed=0):
+    rng = random.Random(seed)
+    return [""] + ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, max_len))) for _ in range(n)]
+
+@pytest.mark.parametrize("name", HELPERS)
+def test_same_results_of_the_recursive_helpers(name):
+    helper = globals()[name]
+    original = getattr(original_helpers, name)
+    for string in random_strings(100000):
+        assert helper(string) == original(string), repr(string)
+
+def line_to_trim(name, n):
+    """A line with n characters to trim for the helper, and the expected result"""
+    return {
+        "remove_list_tokens": ("#" * n + " parola", " parola"),
+        "remove_punct_at_start": (". " * (n // 2) + "##sport## parola", "##sport## parola"),
+        "remove_punct_at_end": ("parola ##sport##" + " ." * (n // 2), "parola ##sport##"),
+        "clean_indent_and_spaces": ("#* " * (n // 3) + "parola ", "parola"),
+    }[name]
+
+@pytest.mark.parametrize("name", HELPERS)
+def test_long_prefixes(name):
+    line, expected = line_to_trim(name, 5000)
+    with pytest.raises(RecursionError): # the recursive helpers overflow the stack
+        getattr(original_helpers, name)(line)
+    assert globals()[name](line) == expected